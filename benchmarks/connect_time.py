@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Compare u2.connect time with and without the cached u2.jar verification
+
+Usage:
+    python benchmarks/connect_time.py -s <serial> -n 20
+"""
+
+import argparse
+import statistics
+import time
+
+import uiautomator2 as u2
+from uiautomator2.core import BasicUiautomatorServer, _bundled_jar_md5
+
+
+def measure(serial: str, n: int, cold: bool, skip: bool):
+    """ return list of seconds per connect """
+    BasicUiautomatorServer.skip_jar_verify = skip
+    u2.connect(serial) # make sure server is running
+    costs = []
+    for _ in range(n):
+        if cold:
+            # behaves like before: hash local jar and md5sum on device every time
+            BasicUiautomatorServer._jar_verified.clear()
+            _bundled_jar_md5.cache_clear()
+        start = time.perf_counter()
+        u2.connect(serial)
+        costs.append(time.perf_counter() - start)
+    return costs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-s", "--serial", help="device serial")
+    parser.add_argument("-n", "--number", type=int, default=20, help="connects per mode")
+    args = parser.parse_args()
+
+    print(f"{'mode':<10} {'mean(ms)':>9} {'p50(ms)':>8} {'max(ms)':>8}")
+    for name, cold, skip in (("verify", True, False), ("boot-id", False, False), ("skip", False, True)):
+        costs = [c * 1000 for c in measure(args.serial, args.number, cold, skip)]
+        print(f"{name:<10} {statistics.mean(costs):>9.2f} {statistics.median(costs):>8.2f} {max(costs):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Load test the client against the local EmulatorServer, no device needed
+
+Usage:
+    python benchmarks/emulator_load.py -t 8 -n 200 -m dumpWindowHierarchy --nodes 500
+    python benchmarks/emulator_load.py --latency usb
+"""
+
+import argparse
+import statistics
+import threading
+import time
+
+import uiautomator2 as u2
+from uiautomator2.emulator import LATENCY_PROFILES, EmulatorServer
+
+METHOD_PARAMS = {
+    "dumpWindowHierarchy": [False, 50],
+    "takeScreenshot": [1, 80],
+    "objInfo": [{"text": "item1", "mask": 1, "childOrSibling": [], "childOrSiblingSelector": []}],
+    "click": [100, 100],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-t", "--threads", type=int, default=4, help="concurrent callers")
+    parser.add_argument("-n", "--number", type=int, default=200, help="calls per thread")
+    parser.add_argument("-m", "--method", default="deviceInfo", help="jsonrpc method")
+    parser.add_argument("--nodes", type=int, default=100, help="nodes of synthetic hierarchy")
+    parser.add_argument("--latency", default="instant", choices=list(LATENCY_PROFILES), help="latency profile")
+    parser.add_argument("--coalesce", action="store_true", help="share identical concurrent calls, off to measure raw throughput")
+    args = parser.parse_args()
+
+    with EmulatorServer(nodes=args.nodes, latency=args.latency) as emu:
+        d = u2.connect(transport=emu.transport())
+        if not args.coalesce:
+            d.coalesce_methods = frozenset()
+        params = METHOD_PARAMS.get(args.method)
+        costs = []
+
+        def worker():
+            for _ in range(args.number):
+                start = time.perf_counter()
+                d.jsonrpc_call(args.method, params)
+                costs.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+    costs = sorted(c * 1000 for c in costs)
+    p95 = costs[int(len(costs) * 0.95) - 1]
+    print(f"{len(costs)} calls of {args.method} in {elapsed:.2f}s, {len(costs) / elapsed:.0f} calls/s")
+    print(f"latency(ms) mean={statistics.mean(costs):.2f} p50={statistics.median(costs):.2f} p95={p95:.2f} max={costs[-1]:.2f}")
+    phases = d.rpc_stats().snapshot()[args.method]["phases"]
+    print("phase mean(ms): " + " ".join(f"{k}={v['sum'] / max(v['count'], 1) * 1000:.3f}" for k, v in phases.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Compare decode time of jsonrpc replies for every installed json codec
+
+The payloads imitate dumpWindowHierarchy (xml string of many nodes) and
+takeScreenshot (base64 jpeg) replies, or pass real ones saved to files.
+
+Usage:
+    python benchmarks/json_codec.py
+    python benchmarks/json_codec.py --nodes 5000 --screenshot-kb 800
+"""
+
+import argparse
+import base64
+import json
+import os
+import timeit
+
+from uiautomator2 import _codec
+
+_NODE = ('<node index="{i}" text="item {i}" resource-id="com.example:id/title" class="android.widget.TextView" '
+         'package="com.example" content-desc="" checkable="false" checked="false" clickable="true" enabled="true" '
+         'focusable="true" focused="false" scrollable="false" long-clickable="false" password="false" selected="false" '
+         'visible-to-user="true" bounds="[0,{top}][1080,{bottom}]" drawing-order="1" hint="" display-id="0" />')
+
+
+def hierarchy_reply(nodes: int) -> bytes:
+    body = "\r\n".join(_NODE.format(i=i, top=i * 10, bottom=i * 10 + 10) for i in range(nodes))
+    xml = "<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>\r\n<hierarchy rotation=\"0\">\r\n" + body + "\r\n</hierarchy>"
+    return json.dumps({"jsonrpc": "2.0", "id": 1, "result": xml}).encode()
+
+
+def screenshot_reply(kb: int) -> bytes:
+    data = base64.b64encode(os.urandom(kb * 1024)).decode()
+    return json.dumps({"jsonrpc": "2.0", "id": 1, "result": data}).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=3000, help="nodes in hierarchy")
+    parser.add_argument("--screenshot-kb", type=int, default=500, help="jpeg size in KB")
+    parser.add_argument("--hierarchy-file", help="saved raw jsonrpc reply of dumpWindowHierarchy")
+    parser.add_argument("--screenshot-file", help="saved raw jsonrpc reply of takeScreenshot")
+    parser.add_argument("-n", "--number", type=int, default=50)
+    args = parser.parse_args()
+
+    payloads = {
+        "hierarchy": open(args.hierarchy_file, "rb").read() if args.hierarchy_file else hierarchy_reply(args.nodes),
+        "screenshot": open(args.screenshot_file, "rb").read() if args.screenshot_file else screenshot_reply(args.screenshot_kb),
+    }
+    codecs = _codec.available_codecs()
+    print(f"{'payload':<12} {'size':>9} " + " ".join(f"{c.name + '(ms)':>12}" for c in codecs))
+    for name, data in payloads.items():
+        buf = bytearray(data)
+        costs = [timeit.timeit(lambda: c.loads(buf), number=args.number) / args.number * 1000 for c in codecs]
+        print(f"{name:<12} {len(data) // 1024:>7}KB " + " ".join(f"{cost:>12.3f}" for cost in costs))
+    print("current codec:", _codec.current_codec().name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Measure per call overhead of the jsonrpc stub layer, d.jsonrpc.click(x, y)
+
+The server's jsonrpc_call returns at once, so only the cost of getting the
+stub, looking up the method and building params is left. The old
+JSONRpcWrapper, which defined a class on every d.jsonrpc access, is kept
+here for comparison.
+
+Usage:
+    PYTHONPATH=. python benchmarks/jsonrpc_stub.py
+    PYTHONPATH=. python benchmarks/jsonrpc_stub.py --number 500000
+"""
+
+import argparse
+import timeit
+from functools import cached_property
+
+from uiautomator2._proto import HTTP_TIMEOUT
+from uiautomator2.core import JSONRpcStub
+
+
+class _Server:
+    def jsonrpc_call(self, method, params=None, timeout=10):
+        return None
+
+
+class OldClient(_Server):
+    @property
+    def jsonrpc(self):
+        class JSONRpcWrapper():
+            def __init__(self, server):
+                self.server = server
+                self.method = None
+
+            def __getattr__(self, method):
+                self.method = method
+                return self
+
+            def __call__(self, *args, **kwargs):
+                http_timeout = kwargs.pop('http_timeout', HTTP_TIMEOUT)
+                params = args if args else kwargs
+                return self.server.jsonrpc_call(self.method, params, http_timeout)
+
+        return JSONRpcWrapper(self)
+
+
+class NewClient(_Server):
+    @cached_property
+    def jsonrpc(self):
+        return JSONRpcStub(self)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=200000, help="calls per measurement")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'stub':<16}{'ns/call':>10}")
+    results = {}
+    for name, client in (("JSONRpcWrapper", OldClient()), ("JSONRpcStub", NewClient())):
+        best = min(timeit.repeat(lambda: client.jsonrpc.click(100, 200), number=args.number, repeat=args.repeat))
+        results[name] = best / args.number * 1e9
+        print(f"{name:<16}{results[name]:>10.0f}")
+    print(f"speedup {results['JSONRpcWrapper'] / results['JSONRpcStub']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
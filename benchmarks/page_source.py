@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Measure PageSource construction, PageSource(xml).root, on large hierarchy dumps
+
+Real dumps can be saved with
+    python -c "import uiautomator2 as u2; open('dump.xml', 'w').write(u2.connect().dump_hierarchy())"
+without any file a synthetic list page of --nodes rows is used.
+The old construction, a unicode regex over the str and a safe_xmlstr per
+node after parsing, is kept here for comparison.
+
+Usage:
+    PYTHONPATH=. python benchmarks/page_source.py dump1.xml dump2.xml
+    PYTHONPATH=. python benchmarks/page_source.py --nodes 3000
+"""
+
+import argparse
+import re
+import timeit
+
+from lxml import etree
+
+from uiautomator2.emulator import synthetic_hierarchy
+from uiautomator2.xpath import PageSource, safe_xmlstr, str2bytes
+
+
+def old_root(xml_content: str) -> etree._Element:
+    xml_content = re.sub(r'[\u200B-\u200F\uFEFF]', '', xml_content)
+    root = etree.fromstring(str2bytes(xml_content))
+    for node in root.xpath("//node"):
+        node.tag = safe_xmlstr(node.attrib.pop("class", "")) or "node"
+    return root
+
+
+def new_root(xml_content: str) -> etree._Element:
+    return PageSource(xml_content).root
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="hierarchy dumps, default a synthetic one")
+    parser.add_argument("--nodes", type=int, default=3000, help="nodes of the synthetic dump")
+    parser.add_argument("--number", type=int, default=10, help="constructions per measurement")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    dumps = [(path, open(path, encoding="utf-8").read()) for path in args.files]
+    if not dumps:
+        # a few Left-to-Right Marks as in real dumps of RTL apps
+        xml = synthetic_hierarchy(args.nodes).replace('text="item1', 'text="\u200eitem1')
+        dumps = [(f"synthetic {args.nodes} nodes", xml)]
+
+    print(f"{'dump':<32}{'nodes':>7}{'KB':>7}{'old ms':>9}{'new ms':>9}{'speedup':>9}")
+    for name, xml in dumps:
+        old, new = old_root(xml), new_root(xml)
+        assert etree.tostring(old) == etree.tostring(new), f"{name}: trees differ"
+        times = {}
+        for label, build in (("old", old_root), ("new", new_root)):
+            best = min(timeit.repeat(lambda: build(xml), number=args.number, repeat=args.repeat))
+            times[label] = best / args.number * 1000
+        nodes = sum(1 for _ in new.iter()) - 1
+        size = len(str2bytes(xml)) / 1024
+        print(f"{name[-32:]:<32}{nodes:>7}{size:>7.0f}{times['old']:>9.2f}{times['new']:>9.2f}{times['old'] / times['new']:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
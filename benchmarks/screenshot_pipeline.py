@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""End-to-end screenshot latency and client CPU for every backend/scale/quality/format combination
+
+Runs against the local EmulatorServer by default, or a real device with --serial.
+CPU is the thread time of the caller: reply parsing, base64 and image decode.
+Pillow images are loaded, so both formats are measured fully decoded.
+
+The raw framebuffer backend (adb exec-out screencap) needs a real device, it
+is always full size and lossless, so it is measured once per format.
+
+Usage:
+    PYTHONPATH=. python benchmarks/screenshot_pipeline.py
+    PYTHONPATH=. python benchmarks/screenshot_pipeline.py --latency wifi -n 20
+    PYTHONPATH=. python benchmarks/screenshot_pipeline.py --serial Q5S5T19611004599 --scale 1 0.5 --quality 80 30
+    PYTHONPATH=. python benchmarks/screenshot_pipeline.py --serial Q5S5T19611004599 --backend jsonrpc raw --scale 1
+"""
+
+import argparse
+import importlib.util
+import itertools
+import time
+
+import uiautomator2 as u2
+from uiautomator2.emulator import LATENCY_PROFILES, EmulatorServer
+
+
+def measure(d, number: int, fmt: str, scale: float, quality: int):
+    d.screenshot(format=fmt, scale=scale, quality=quality) # warm up
+    wall = cpu = 0.0
+    for _ in range(number):
+        start, start_cpu = time.perf_counter(), time.thread_time()
+        image = d.screenshot(format=fmt, scale=scale, quality=quality)
+        if fmt == "pillow":
+            image.load()
+        wall += time.perf_counter() - start
+        cpu += time.thread_time() - start_cpu
+    return wall / number, cpu / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-s", "--serial", help="real device, default is the emulator")
+    parser.add_argument("-n", "--number", type=int, default=30, help="screenshots per combination")
+    parser.add_argument("--scale", type=float, nargs="+", default=[1, .5, .25])
+    parser.add_argument("--quality", type=int, nargs="+", default=[80, 50, 20])
+    parser.add_argument("--backend", nargs="+", default=["jsonrpc"], choices=["jsonrpc", "raw"])
+    parser.add_argument("--latency", default="usb", choices=list(LATENCY_PROFILES), help="latency profile of the emulator")
+    args = parser.parse_args()
+    if "raw" in args.backend and not args.serial:
+        parser.error("raw backend needs --serial")
+
+    formats = ["pillow"]
+    if importlib.util.find_spec("cv2") and importlib.util.find_spec("numpy"):
+        formats.append("opencv")
+    else:
+        print("cv2 or numpy missing, only pillow is measured")
+
+    emu = None
+    if args.serial:
+        d = u2.connect(args.serial)
+    else:
+        emu = EmulatorServer(latency=args.latency).start()
+        d = u2.connect(transport=emu.transport())
+    try:
+        print(f"{'backend':<9}{'format':<8}{'scale':>7}{'quality':>9}{'ms/shot':>10}{'cpu ms':>9}{'fps':>8}")
+        for backend in args.backend:
+            d.settings["screenshot_backend"] = backend
+            if backend == "raw":
+                combinations = [(fmt, 1, "-") for fmt in formats + (["raw"] if importlib.util.find_spec("numpy") else [])]
+            else:
+                combinations = itertools.product(formats, args.scale, args.quality)
+            for fmt, scale, quality in combinations:
+                wall, cpu = measure(d, args.number, fmt, scale, None if quality == "-" else quality)
+                print(f"{backend:<9}{fmt:<8}{scale:>7}{quality:>9}{wall * 1000:>10.1f}{cpu * 1000:>9.1f}{1 / wall:>8.1f}")
+    finally:
+        if emu:
+            emu.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Compare jsonrpc latency of every transport on a connected device
+
+Usage:
+    python benchmarks/transport_latency.py -s <serial> -n 200
+    python benchmarks/transport_latency.py --transports adb,forward
+"""
+
+import argparse
+import statistics
+import time
+
+import uiautomator2 as u2
+from uiautomator2.core import TRANSPORTS
+
+
+def measure(d: u2.Device, method: str, n: int):
+    """ return list of seconds per call """
+    getattr(d.jsonrpc, method)() # warm up connection
+    costs = []
+    for _ in range(n):
+        start = time.perf_counter()
+        getattr(d.jsonrpc, method)()
+        costs.append(time.perf_counter() - start)
+    return costs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-s", "--serial", help="device serial")
+    parser.add_argument("-n", "--number", type=int, default=100, help="calls per transport")
+    parser.add_argument("-m", "--method", default="getLastToast", help="jsonrpc method without arguments")
+    parser.add_argument("--transports", default=",".join(TRANSPORTS), help="comma separated transport names")
+    args = parser.parse_args()
+
+    print(f"{'transport':<10} {'mean(ms)':>9} {'p50(ms)':>8} {'p95(ms)':>8} {'max(ms)':>8}")
+    for name in args.transports.split(","):
+        try:
+            d = u2.connect(args.serial, transport=name)
+            costs = sorted(c * 1000 for c in measure(d, args.method, args.number))
+        except Exception as e:
+            print(f"{name:<10} error: {e}")
+            continue
+        p95 = costs[int(len(costs) * 0.95) - 1]
+        print(f"{name:<10} {statistics.mean(costs):>9.2f} {statistics.median(costs):>8.2f} {p95:>8.2f} {costs[-1]:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
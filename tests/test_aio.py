@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Tests for the asyncio client"""
+
+import asyncio
+import json
+from unittest.mock import Mock
+
+import pytest
+
+from uiautomator2 import aio
+from uiautomator2._recovery import RecoveryPolicy
+from uiautomator2.core import DEFAULT_SERVER_PORT, BasicUiautomatorServer
+from uiautomator2.exceptions import HTTPError, HTTPTimeoutError, UiObjectNotFoundError, XPathElementNotFoundError
+
+HIERARCHY = """<?xml version="1.0" encoding="UTF-8"?>
+<hierarchy rotation="0">
+  <node index="0" text="n1" resource-id="android:id/text1" class="TextView" content-desc="" bounds="[0,0][1080,100]" />
+</hierarchy>
+"""
+
+
+class FakeAdbServer:
+    """Speak just enough adb protocol: host:transport, then tcp:<port> as a
+    keep-alive jsonrpc server or shell:<cmd> as command output"""
+
+    def __init__(self):
+        self.calls = []
+        self.connections = 0
+        self.connected = True # UiAutomation of the fake server
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                length = int(await reader.readexactly(4), 16)
+                service = (await reader.readexactly(length)).decode()
+                writer.write(b"OKAY")
+                if not service.startswith("host:"):
+                    break
+            if service.startswith("shell:"):
+                writer.write(b"hello\nX4EXIT:3\n")
+            else:
+                await self._serve_http(reader, writer)
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    async def _serve_http(self, reader, writer):
+        while (await reader.readline()):
+            headers = {}
+            while (line := await reader.readline()) != b"\r\n":
+                key, _, value = line.decode().partition(":")
+                headers[key.lower()] = value.strip()
+            call = json.loads(await reader.readexactly(int(headers["content-length"])))
+            self.calls.append((call["method"], call["params"]))
+            if call["method"] == "slow":
+                await asyncio.sleep(.5)
+            if call["method"] == "drop":
+                # run it, but close the connection before the reply
+                return
+            if call["method"] == "swipe" and not self.connected:
+                error = {"code": -32001, "message": "java.lang.IllegalStateException: UiAutomation not connected"}
+                data = json.dumps({"jsonrpc": "2.0", "id": call["id"], "error": error}).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % len(data) + data)
+                await writer.drain()
+                continue
+            if call["method"] == "objInfo" and call["params"][0].get("text") == "missing":
+                error = {"code": -32002, "message": "androidx.test.uiautomator.UiObjectNotFoundException", "data": ""}
+                body = {"jsonrpc": "2.0", "id": call["id"], "error": error}
+            else:
+                result = {
+                    "dumpWindowHierarchy": HIERARCHY,
+                    "waitForExists": True,
+                    "objInfo": {"bounds": {"left": 0, "top": 0, "right": 100, "bottom": 50}},
+                }.get(call["method"], call["method"])
+                body = {"jsonrpc": "2.0", "id": call["id"], "result": result}
+            data = json.dumps(body).encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % len(data) + data)
+            await writer.drain()
+
+
+def run_with_device(coro_fn):
+    async def _main():
+        fake = FakeAdbServer()
+        server = await asyncio.start_server(fake.handle, "127.0.0.1", 0)
+        host, port = server.sockets[0].getsockname()[:2]
+        device = Mock()
+        device.adb_device.serial = "fake-serial"
+        device.adb_device._client.host = host
+        device.adb_device._client.port = port
+        device._device_server_port = DEFAULT_SERVER_PORT
+        device.transport = None
+        device.settings = {"wait_timeout": 1.0, "max_depth": 50}
+        device.recovery = RecoveryPolicy(backoff=0)
+        device.readonly_methods = BasicUiautomatorServer.readonly_methods
+        device._restart_uiautomator.side_effect = lambda: setattr(fake, "connected", True)
+        try:
+            return await coro_fn(aio.AsyncDevice(device), fake)
+        finally:
+            server.close()
+    return asyncio.run(_main())
+
+
+def test_jsonrpc_keep_alive():
+    async def _test(d: aio.AsyncDevice, fake: FakeAdbServer):
+        results = await asyncio.gather(*[d.jsonrpc.deviceInfo() for _ in range(20)])
+        assert results == ["deviceInfo"] * 20
+        await d.click(10, 20)
+        assert fake.calls[-1] == ("click", [10, 20])
+        assert fake.connections <= 20
+        assert len(d._pool) >= 1
+    run_with_device(_test)
+
+
+def test_timeout_no_restart():
+    async def _test(d: aio.AsyncDevice, fake: FakeAdbServer):
+        with pytest.raises(HTTPTimeoutError):
+            await d.jsonrpc_call("slow", [], timeout=.1)
+        d.sync._restart_uiautomator.assert_not_called()
+        assert fake.calls == [("slow", [])]
+    run_with_device(_test)
+
+
+def test_maybe_delivered_not_resent():
+    async def _test(d: aio.AsyncDevice, fake: FakeAdbServer):
+        results = await asyncio.gather(*[d.jsonrpc_call("drop", [i]) for i in range(10)], return_exceptions=True)
+        assert all(isinstance(r, HTTPError) for r in results)
+        assert len(fake.calls) == 10
+        d.sync._restart_uiautomator.assert_not_called()
+    run_with_device(_test)
+
+
+def test_one_restart_for_concurrent_failures():
+    async def _test(d: aio.AsyncDevice, fake: FakeAdbServer):
+        fake.connected = False
+        results = await asyncio.gather(*[d.jsonrpc_call("swipe", [i]) for i in range(10)])
+        assert results == ["swipe"] * 10
+        assert d.sync._restart_uiautomator.call_count == 1
+        assert d.sync.recovery.snapshot()["restarts"] == 1
+    run_with_device(_test)
+
+
+def test_shell():
+    async def _test(d: aio.AsyncDevice, fake: FakeAdbServer):
+        ret = await d.shell(["echo", "hello"])
+        assert ret.output == "hello\n"
+        assert ret.exit_code == 3
+    run_with_device(_test)
+
+
+def test_xpath_and_uiobject():
+    async def _test(d: aio.AsyncDevice, fake: FakeAdbServer):
+        await d.xpath("n1").click()
+        assert fake.calls[-1] == ("click", [540, 50])
+        with pytest.raises(XPathElementNotFoundError):
+            await d.xpath("not-exist").click(timeout=.1)
+
+        await d(text="n1").click()
+        assert fake.calls[-1] == ("click", [50, 25])
+        with pytest.raises(UiObjectNotFoundError):
+            await d(text="missing").click()
+    run_with_device(_test)
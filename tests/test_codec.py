@@ -0,0 +1,40 @@
+# coding: utf-8
+#
+
+import json
+
+import pytest
+
+from uiautomator2 import _codec
+from uiautomator2._selector import Selector
+
+
+@pytest.fixture(params=[c.name for c in _codec.available_codecs()])
+def codec(request) -> _codec.JSONCodec:
+    return _codec.get_codec(request.param)
+
+
+def test_roundtrip(codec: _codec.JSONCodec):
+    payload = {"jsonrpc": "2.0", "id": 1, "method": "click", "params": (1, 2.5, None, True)}
+    data = codec.dumps(payload)
+    assert isinstance(data, bytes)
+    assert json.loads(data) == {"jsonrpc": "2.0", "id": 1, "method": "click", "params": [1, 2.5, None, True]}
+    for buf in (data, bytearray(data), memoryview(data)):
+        assert codec.loads(buf)["params"] == [1, 2.5, None, True]
+
+
+def test_dumps_dict_subclass(codec: _codec.JSONCodec):
+    data = codec.dumps({"params": [Selector(text="hello")]})
+    assert json.loads(data)["params"][0]["text"] == "hello"
+
+
+def test_dumps_ascii_escaped(codec: _codec.JSONCodec):
+    data = codec.dumps({"params": ["你好"]})
+    assert data == json.dumps({"params": ["你好"]}).encode()
+
+
+def test_get_codec():
+    assert _codec.get_codec("json").name == "json"
+    assert _codec.get_codec().name == _codec.available_codecs()[0].name
+    with pytest.raises(ValueError):
+        _codec.get_codec("yaml")
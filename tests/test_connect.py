@@ -0,0 +1,36 @@
+# coding: utf-8
+#
+
+import time
+from unittest.mock import Mock, patch
+
+import uiautomator2 as u2
+from uiautomator2.exceptions import ConnectError
+
+
+def _fake_device(serial, port, transport):
+    if serial == "offline":
+        raise ConnectError("device offline not online")
+    time.sleep(.2)
+    d = Mock()
+    d.startup_timings = {"wait_device": 0.0, "setup_jar": 0.2}
+    return d
+
+
+def test_connect_many_concurrent():
+    serials = ["A", "B", "offline", "C", "D"]
+    with patch("uiautomator2.Device", side_effect=_fake_device):
+        start = time.perf_counter()
+        results = u2.connect_many(serials, max_workers=8)
+        elapsed = time.perf_counter() - start
+    assert list(results) == serials
+    assert elapsed < .6
+    assert isinstance(results["offline"].error, ConnectError)
+    assert results["offline"].device is None
+    assert results["A"].error is None
+    assert results["A"].timings["setup_jar"] == 0.2
+    assert results["A"].timings["total"] >= .2
+
+
+def test_connect_many_empty():
+    assert u2.connect_many([]) == {}
@@ -1,12 +1,33 @@
 # coding: utf-8
 #
 
+import collections
+import contextlib
 import hashlib
+import json
+import queue
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import Mock, mock_open, patch
 
 import pytest
 
-from uiautomator2.core import DEFAULT_SERVER_PORT, BasicUiautomatorServer
+import uiautomator2 as u2
+from uiautomator2 import _deadline
+from uiautomator2._metrics import RPCStats
+from uiautomator2._proto import HTTP_TIMEOUT
+from uiautomator2._recovery import FATAL, RESTART, TRANSIENT, RecoveryPolicy, classify_error, maybe_delivered
+from uiautomator2._scheduler import BACKGROUND, BULK, PriorityScheduler, current_priority, rpc_priority
+from uiautomator2.abstract import ShellResponse
+from uiautomator2.core import DEFAULT_SERVER_PORT, AdbForwardTransport, AdbStreamTransport, BasicUiautomatorServer, \
+    DirectTCPTransport, HTTPConnectionPool, JSONRpcStub, MockAdbProcess, RecordingTransport, ReplayTransport, \
+    ServerHealth, SingleFlight, _jsonrpc_call, create_transport
+from uiautomator2.exceptions import AccessibilityServiceAlreadyRegisteredError, CircuitOpenError, \
+    DeadlineExceededError, HTTPError, HTTPTimeoutError, LaunchUiAutomationError, RPCError, \
+    UiAutomationNotConnectedError, UiObjectNotFoundError
 
 
 @pytest.fixture
@@ -20,6 +41,888 @@ def mock_server():
         yield server, mock_dev
 
 
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, body: bytes):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith("/large"):
+            size = int(self.path.split("/")[-1])
+            if self.path.startswith("/large/chunked"):
+                self.send_response(200)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for offset in range(0, size, 10000):
+                    chunk = b"x" * min(10000, size - offset)
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.write(b"0\r\n\r\n")
+                return
+            self._reply(b"x" * size)
+            return
+        self._reply(b"pong")
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if isinstance(payload, dict):
+            self.server.received[payload["method"]] += 1
+            if payload["method"] in self.server.drop_methods:
+                # run it, but close the connection before the reply
+                self.close_connection = True
+                return
+        if isinstance(payload, list):
+            if self.server.failed_batches:
+                self.server.failed_batches -= 1
+                self.send_response(500)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if not self.server.batch_supported:
+                self._reply(json.dumps({"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "Invalid Request"}}).encode())
+                return
+            self.server.batch_count += 1
+            self._reply(json.dumps([self._handle_call(call) for call in reversed(payload)]).encode())
+            return
+        self._reply(json.dumps(self._handle_call(payload)).encode())
+
+    def _handle_call(self, call: dict) -> dict:
+        if call["method"] == "objInfo":
+            error = {"code": -32002, "message": "androidx.test.uiautomator.UiObjectNotFoundException: UiSelector", "data": ""}
+            return {"jsonrpc": "2.0", "id": call["id"], "error": error}
+        return {"jsonrpc": "2.0", "id": call["id"], "result": call["method"]}
+
+
+@pytest.fixture
+def local_server():
+    """Local keep-alive HTTP server and a fake adb device which tunnels to it"""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+    httpd.batch_supported = True
+    httpd.batch_count = 0
+    httpd.received = collections.Counter()
+    httpd.drop_methods = set()
+    httpd.failed_batches = 0
+    threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True).start()
+    dev = Mock()
+    dev.create_connection.side_effect = lambda network, port: socket.create_connection(httpd.server_address)
+    dev.httpd = httpd
+    yield dev
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestHTTPConnectionPool:
+    def test_reuse_connection(self, local_server):
+        pool = HTTPConnectionPool(AdbStreamTransport(local_server, DEFAULT_SERVER_PORT))
+        for _ in range(5):
+            assert _jsonrpc_call(local_server, DEFAULT_SERVER_PORT, "exist", [], 5, False, pool) == "exist"
+        assert local_server.create_connection.call_count == 1
+        assert len(pool) == 1
+
+    def test_no_pool_connection_per_request(self, local_server):
+        for _ in range(3):
+            assert _jsonrpc_call(local_server, DEFAULT_SERVER_PORT, "click", [], 5, False) == "click"
+        assert local_server.create_connection.call_count == 3
+
+    def test_stale_connection_reconnect(self, local_server):
+        pool = HTTPConnectionPool(AdbStreamTransport(local_server, DEFAULT_SERVER_PORT))
+        response = pool.request("GET", "/ping")
+        assert (response.status, response.content) == (200, b"pong")
+        # simulate the server closing the idle connection
+        pool._idle[0][1].sock.shutdown(socket.SHUT_RDWR)
+        response = pool.request("GET", "/ping")
+        assert (response.status, response.content) == (200, b"pong")
+        assert local_server.create_connection.call_count == 2
+
+    def test_delivered_then_dropped_not_resent(self, local_server):
+        pool = HTTPConnectionPool(AdbStreamTransport(local_server, DEFAULT_SERVER_PORT))
+        assert _jsonrpc_call(local_server, DEFAULT_SERVER_PORT, "exist", [], 5, False, pool) == "exist"
+        local_server.httpd.drop_methods = {"click"}
+        # the reused connection took the request, then server closed it without reply
+        with pytest.raises(ConnectionError):
+            _jsonrpc_call(local_server, DEFAULT_SERVER_PORT, "click", [10, 20], 5, False, pool)
+        assert local_server.httpd.received["click"] == 1
+        assert local_server.create_connection.call_count == 1
+
+    def test_idle_eviction(self, local_server):
+        pool = HTTPConnectionPool(AdbStreamTransport(local_server, DEFAULT_SERVER_PORT), idle_timeout=0)
+        pool.request("GET", "/ping")
+        pool.request("GET", "/ping")
+        assert local_server.create_connection.call_count == 2
+
+    def test_read_body_preallocated(self, local_server):
+        pool = HTTPConnectionPool(AdbStreamTransport(local_server, DEFAULT_SERVER_PORT))
+        response = pool.request("GET", "/large/300000")
+        assert response.nbytes == 300000
+        assert response.copies == 1
+        assert isinstance(response.content, bytearray)
+        response = pool.request("GET", "/large/chunked/300000")
+        assert response.content == b"x" * 300000
+        assert response.copies > 1
+        assert local_server.create_connection.call_count == 1
+
+    def test_stream(self, local_server):
+        pool = HTTPConnectionPool(AdbStreamTransport(local_server, DEFAULT_SERVER_PORT))
+        with pool.stream("GET", "/large/200000") as r:
+            total = sum(len(chunk) for chunk in r.iter_content(4096))
+        assert total == r.nbytes == 200000
+        assert len(pool) == 1
+        # a partially read stream is not returned to pool
+        with pool.stream("GET", "/large/200000") as r:
+            r.readinto(bytearray(10))
+        assert len(pool) == 0
+
+    def test_maxsize_and_threads(self, local_server):
+        pool = HTTPConnectionPool(AdbStreamTransport(local_server, DEFAULT_SERVER_PORT), maxsize=2)
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(10):
+                    assert pool.request("GET", "/ping").content == b"pong"
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert not errors
+        assert len(pool) <= 2
+        pool.clear()
+        assert len(pool) == 0
+
+
+@pytest.fixture
+def pooled_server(local_server):
+    """BasicUiautomatorServer talking to the local keep-alive server"""
+    with patch.object(BasicUiautomatorServer, '__init__', return_value=None):
+        server = BasicUiautomatorServer(None, DEFAULT_SERVER_PORT)
+    server._dev = local_server
+    server._device_server_port = DEFAULT_SERVER_PORT
+    server._debug = False
+    server._transport = AdbStreamTransport(local_server, DEFAULT_SERVER_PORT)
+    server._pool = HTTPConnectionPool(server._transport)
+    server._batch_supported = True
+    server._stats = RPCStats({"serial": "local"})
+    server._health = ServerHealth()
+    server._process = None
+    server._cold_start_time = None
+    server._recovery = RecoveryPolicy(backoff=0)
+    server._singleflight = SingleFlight()
+    server._scheduler = PriorityScheduler()
+    yield server
+
+
+class TestTransport:
+    def test_create_transport(self):
+        dev = Mock()
+        dev.serial = "10.0.0.1:5555"
+        assert isinstance(create_transport(dev, DEFAULT_SERVER_PORT), AdbStreamTransport)
+        assert isinstance(create_transport(dev, DEFAULT_SERVER_PORT, "forward"), AdbForwardTransport)
+        tcp = create_transport(dev, DEFAULT_SERVER_PORT, "tcp")
+        assert tcp.address() == ("10.0.0.1", DEFAULT_SERVER_PORT)
+        assert create_transport(dev, DEFAULT_SERVER_PORT, tcp) is tcp
+        with pytest.raises(ValueError):
+            create_transport(dev, DEFAULT_SERVER_PORT, "udp")
+
+    def test_direct_tcp(self, local_server):
+        host, port = local_server.httpd.server_address
+        pool = HTTPConnectionPool(DirectTCPTransport(host, port))
+        for _ in range(3):
+            assert pool.request("GET", "/ping").content == b"pong"
+        assert len(pool) == 1
+        assert local_server.create_connection.call_count == 0
+
+    def test_adb_forward(self, local_server):
+        local_server.forward_port.return_value = local_server.httpd.server_address[1]
+        pool = HTTPConnectionPool(AdbForwardTransport(local_server, DEFAULT_SERVER_PORT))
+        for _ in range(3):
+            assert pool.request("GET", "/ping").content == b"pong"
+        local_server.forward_port.assert_called_once_with(DEFAULT_SERVER_PORT)
+
+    def test_unreachable(self):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        pool = HTTPConnectionPool(DirectTCPTransport("127.0.0.1", port))
+        with pytest.raises(HTTPError):
+            pool.request("GET", "/ping")
+
+
+class TestJSONRpcBatch:
+    def test_batch_one_round_trip(self, pooled_server):
+        with pooled_server.jsonrpc_batch() as batch:
+            f1 = batch.exist({"text": "a"})
+            f2 = batch.objInfo({"text": "b"})
+            f3 = batch.call("click", 1, 2)
+        assert f1.result() == "exist"
+        assert f3.result() == "click"
+        with pytest.raises(UiObjectNotFoundError):
+            f2.result()
+        assert pooled_server._dev.httpd.batch_count == 1
+
+    def test_batch_fallback_sequential(self, pooled_server):
+        pooled_server._dev.httpd.batch_supported = False
+        batch = pooled_server.jsonrpc_batch()
+        f1 = batch.exist({"text": "a"})
+        f2 = batch.objInfo({"text": "b"})
+        results = batch.flush()
+        assert results[0] == "exist"
+        assert isinstance(results[1], UiObjectNotFoundError)
+        assert f1.result() == "exist"
+        assert pooled_server._batch_supported is False
+        assert pooled_server._dev.create_connection.call_count == 1
+
+    def test_batch_transport_error(self, pooled_server):
+        httpd = pooled_server._dev.httpd
+        httpd.failed_batches = 2
+        # read-only calls are sent again one by one
+        with pooled_server.jsonrpc_batch() as batch:
+            f1 = batch.exist({"text": "a"})
+            f2 = batch.count({"text": "a"})
+        assert (f1.result(), f2.result()) == ("exist", "count")
+        # others may have run, they are not sent again
+        with pooled_server.jsonrpc_batch() as batch:
+            f3 = batch.click(1, 2)
+        with pytest.raises(HTTPError):
+            f3.result()
+        assert httpd.received["click"] == 0
+        # batching is kept on
+        assert pooled_server._batch_supported is True
+        with pooled_server.jsonrpc_batch() as batch:
+            batch.click(1, 2)
+        assert httpd.batch_count == 1
+
+    def test_batch_aborted(self, pooled_server):
+        with pytest.raises(ValueError):
+            with pooled_server.jsonrpc_batch() as batch:
+                fut = batch.exist({"text": "a"})
+                raise ValueError("abort")
+        with pytest.raises(RPCError):
+            fut.result()
+        assert pooled_server._dev.create_connection.call_count == 0
+
+
+class TestJSONRpcStub:
+    def test_cached_callable(self, pooled_server):
+        stub = JSONRpcStub(pooled_server)
+        click = stub.click
+        assert stub.click is click
+        assert click.method == "click"
+        assert click(1, 2) == "click"
+        with pytest.raises(AttributeError):
+            click.method = "exist"
+        with pytest.raises(AttributeError):
+            stub.__len__
+
+    def test_threads_share_stub(self, pooled_server):
+        stub = JSONRpcStub(pooled_server)
+        methods = ["click", "exist", "swipe", "pressKey"] * 10
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(lambda m: getattr(stub, m)(), methods))
+        assert results == methods
+
+    def test_options(self, pooled_server):
+        stub = JSONRpcStub(pooled_server)
+        with patch.object(pooled_server, "jsonrpc_call", return_value=True) as call:
+            stub.click(1, 2)
+            call.assert_called_with("click", (1, 2), HTTP_TIMEOUT)
+            stub.click(1, 2, http_timeout=3)
+            call.assert_called_with("click", (1, 2), 3)
+            stub.options(timeout=5).objInfo(text="a")
+            call.assert_called_with("objInfo", {"text": "a"}, 5)
+
+            priorities = []
+            call.side_effect = lambda *args: priorities.append(current_priority())
+            stub.options(priority=BACKGROUND).dumpWindowHierarchy(False)
+            stub.dumpWindowHierarchy(False)
+            assert priorities == [BACKGROUND, "interactive"]
+        with pytest.raises(ValueError):
+            stub.options(priority="urgent")
+
+    def test_batch_option(self, pooled_server):
+        stub = JSONRpcStub(pooled_server)
+        with pooled_server.jsonrpc_batch() as batch:
+            f1 = stub.options(batch=batch).exist({"text": "a"})
+            f2 = stub.options(batch=batch).click(1, 2)
+        assert (f1.result(), f2.result()) == ("exist", "click")
+        assert pooled_server._dev.httpd.batch_count == 1
+
+
+class TestRPCStats:
+    def test_phases_and_bytes(self, pooled_server):
+        for _ in range(3):
+            pooled_server.jsonrpc_call("exist", [{"text": "a"}])
+        with pytest.raises(UiObjectNotFoundError):
+            pooled_server.jsonrpc_call("objInfo", [{"text": "b"}])
+        snapshot = pooled_server.rpc_stats().snapshot()
+        exist = snapshot["exist"]
+        assert (exist["calls"], exist["errors"]) == (3, 0)
+        assert exist["bytes_out"] > 0 and exist["bytes_in"] > 0
+        assert exist["latency"]["count"] == 3
+        # only the first call opens a connection, the others reuse it
+        assert exist["phases"]["connect"]["count"] == 1
+        assert exist["phases"]["wait"]["count"] == exist["phases"]["read"]["count"] == 3
+        assert sum(exist["latency"]["buckets"]) == 3
+        assert (snapshot["objInfo"]["calls"], snapshot["objInfo"]["errors"]) == (1, 1)
+
+    def test_batch_and_reset(self, pooled_server):
+        with pooled_server.jsonrpc_batch() as batch:
+            batch.exist({"text": "a"})
+            batch.click(1, 2)
+        stats = pooled_server.rpc_stats()
+        assert stats.snapshot()["batch"]["calls"] == 1
+        stats.reset()
+        assert stats.snapshot() == {}
+
+    def test_prometheus(self, pooled_server):
+        pooled_server.jsonrpc_call("click", [1, 2])
+        text = pooled_server.rpc_stats().to_prometheus()
+        assert 'uiautomator2_rpc_calls_total{serial="local",method="click"} 1' in text
+        assert 'uiautomator2_rpc_duration_seconds_bucket{serial="local",method="click",phase="total",le="+Inf"} 1' in text
+        assert 'uiautomator2_rpc_duration_seconds_count{serial="local",method="click",phase="wait"} 1' in text
+
+
+class TestServerHealth:
+    def test_rpc_is_proof_of_life(self, pooled_server):
+        with patch.object(pooled_server, "_check_alive", wraps=pooled_server._check_alive) as check_alive:
+            assert pooled_server._is_alive()
+            assert check_alive.call_count == 1
+            pooled_server.jsonrpc_call("exist", [])
+            with pytest.raises(UiObjectNotFoundError):
+                pooled_server.jsonrpc_call("objInfo", [])
+            assert pooled_server._is_alive()
+            assert check_alive.call_count == 1
+        assert pooled_server.health.is_fresh()
+
+    def test_unknown_state_pings(self, pooled_server):
+        with patch.object(pooled_server, "_check_alive", return_value=False) as check_alive:
+            pooled_server.health.mark_ok()
+            pooled_server.health.mark_failed(HTTPError("broken"))
+            assert not pooled_server._is_alive()
+            pooled_server.health.mark_ok()
+            # launched process has quit, cached state is not trusted
+            pooled_server._process = Mock()
+            pooled_server._process.pool.return_value = 0
+            assert not pooled_server._is_alive()
+            assert check_alive.call_count == 2
+
+    def test_start_after_process_quit(self, pooled_server):
+        pooled_server._lock = threading.Lock()
+        pooled_server._startup_timings = {}
+        pooled_server.health.mark_ok()
+        pooled_server._process = Mock()
+        pooled_server._process.pool.return_value = 0
+        with patch.object(pooled_server, "_setup_jar"), \
+                patch.object(pooled_server, "_check_alive", return_value=False) as check_alive, \
+                patch("uiautomator2.core.launch_uiautomator") as launch, \
+                patch.object(pooled_server, "_wait_ready"):
+            pooled_server.start_uiautomator()
+        check_alive.assert_called_once()
+        launch.assert_called_once()
+
+    def test_expired(self):
+        health = ServerHealth(ttl=0)
+        health.mark_ok()
+        assert not health.is_fresh()
+        health = ServerHealth()
+        health.mark_ok()
+        health.reset()
+        assert not health.is_fresh()
+
+
+class TestSetupJar:
+    @pytest.fixture
+    def jar_server(self, mock_server, monkeypatch):
+        server, mock_dev = mock_server
+        mock_dev.serial = "serial-1"
+        boot = {"id": "boot-1"}
+
+        def shell(cmdargs, timeout=None):
+            if isinstance(cmdargs, str):
+                return boot["id"] + "\nabc  /data/local/tmp/u2.jar"
+            if cmdargs[0] == "cat":
+                return boot["id"] + "\n"
+            return "abc  /data/local/tmp/u2.jar"
+        mock_dev.shell.side_effect = shell
+        monkeypatch.setattr(BasicUiautomatorServer, "_jar_verified", {})
+        monkeypatch.setattr("uiautomator2.core._bundled_jar_md5", lambda: "abc")
+        monkeypatch.setattr("uiautomator2.core.with_package_resource", lambda name: contextlib.nullcontext("u2.jar"))
+        return server, mock_dev, boot
+
+    def _md5sum_calls(self, mock_dev) -> int:
+        return sum(1 for c in mock_dev.shell.call_args_list if "md5sum" in c[0][0])
+
+    def test_first_verify_one_shell(self, jar_server):
+        server, mock_dev, _ = jar_server
+        server._setup_jar()
+        # boot_id comes with the md5sum
+        assert mock_dev.shell.call_count == 1
+        assert BasicUiautomatorServer._jar_verified["serial-1"][0] == "boot-1"
+        mock_dev.sync.push.assert_not_called()
+
+    def test_first_verify_without_toybox(self, jar_server):
+        server, mock_dev, _ = jar_server
+        mock_dev.shell.side_effect = lambda cmdargs, timeout=None: {
+            str: "boot-1\n/system/bin/sh: toybox: not found",
+            list: "abc  /data/local/tmp/u2.jar"}[type(cmdargs)]
+        server._setup_jar()
+        assert mock_dev.shell.call_args[0][0] == ["md5", "/data/local/tmp/u2.jar"]
+        mock_dev.sync.push.assert_not_called()
+
+    def test_verified_cache(self, jar_server):
+        server, mock_dev, boot = jar_server
+        server._setup_jar()
+        server._setup_jar()
+        assert self._md5sum_calls(mock_dev) == 1
+        mock_dev.sync.push.assert_not_called()
+        # device rebooted
+        boot["id"] = "boot-2"
+        server._setup_jar()
+        assert self._md5sum_calls(mock_dev) == 2
+
+    def test_ttl_expired(self, jar_server, monkeypatch):
+        server, mock_dev, _ = jar_server
+        server._setup_jar()
+        monkeypatch.setattr("uiautomator2.core.JAR_VERIFY_TTL", -1)
+        server._setup_jar()
+        assert self._md5sum_calls(mock_dev) == 2
+
+    def test_skip_verify(self, jar_server, monkeypatch):
+        server, mock_dev, _ = jar_server
+        monkeypatch.setattr(BasicUiautomatorServer, "skip_jar_verify", True)
+        with patch.object(server, "_is_alive", return_value=True):
+            # never verified in this process, so verify first
+            server._setup_jar()
+            calls = mock_dev.shell.call_count
+            server._setup_jar()
+        assert mock_dev.shell.call_count == calls
+
+
+class _FakeShellConnection:
+    """ adb shell stream whose output is fed by test, b"" means exit """
+    def __init__(self):
+        self.chunks = queue.Queue()
+        self.conn = self
+
+    def recv(self, n: int) -> bytes:
+        return self.chunks.get()
+
+    def close(self):
+        self.chunks.put(b"")
+
+
+class TestWaitReady:
+    def _launch(self, server, chunks, ready_after: float = 0):
+        conn = _FakeShellConnection()
+        server._process = MockAdbProcess(conn)
+        start = time.monotonic()
+
+        def feed():
+            for delay, chunk in chunks:
+                time.sleep(delay)
+                conn.chunks.put(chunk)
+        threading.Thread(target=feed, daemon=True).start()
+        return patch.object(server, "_check_alive", side_effect=lambda: time.monotonic() - start > ready_after)
+
+    def test_ready_after_starting_marker(self, pooled_server):
+        chunks = [(.05, "[server] INFO: [UiAutomator2Server] Start".encode()), (.25, "ing Server\n".encode())]
+        with self._launch(pooled_server, chunks, ready_after=.3):
+            start = time.monotonic()
+            pooled_server._wait_app_process_ready(5)
+        assert time.monotonic() - start < .6
+        assert .3 <= pooled_server.cold_start_time < .6
+
+    def test_marker_at_end_found_once(self, pooled_server):
+        chunks = [(.02, "[server] INFO: [UiAutomator2Server] Starting Server".encode())]
+        with self._launch(pooled_server, chunks, ready_after=10) as check_alive:
+            with pytest.raises(LaunchUiAutomationError):
+                pooled_server._wait_app_process_ready(1)
+        # backoff grows after the marker instead of staying at the fastest interval
+        assert check_alive.call_count < 15
+
+    def test_already_registered(self, pooled_server):
+        chunks = [(.05, "IllegalStateException: UiAutomationService already".encode()), (.01, " registered!\n".encode())]
+        with self._launch(pooled_server, chunks, ready_after=10):
+            with pytest.raises(AccessibilityServiceAlreadyRegisteredError):
+                pooled_server._wait_app_process_ready(5)
+
+    def test_process_quit(self, pooled_server):
+        with self._launch(pooled_server, [(.05, b"Error\n"), (0, b"")], ready_after=10):
+            start = time.monotonic()
+            with pytest.raises(LaunchUiAutomationError) as e:
+                pooled_server._wait_app_process_ready(5)
+        assert time.monotonic() - start < 1
+        assert "Error" in e.value.args[1]
+
+    def test_text_decoded_once(self):
+        conn = _FakeShellConnection()
+        process = MockAdbProcess(conn)
+        for chunk in ["你好".encode()[:2], "你好".encode()[2:], b"!", b""]:
+            conn.chunks.put(chunk)
+        process.wait()
+        assert process.text == "你好!"
+
+
+class TestRecovery:
+    def test_classify_error(self):
+        refused = HTTPError("Unable to connect")
+        refused.__cause__ = ConnectionRefusedError()
+        assert classify_error(refused) == RESTART
+        assert classify_error(UiAutomationNotConnectedError()) == RESTART
+        assert classify_error(HTTPError("HTTP request failed: 500")) == TRANSIENT
+        assert classify_error(ConnectionResetError()) == TRANSIENT
+        assert classify_error(TimeoutError()) == FATAL
+        assert classify_error(UiObjectNotFoundError()) == FATAL
+        assert not maybe_delivered(refused)
+        assert maybe_delivered(HTTPError("HTTP request failed: 500"))
+        assert maybe_delivered(ConnectionResetError())
+
+    def test_transient_retry_without_restart(self, pooled_server):
+        with patch.object(pooled_server, "_jsonrpc_call", side_effect=[ConnectionResetError(), HTTPError("500"), "ok"]), \
+                patch.object(pooled_server, "_restart_uiautomator") as restart:
+            assert pooled_server.jsonrpc_call("exist") == "ok"
+        restart.assert_not_called()
+        assert pooled_server.recovery.snapshot()["retries"] == 2
+
+    def test_maybe_delivered_not_resent(self, pooled_server):
+        httpd = pooled_server._dev.httpd
+        httpd.drop_methods = {"click", "exist"}
+        with patch.object(pooled_server, "_restart_uiautomator") as restart:
+            with pytest.raises(ConnectionError):
+                pooled_server.jsonrpc_call("click", [10, 20])
+            assert httpd.received["click"] == 1
+            restart.assert_not_called()
+            # read-only methods are retried, then server is restarted once
+            with pytest.raises(ConnectionError):
+                pooled_server.jsonrpc_call("exist")
+            assert httpd.received["exist"] == 4
+            restart.assert_called_once()
+
+    def test_not_delivered_resent(self, pooled_server):
+        unreachable = HTTPError("Unable to connect")
+        unreachable.__cause__ = OSError("Network is unreachable")
+        with patch.object(pooled_server, "_jsonrpc_call", side_effect=[unreachable, "ok"]):
+            assert pooled_server.jsonrpc_call("click", [10, 20]) == "ok"
+
+    def test_retries_exhausted_then_restart(self, pooled_server):
+        errors = [HTTPError("500")] * 3
+        with patch.object(pooled_server, "_jsonrpc_call", side_effect=errors + [HTTPError("500")]), \
+                patch.object(pooled_server, "_restart_uiautomator") as restart:
+            with pytest.raises(HTTPError):
+                pooled_server.jsonrpc_call("exist")
+        restart.assert_called_once()
+        snapshot = pooled_server.recovery.snapshot()
+        assert (snapshot["restarts"], snapshot["restart_failures"]) == (1, 0)
+
+    def test_fatal_raised(self, pooled_server):
+        with patch.object(pooled_server, "_restart_uiautomator") as restart:
+            with pytest.raises(UiObjectNotFoundError):
+                pooled_server.jsonrpc_call("objInfo", [])
+        restart.assert_not_called()
+
+    def test_one_restart_for_concurrent_failures(self, pooled_server):
+        barrier = threading.Barrier(5)
+        generation = pooled_server.recovery.generation
+
+        def call(method, params, timeout):
+            if pooled_server.recovery.generation == generation:
+                barrier.wait(timeout=5)
+                raise UiAutomationNotConnectedError()
+            return "ok"
+
+        results = []
+        with patch.object(pooled_server, "_jsonrpc_call", side_effect=call), \
+                patch.object(pooled_server, "_restart_uiautomator") as restart:
+            threads = [threading.Thread(target=lambda: results.append(pooled_server.jsonrpc_call("click"))) for _ in range(5)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        assert results == ["ok"] * 5
+        restart.assert_called_once()
+
+    def test_circuit_breaker(self, pooled_server):
+        pooled_server._recovery = RecoveryPolicy(backoff=0, breaker_threshold=2, max_restarts=10)
+        with patch.object(pooled_server, "_jsonrpc_call", side_effect=UiAutomationNotConnectedError()), \
+                patch.object(pooled_server, "_restart_uiautomator", side_effect=LaunchUiAutomationError("not ready")) as restart:
+            for _ in range(2):
+                with pytest.raises(LaunchUiAutomationError):
+                    pooled_server.jsonrpc_call("exist")
+            with pytest.raises(CircuitOpenError):
+                pooled_server.jsonrpc_call("exist")
+        assert restart.call_count == 2
+        snapshot = pooled_server.recovery.snapshot()
+        assert snapshot["circuit_open"] and snapshot["circuit_opens"] == 1 and snapshot["rejected"] == 1
+
+    def test_restart_rate_limit(self, pooled_server):
+        pooled_server._recovery = RecoveryPolicy(backoff=0, max_restarts=2)
+        with patch.object(pooled_server, "_jsonrpc_call", side_effect=UiAutomationNotConnectedError()), \
+                patch.object(pooled_server, "_restart_uiautomator") as restart:
+            for _ in range(2):
+                with pytest.raises(UiAutomationNotConnectedError):
+                    pooled_server.jsonrpc_call("exist")
+            with pytest.raises(CircuitOpenError):
+                pooled_server.jsonrpc_call("exist")
+        assert restart.call_count == 2
+
+
+class TestDeadline:
+    def test_nested_never_extends(self):
+        assert _deadline.remaining() is None
+        assert _deadline.bound(300) == 300
+        with _deadline.deadline(1):
+            with _deadline.deadline(60):
+                assert _deadline.remaining() <= 1
+            assert _deadline.bound(300) <= 1
+            assert _deadline.bound(300, reserve=2) == 0
+        assert _deadline.current_deadline() is None
+
+    def test_rpc_timeout_bounded(self, pooled_server):
+        with patch.object(pooled_server, "_jsonrpc_call", return_value="ok") as call:
+            with _deadline.deadline(2):
+                pooled_server.jsonrpc_call("click", [], 300)
+            assert call.call_args[0][2] <= 2
+            with _deadline.deadline(0):
+                with pytest.raises(DeadlineExceededError):
+                    pooled_server.jsonrpc_call("click", [], 300)
+
+    def test_no_restart_after_deadline(self, pooled_server):
+        def call(method, params, timeout):
+            time.sleep(.1)
+            raise HTTPTimeoutError("read timeout")
+
+        with patch.object(pooled_server, "_jsonrpc_call", side_effect=call), \
+                patch.object(pooled_server, "_restart_uiautomator") as restart:
+            with _deadline.deadline(.05):
+                with pytest.raises(DeadlineExceededError):
+                    pooled_server.jsonrpc_call("click")
+        restart.assert_not_called()
+
+    def test_retry_sleep_bounded(self, pooled_server):
+        pooled_server._recovery = RecoveryPolicy(backoff=5, max_backoff=5)
+        start = time.monotonic()
+        with patch.object(pooled_server, "_jsonrpc_call", side_effect=HTTPError("500")):
+            with _deadline.deadline(.2):
+                with pytest.raises(DeadlineExceededError):
+                    pooled_server.jsonrpc_call("exist")
+        assert time.monotonic() - start < 1
+
+
+class TestSingleFlight:
+    def _run_concurrently(self, pooled_server, method, params, n=5):
+        calls = []
+
+        def slow_call(method, params, timeout):
+            calls.append(method)
+            time.sleep(.2)
+            if method == "objInfo":
+                raise UiObjectNotFoundError()
+            return {"method": method}
+
+        results, errors = [], []
+
+        def worker():
+            try:
+                results.append(pooled_server.jsonrpc_call(method, params))
+            except Exception as e:
+                errors.append(e)
+
+        with patch.object(pooled_server, "_jsonrpc_call_recover", side_effect=slow_call):
+            threads = [threading.Thread(target=worker) for _ in range(n)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        return calls, results, errors
+
+    def test_coalesce_read_only(self, pooled_server):
+        calls, results, errors = self._run_concurrently(pooled_server, "deviceInfo", {"a": 1, "b": 2})
+        assert calls == ["deviceInfo"]
+        assert results == [{"method": "deviceInfo"}] * 5 and not errors
+        # every caller gets its own copy
+        assert len(set(map(id, results))) == 5
+        assert pooled_server.rpc_stats().snapshot()["deviceInfo"]["coalesced"] == 4
+
+    def test_errors_shared(self, pooled_server):
+        calls, results, errors = self._run_concurrently(pooled_server, "objInfo", [{"text": "a"}])
+        assert len(calls) == 1
+        assert len(errors) == 5 and all(isinstance(e, UiObjectNotFoundError) for e in errors)
+
+    def test_deadline_not_shared(self, pooled_server):
+        def slow_call(method, params, timeout):
+            if _deadline.current_deadline() is not None:
+                time.sleep(_deadline.remaining())
+                raise DeadlineExceededError("jsonrpc dumpWindowHierarchy exceeded deadline")
+            time.sleep(.3)
+            return "<hierarchy/>"
+
+        errors = []
+
+        def with_deadline():
+            with _deadline.deadline(.2):
+                try:
+                    pooled_server.jsonrpc_call("dumpWindowHierarchy", [False, 50])
+                except DeadlineExceededError as e:
+                    errors.append(e)
+
+        with patch.object(pooled_server, "_jsonrpc_call_recover", side_effect=slow_call) as call:
+            t = threading.Thread(target=with_deadline)
+            t.start()
+            time.sleep(.05)
+            assert pooled_server.jsonrpc_call("dumpWindowHierarchy", [False, 50]) == "<hierarchy/>"
+            t.join()
+        assert len(errors) == 1
+        assert call.call_count == 2
+
+    def test_not_coalesced(self, pooled_server):
+        calls, _, _ = self._run_concurrently(pooled_server, "click", [1, 2])
+        assert len(calls) == 5
+        pooled_server.coalesce_methods = frozenset()
+        calls, _, _ = self._run_concurrently(pooled_server, "deviceInfo", None)
+        assert len(calls) == 5
+
+
+class TestPriorityScheduler:
+    def _hold(self, scheduler, priority, seconds, log, name):
+        def run():
+            with rpc_priority(priority):
+                with scheduler.slot():
+                    log.append((name, "start", time.monotonic()))
+                    time.sleep(seconds)
+                    log.append((name, "end", time.monotonic()))
+        t = threading.Thread(target=run)
+        t.start()
+        return t
+
+    def test_interactive_not_delayed(self):
+        scheduler = PriorityScheduler()
+        log = []
+        t = self._hold(scheduler, BACKGROUND, .3, log, "dump")
+        time.sleep(.05)
+        start = time.monotonic()
+        with scheduler.slot():
+            assert time.monotonic() - start < .05
+        t.join()
+        assert scheduler.snapshot()["interactive"]["deferred"] == 0
+
+    def test_background_yields_to_interactive(self):
+        scheduler = PriorityScheduler()
+        log = []
+        threads = [self._hold(scheduler, "interactive", .2, log, "click")]
+        time.sleep(.05)
+        threads.append(self._hold(scheduler, BULK, 0, log, "bulk"))
+        time.sleep(.02)
+        threads.append(self._hold(scheduler, BACKGROUND, 0, log, "watcher"))
+        for t in threads:
+            t.join()
+        assert [name for name, event, _ in log if event == "start"] == ["click", "watcher", "bulk"]
+        snapshot = scheduler.snapshot()
+        assert snapshot["background"]["deferred"] == 1
+        assert snapshot["bulk"]["running"] == 0
+
+    def test_limit_and_max_defer(self):
+        scheduler = PriorityScheduler(max_defer=.1)
+        log = []
+        threads = [self._hold(scheduler, "interactive", .5, log, "click")]
+        time.sleep(.02)
+        threads += [self._hold(scheduler, BACKGROUND, .1, log, f"bg{i}") for i in range(2)]
+        for t in threads:
+            t.join()
+        starts = {name: ts for name, event, ts in log if event == "start"}
+        ends = {name: ts for name, event, ts in log if event == "end"}
+        # not starved by the long interactive call
+        assert starts["bg0"] < ends["click"]
+        # one background call at a time
+        assert starts["bg1"] >= ends["bg0"]
+
+    def test_interactive_not_coalesced_into_background(self, pooled_server):
+        pooled_server._scheduler = PriorityScheduler(max_defer=1)
+        log = []
+        click = self._hold(pooled_server.scheduler, "interactive", .5, log, "click")
+        time.sleep(.05)
+
+        def watcher():
+            with rpc_priority(BACKGROUND):
+                pooled_server.jsonrpc_call("dumpWindowHierarchy", [False, 50])
+        t = threading.Thread(target=watcher)
+        t.start()
+        time.sleep(.05)
+        start = time.monotonic()
+        assert pooled_server.jsonrpc_call("dumpWindowHierarchy", [False, 50]) == "dumpWindowHierarchy"
+        assert time.monotonic() - start < .3
+        click.join()
+        t.join()
+
+    def test_nested_and_invalid(self):
+        scheduler = PriorityScheduler(limits={BACKGROUND: 1})
+        with rpc_priority(BACKGROUND):
+            with scheduler.slot():
+                with scheduler.slot():
+                    pass
+        with pytest.raises(ValueError):
+            with rpc_priority("urgent"):
+                pass
+
+
+HIERARCHY = """<?xml version="1.0" encoding="UTF-8"?>
+<hierarchy rotation="0">
+  <node index="0" text="OK" resource-id="android:id/button1" class="android.widget.Button" package="com.example"
+    content-desc="" clickable="true" enabled="true" bounds="[0,0][100,50]" />
+</hierarchy>
+"""
+
+
+class TestRecordReplay:
+    def test_record_and_replay(self, pooled_server, tmp_path):
+        path = tmp_path / "session.jsonl"
+        pooled_server._dev.serial = "serial-1"
+        pooled_server._transport = create_transport(pooled_server._dev, DEFAULT_SERVER_PORT, RecordingTransport(path))
+        assert pooled_server.jsonrpc_call("click", [1, 2]) == "click"
+        with pytest.raises(UiObjectNotFoundError):
+            pooled_server.jsonrpc_call("objInfo", [{"text": "a"}])
+        pooled_server._transport.shell("echo hi", lambda: ShellResponse("hi\n", 0))
+        pooled_server._transport.close()
+
+        replay = ReplayTransport(path)
+        assert replay.serial == "serial-1"
+        assert replay.jsonrpc("click", [1, 2], None) == "click"
+        with pytest.raises(UiObjectNotFoundError):
+            replay.jsonrpc("objInfo", [{"text": "a"}], None)
+        assert replay.shell(["echo", "hi"], None) == ShellResponse("hi\n", 0)
+        with pytest.raises(RPCError):
+            replay.jsonrpc("click", [3, 4], None)
+
+    def test_device_on_replay(self, tmp_path):
+        path = tmp_path / "session.jsonl"
+        records = [
+            {"type": "meta", "version": 1, "serial": "serial-1", "port": DEFAULT_SERVER_PORT},
+            {"type": "jsonrpc", "method": "dumpWindowHierarchy", "params": [False, 50], "result": HIERARCHY, "elapsed": .2},
+            {"type": "jsonrpc", "method": "click", "params": [50, 25], "result": True, "elapsed": .01},
+            {"type": "shell", "cmd": "getprop ro.product.model", "output": "Pixel\n", "exit_code": 0, "elapsed": .01},
+        ]
+        path.write_text("\n".join(json.dumps(r) for r in records) + "\n")
+        d = u2.connect(transport=ReplayTransport(path))
+        assert d.serial == "serial-1"
+        assert d.shell("getprop ro.product.model").output == "Pixel\n"
+        d.xpath("OK").click()
+        assert d.xpath("OK").exists
+
+        d = u2.connect(transport=ReplayTransport(path, keep_latency=True))
+        start = time.monotonic()
+        d.dump_hierarchy()
+        assert time.monotonic() - start >= .2
+
+
 class TestCheckDeviceFileHash:
     """Test the _check_device_file_hash method with toybox fallback"""
     
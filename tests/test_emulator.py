@@ -0,0 +1,159 @@
+# coding: utf-8
+#
+
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+
+import uiautomator2 as u2
+from uiautomator2.abstract import ShellResponse
+from uiautomator2.emulator import EmulatorServer, LatencyProfile
+from uiautomator2.exceptions import AdbShellError, RPCUnknownError, UiObjectNotFoundError
+
+
+@pytest.fixture
+def emulator():
+    with EmulatorServer(nodes=20) as emu:
+        yield emu
+
+
+def test_device_on_emulator(emulator: EmulatorServer):
+    d = u2.connect(transport=emulator.transport())
+    assert d.info["displayWidth"] == 1080
+    assert d(text="item3").info["bounds"]["top"] == 3 * (1920 // 20)
+    assert not d(text="missing").exists
+    with pytest.raises(UiObjectNotFoundError):
+        d(text="missing").click(timeout=.1)
+    d.xpath("item5").click()
+    assert emulator.calls["click"] == 1
+    assert d.screenshot().size == (1080, 1920)
+    with pytest.raises(RPCUnknownError):
+        d.jsonrpc.notExist()
+    with pytest.raises(AdbShellError):
+        d.shell("ls")
+
+
+def test_screenshot_scale_quality(emulator: EmulatorServer, tmp_path):
+    d = u2.connect(transport=emulator.transport())
+    assert d.screenshot(scale=.5).size == (540, 960)
+    d.settings["screenshot_scale"] = .25
+    assert d.screenshot(quality=30).size == (270, 480)
+    d.screenshot(tmp_path / "shot.png", scale=1)
+    assert (tmp_path / "shot.png").read_bytes().startswith(b"\x89PNG")
+    frame = d.screenshot(format="frame", scale=1)
+    frame.save(tmp_path / "shot.jpg")
+    assert (tmp_path / "shot.jpg").read_bytes() == frame.data == emulator.screenshot
+    assert frame.pil.size == (1080, 1920)
+    with pytest.raises(ValueError):
+        d.screenshot(scale=2)
+    with pytest.raises(AssertionError):
+        d.settings["screenshot_quality"] = 0
+
+
+def test_raw_screenshot_fallback(emulator: EmulatorServer):
+    d = u2.connect(transport=emulator.transport())
+    d.__dict__["_usb_attached"] = True
+    with patch("uiautomator2._screencap.capture", side_effect=AdbShellError("unsupported screencap output")) as capture:
+        assert d.screenshot().size == (1080, 1920)
+        assert d.screenshot().size == (1080, 1920)
+        assert capture.call_count == 1
+        assert emulator.calls["takeScreenshot"] == 2
+        d.settings["screenshot_backend"] = "raw"
+        with pytest.raises(AdbShellError):
+            d.screenshot()
+
+
+def test_screenshot_stream(emulator: EmulatorServer):
+    d = u2.connect(transport=emulator.transport())
+    with d.screenshot_stream(scale=.5) as stream:
+        frames = [next(stream) for _ in range(3)]
+    assert [f.size for f in frames] == [(540, 960)] * 3
+    assert frames[0].timestamp <= frames[2].timestamp
+
+
+def test_screenshot_stream_pipelined(emulator: EmulatorServer):
+    d = u2.connect(transport=emulator.transport())
+    with d.screenshot_stream(scale=.5, pipeline=2) as stream:
+        for _ in range(10):
+            next(stream)
+    # every frame of the pipeline is a capture of its own, none shares a round trip
+    assert emulator.calls["takeScreenshot"] == stream.stats()["captured"]
+
+
+def test_element_screenshots(emulator: EmulatorServer):
+    d = u2.connect(transport=emulator.transport())
+    d.settings["screenshot_scale"] = .5
+    shots = d.element_screenshots([d(text="item1"), d.xpath("item2").get(), (0, 0, 100, 50)])
+    assert [im.size for im in shots] == [(540, 48), (540, 48), (50, 25)]
+    assert emulator.calls["takeScreenshot"] == 1
+    assert d.rpc_stats().snapshot()["batch"]["calls"] == 1 # objInfo of UiObjects
+    d.element_screenshots([(0, 0, 10, 10)], max_age=60)
+    assert emulator.calls["takeScreenshot"] == 1
+    frames = d.xpath("//*[starts-with(@text, 'item')]").screenshots(format="frame")
+    assert len(frames) == 20 and emulator.calls["takeScreenshot"] == 2
+
+
+def test_hierarchy_cache(emulator: EmulatorServer):
+    d = u2.connect(transport=emulator.transport())
+    d.settings["hierarchy_max_age"] = 10
+    assert d.xpath("item1").exists
+    assert d.xpath("item2").exists
+    assert emulator.calls["dumpWindowHierarchy"] == 1
+    d.click(10, 10)
+    d.xpath("item1").exists
+    d.xpath("item2").exists
+    assert emulator.calls["dumpWindowHierarchy"] == 2
+    d.invalidate_hierarchy()
+    d.dump_hierarchy()
+    assert emulator.calls["dumpWindowHierarchy"] == 3
+    assert d.hierarchy_cache_stats() == {"hits": 2, "misses": 3, "invalidations": 2}
+
+
+def test_hierarchy_cache_shell_and_adb(emulator: EmulatorServer):
+    d = u2.connect(transport=emulator.transport())
+    d.settings["hierarchy_max_age"] = 10
+    d._dev = Mock()
+    with patch.object(d.transport, "shell", return_value=ShellResponse("", 0)):
+        d.dump_hierarchy()
+        d.shell("ps -A")
+        d.shell(["getprop", "ro.serialno"])
+        d.dump_hierarchy()
+        assert emulator.calls["dumpWindowHierarchy"] == 1
+        d.shell("input keyevent HOME")
+        d.dump_hierarchy()
+        assert emulator.calls["dumpWindowHierarchy"] == 2
+    d.app_stop("com.example.emulator")
+    d.dump_hierarchy()
+    d.app_clear("com.example.emulator")
+    d.dump_hierarchy()
+    assert emulator.calls["dumpWindowHierarchy"] == 4
+
+
+def test_fixture_and_batch(tmp_path):
+    page = tmp_path / "page.xml"
+    page.write_text('<hierarchy rotation="0"><node index="0" text="OK" class="Button" bounds="[0,0][10,10]" /></hierarchy>')
+    with EmulatorServer(hierarchy=page) as emu:
+        d = u2.connect(transport=emu.transport())
+        with d.jsonrpc_batch() as batch:
+            exist = batch.exist({"text": "OK"})
+            count = batch.count({"className": "Button"})
+        assert exist.result() is True
+        assert count.result() == 1
+        assert d.rpc_stats().snapshot()["batch"]["calls"] == 1
+
+
+def test_latency_and_concurrency():
+    with EmulatorServer(nodes=10, latency=LatencyProfile(base=.1)) as emu:
+        d = u2.connect(transport=emu.transport())
+        start = time.monotonic()
+        threads = [threading.Thread(target=d.click, args=(1, 2)) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - start
+        assert emu.calls["click"] == 4
+        # served concurrently
+        assert .1 <= elapsed < .35
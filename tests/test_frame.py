@@ -0,0 +1,64 @@
+# coding: utf-8
+#
+
+import io
+
+import pytest
+from PIL import Image
+
+from uiautomator2._frame import ScreenFrame
+from uiautomator2._screencap import RawScreen
+
+
+def _jpeg(size=(40, 30), color=(200, 10, 10)) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", size, color).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def test_lazy_decode_cached():
+    frame = ScreenFrame(_jpeg(), display_id=1)
+    assert frame.encoding == "jpeg"
+    assert frame.size == (40, 30)
+    assert frame._pil is None
+    assert frame.pil is frame.pil
+    assert frame.pil.size == (40, 30)
+    assert frame.display_id == 1 and frame.timestamp > 0
+
+
+def test_save_without_reencode(tmp_path):
+    data = _jpeg()
+    frame = ScreenFrame(data)
+    frame.save(tmp_path / "a.jpg")
+    assert (tmp_path / "a.jpg").read_bytes() == data
+    frame.save(tmp_path / "a.png")
+    assert (tmp_path / "a.png").read_bytes().startswith(b"\x89PNG")
+    assert frame._pil is not None
+
+
+def test_crop():
+    frame = ScreenFrame(image=Image.new("RGB", (40, 30), (1, 2, 3)))
+    part = frame.crop((10, 5, 50, 25))
+    assert part.size == (30, 20)
+    assert part.pil.size == (30, 20)
+    assert part.crop((0, 0, 5, 5)).pil.getpixel((0, 0)) == (1, 2, 3)
+    with pytest.raises(ValueError):
+        frame.crop((10, 10, 10, 20))
+
+
+def test_crop_shares_ndarray():
+    pytest.importorskip("cv2")
+    frame = ScreenFrame(_jpeg())
+    part = frame.crop((0, 0, 10, 10))
+    assert part.opencv.base is frame.opencv or part.opencv.base is frame.opencv.base
+    assert frame.gray.shape == (30, 40)
+
+
+def test_raw_frame():
+    raw = RawScreen(2, 1, "RGBA", memoryview(bytearray([1, 2, 3, 255, 4, 5, 6, 255])))
+    frame = ScreenFrame(raw=raw)
+    assert frame.encoding == "raw"
+    assert frame.size == (2, 1)
+    assert frame.pil.getpixel((1, 0)) == (4, 5, 6)
+    with pytest.raises(ValueError):
+        ScreenFrame()
@@ -0,0 +1,49 @@
+# coding: utf-8
+#
+
+import time
+
+from uiautomator2._hierarchy import HierarchyCache, is_readonly_shell
+
+
+def test_max_age():
+    cache = HierarchyCache()
+    loads = []
+
+    def load():
+        loads.append(1)
+        return "<hierarchy/>"
+
+    assert cache.get("k", load, .2) == "<hierarchy/>"
+    cache.get("k", load, .2)
+    assert len(loads) == 1
+    time.sleep(.25)
+    cache.get("k", load, .2)
+    cache.get("k", load, 0) # disabled
+    assert len(loads) == 3
+    assert cache.snapshot() == {"hits": 1, "misses": 2, "invalidations": 0}
+
+
+def test_dump_overlapping_action_not_kept():
+    cache = HierarchyCache()
+
+    def load():
+        cache.invalidate() # an action finished while dumping
+        return "stale"
+
+    assert cache.get("k", load, 10) == "stale"
+    assert cache.get("k", lambda: "fresh", 10) == "fresh"
+    assert cache.get("k", lambda: "other", 10) == "fresh"
+    cache.invalidate()
+    assert cache.get("k", lambda: "new", 10) == "new"
+    assert cache.snapshot()["invalidations"] == 1
+
+
+def test_is_readonly_shell():
+    assert is_readonly_shell("ps -A")
+    assert is_readonly_shell(["pm", "list", "packages", "-3"])
+    assert is_readonly_shell("getprop ro.product.model")
+    assert not is_readonly_shell("pm clear com.example")
+    assert not is_readonly_shell(["input", "tap", "1", "2"])
+    assert not is_readonly_shell("ps; input keyevent HOME")
+    assert not is_readonly_shell("psx")
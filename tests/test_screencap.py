@@ -0,0 +1,63 @@
+# coding: utf-8
+#
+
+import socket
+import struct
+import threading
+from unittest.mock import Mock
+
+import pytest
+
+from uiautomator2 import _screencap
+from uiautomator2.exceptions import AdbShellError
+
+
+def _fake_dev(output: bytes) -> Mock:
+    """ device whose exec:screencap connection streams output """
+    client, server = socket.socketpair()
+
+    def feed():
+        server.sendall(output)
+        server.close()
+
+    threading.Thread(target=feed, daemon=True).start()
+    conn = Mock()
+    conn.conn = client
+    conn.close.side_effect = client.close
+    dev = Mock()
+    dev.open_transport.return_value = conn
+    return dev
+
+
+@pytest.mark.parametrize("extra", [b"", b"\x01\x00\x00\x00"])
+def test_capture(extra: bytes):
+    pixels = bytes([10, 20, 30, 255]) * 6
+    dev = _fake_dev(struct.pack("<III", 2, 3, 1) + extra + pixels)
+    raw = _screencap.capture(dev)
+    dev.open_transport.return_value.send_command.assert_called_once_with("exec:screencap")
+    assert (raw.width, raw.height, raw.mode) == (2, 3, "RGBA")
+    assert bytes(raw.buffer) == pixels
+    image = raw.to_pil()
+    assert image.size == (2, 3)
+    assert image.getpixel((1, 2)) == (10, 20, 30)
+
+
+def test_capture_bgra_to_ndarray():
+    np = pytest.importorskip("numpy")
+    dev = _fake_dev(struct.pack("<III", 1, 1, 5) + bytes([1, 2, 3, 4]))
+    raw = _screencap.capture(dev)
+    assert raw.to_pil().getpixel((0, 0)) == (3, 2, 1)
+    array = raw.to_ndarray()
+    assert array.shape == (1, 1, 4)
+    # a view of the received buffer
+    assert np.shares_memory(array, np.frombuffer(raw.buffer, dtype=np.uint8))
+
+
+@pytest.mark.parametrize("output", [
+    b"",
+    struct.pack("<III", 2, 2, 4) + b"\x00" * 8, # RGB_565 is not supported
+    struct.pack("<III", 2, 2, 1) + b"\x00" * 10, # truncated
+])
+def test_capture_invalid(output: bytes):
+    with pytest.raises(AdbShellError):
+        _screencap.capture(_fake_dev(output))
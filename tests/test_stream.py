@@ -0,0 +1,66 @@
+# coding: utf-8
+#
+
+import itertools
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from uiautomator2._frame import ScreenFrame
+from uiautomator2._stream import ScreenshotStream
+
+
+def _capture(delay: float = 0):
+    counter = itertools.count()
+    lock = threading.Lock()
+
+    def capture() -> ScreenFrame:
+        with lock:
+            n = next(counter)
+        time.sleep(delay)
+        return ScreenFrame(image=Image.new("L", (1, 1)), display_id=n)
+    return capture
+
+
+def test_freshest_frame_and_drops():
+    with ScreenshotStream(_capture(.01), maxsize=1).start() as stream:
+        first = stream.get(timeout=1)
+        time.sleep(.15)
+        second = stream.get(timeout=1)
+    assert second.display_id - first.display_id > 2
+    stats = stream.stats()
+    assert stats["delivered"] == 2
+    assert stats["dropped"] > 0
+
+
+def test_fps_limit():
+    with ScreenshotStream(_capture(), fps=20).start() as stream:
+        time.sleep(.3)
+    assert 4 <= stream.stats()["captured"] <= 8
+
+
+def test_pipelined_captures():
+    with ScreenshotStream(_capture(.1), pipeline=4, maxsize=20).start() as stream:
+        time.sleep(.35)
+    # one capture at a time would finish 3
+    assert stream.stats()["captured"] >= 8
+
+
+def test_iterate_and_error():
+    calls = []
+
+    def capture():
+        calls.append(1)
+        if len(calls) > 3:
+            raise RuntimeError("device gone")
+        return ScreenFrame(image=Image.new("L", (1, 1)))
+
+    stream = ScreenshotStream(capture, maxsize=10, pipeline=1).start()
+    with pytest.raises(RuntimeError):
+        for _ in stream:
+            pass
+    assert stream.closed
+    stream.close()
+    assert stream.latest() is not None
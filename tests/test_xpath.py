@@ -9,8 +9,8 @@ from unittest.mock import Mock
 import pytest
 from PIL import Image
 
-from uiautomator2.xpath import XMLElement, XPath, XPathElementNotFoundError, XPathEntry, XPathSelector, \
-    convert_to_camel_case, is_xpath_syntax_ok, safe_xmlstr, str2bytes, strict_xpath
+from uiautomator2.xpath import PageSource, XMLElement, XPath, XPathElementNotFoundError, XPathEntry, XPathSelector, \
+    convert_to_camel_case, is_xpath_syntax_ok, safe_xmlstr, str2bytes, strict_xpath, strip_invisible_chars
 
 mock = Mock()
 mock.screenshot.return_value = Image.new("RGB", (1080, 1920), "white")
@@ -41,6 +41,22 @@ def test_str2bytes():
     assert str2bytes('123') == b'123'
 
 
+def test_strip_invisible_chars():
+    data = "\ufeff<a text=\"\u200bhi\u200e \u2013 \u4f60\"/>".encode("utf-8")
+    assert strip_invisible_chars(data) == "<a text=\"hi \u2013 \u4f60\"/>".encode("utf-8")
+
+
+def test_page_source():
+    xml = mock.dump_hierarchy.return_value.replace('text="n1"', 'text="\u200en1"')
+    for data in (xml, xml.encode("utf-8")):
+        source = PageSource.parse(data)
+        assert source.root.tag == "hierarchy"
+        assert [el.tag for el in source.root.iter()] == ["hierarchy", "FrameLayout", "TextView", "TextView", "android.view.View"]
+        assert "class" not in source.root[0].attrib
+        assert source.find_elements('//TextView[@text="n1"]')[0].attrib["resource-id"] == "android:id/text1"
+    assert PageSource("<hierarchy/>").root.tag == "hierarchy"
+
+
 def test_is_xpath_syntax_ok():
     assert is_xpath_syntax_ok("/a")
     assert is_xpath_syntax_ok("//a")
@@ -6,27 +6,30 @@ from __future__ import absolute_import, print_function
 import base64
 import contextlib
 import dataclasses
-import io
+import functools
 import logging
 import os
 import re
 import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from functools import cached_property
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
 
 import adbutils
 from lxml import etree
-from PIL import Image
-from retry import retry
 
-from uiautomator2 import xpath
+from uiautomator2 import _deadline, _screencap, xpath
+from uiautomator2._frame import ScreenFrame
+from uiautomator2._hierarchy import HierarchyCache, is_readonly_shell
 from uiautomator2._input import InputMethodMixIn
 from uiautomator2._proto import HTTP_TIMEOUT, SCROLL_STEPS, Direction
+from uiautomator2._scheduler import BACKGROUND, BULK, INTERACTIVE, rpc_priority
 from uiautomator2._selector import Selector, UiObject
+from uiautomator2._stream import ScreenshotStream
 from uiautomator2.abstract import AbstractShell, AbstractUiautomatorServer, ShellResponse
 from uiautomator2.base import _BaseClient
-from uiautomator2.core import DEFAULT_SERVER_PORT
+from uiautomator2.core import DEFAULT_SERVER_PORT, Transport
 from uiautomator2.exceptions import *
 from uiautomator2.settings import Settings
 from uiautomator2.swipe import SwipeExt
@@ -51,6 +54,8 @@ class _Device(_BaseClient):
     __orientation = (  # device orientation
         (0, "natural", "n", 0), (1, "left", "l", 90),
         (2, "upsidedown", "u", 180), (3, "right", "r", 270))
+    _last_frame: Optional[ScreenFrame] = None # of the last screenshot(), see element_screenshots
+    _raw_screenshot_supported = True # False after raw capture failed in auto backend
 
     def show_touch_trace(self, pointer_location: bool = True, show_touches: bool = True):
         """
@@ -68,39 +73,185 @@ class _Device(_BaseClient):
         w, h = self._dev.window_size()
         return w, h
 
-    def screenshot(self, filename: Optional[str] = None, format="pillow", display_id: Optional[int] = None):
+    def screenshot(self, filename: Optional[str] = None, format="pillow", display_id: Optional[int] = None,
+                   scale: Optional[float] = None, quality: Optional[int] = None):
         """
         Take screenshot of device
 
         Returns:
-            PIL.Image.Image, np.ndarray (OpenCV format) or None
+            PIL.Image.Image, np.ndarray (OpenCV format), np.ndarray (raw RGBA), ScreenFrame or None
 
         Args:
-            filename (str): saved filename, if filename is set then return None
-            format (str): used when filename is empty. one of ["pillow", "opencv"]
+            filename (str): saved filename, if filename is set then return None.
+                a JPEG from the server is written as received when the extension is .jpg
+            format (str): used when filename is empty. one of ["pillow", "opencv", "gray", "raw", "frame"]
+                raw is a (height, width, 4) view of the uncompressed framebuffer,
+                always full size and lossless, display_id is the physical display id.
+                Channel order is the one of the device, RGBA, RGBX or BGRA, see ScreenFrame.raw.mode.
+                frame is a ScreenFrame, which decodes to the other formats on demand
             display_id (int): use specific display if device has multiple screen
+            scale (float): (0, 1], image size relative to screen, default settings['screenshot_scale']
+            quality (int): [1, 100], JPEG quality, default settings['screenshot_quality']
+
+        The framebuffer is used instead of a JPEG from the server when
+        settings['screenshot_backend'] is "raw", or "auto" (default) and the
+        device is attached by USB and a full size image is wanted.
+        In auto, a device whose framebuffer can not be read falls back to the server.
 
         Examples:
             screenshot("saved.jpg")
             screenshot().save("saved.png")
             cv2.imwrite('saved.jpg', screenshot(format='opencv'))
+            screenshot(format='opencv', scale=0.5, quality=50) # faster, for image matching
+            screenshot(format='raw')[y, x] # 4 channels of a pixel, in framebuffer order
+            frame = screenshot(format='frame'); frame.pil, frame.opencv # decoded once each
         """
-        if display_id is None:
-            base64_data = self.jsonrpc.takeScreenshot(1, 80)
+        frame = self._screenshot_frame(scale, quality, display_id, raw=format == "raw")
+        if filename:
+            frame.save(filename)
+            return
+        if format == "frame":
+            return frame
+        return frame.convert(format)
+
+    def _screenshot_frame(self, scale: Optional[float], quality: Optional[int], display_id: Optional[int] = None,
+                          raw: bool = False, coalesce: bool = True) -> ScreenFrame:
+        scale = self.settings['screenshot_scale'] if scale is None else scale
+        quality = self.settings['screenshot_quality'] if quality is None else quality
+        if not 0 < scale <= 1:
+            raise ValueError("scale must be in (0, 1]", scale)
+        if not 1 <= quality <= 100:
+            raise ValueError("quality must be in [1, 100]", quality)
+        frame = self._capture_frame(scale, quality, display_id, raw=raw, coalesce=coalesce)
+        self._last_frame = frame
+        return frame
+
+    def _capture_frame(self, scale: float, quality: int, display_id: Optional[int], raw: bool = False,
+                       coalesce: bool = True) -> ScreenFrame:
+        """ coalesce=False always asks the server, concurrent captures of a stream must be distinct frames """
+        timestamp = time.time()
+        if raw or self._use_raw_screenshot(scale, display_id):
+            try:
+                with self._scheduler.slot():
+                    screen = _screencap.capture(self._dev, display_id)
+            except AdbShellError as e:
+                if raw or self.settings['screenshot_backend'] == "raw":
+                    raise
+                logger.info("raw screenshot not supported, use jsonrpc from now on: %s", e)
+                self._raw_screenshot_supported = False
+                return self._capture_frame(scale, quality, display_id, coalesce=coalesce)
+            frame = ScreenFrame(raw=screen, timestamp=timestamp, display_id=display_id)
+            if raw or scale == 1:
+                return frame
+            pil_img = frame.pil
+        elif display_id is None:
+            if coalesce:
+                base64_data = self.jsonrpc.takeScreenshot(scale, quality)
+            else:
+                base64_data = self._jsonrpc_call_recover("takeScreenshot", [scale, quality], HTTP_TIMEOUT)
             # takeScreenshot may return None
             if base64_data:
-                jpg_raw = base64.b64decode(base64_data)
-                pil_img = Image.open(io.BytesIO(jpg_raw))
-            else:
-                pil_img = self._dev.screenshot(display_id=0)
+                return ScreenFrame(base64.b64decode(base64_data), timestamp=timestamp, scale=scale)
+            pil_img = self._dev.screenshot(display_id=0)
         else:
             pil_img = self._dev.screenshot(display_id=display_id)
-        
-        if filename:
-            pil_img.save(filename)
-            return
-        return image_convert(pil_img, format)
-        
+        if scale != 1:
+            # screencap of adb has no scale option
+            pil_img = pil_img.resize((max(1, round(pil_img.width * scale)), max(1, round(pil_img.height * scale))))
+        return ScreenFrame(image=pil_img, timestamp=timestamp, display_id=display_id, scale=scale)
+
+    def element_screenshots(self, elements: Iterable[Union[UiObject, "xpath.XMLElement", Tuple[int, int, int, int]]],
+                            format: str = "pillow", max_age: float = 0.0, scale: Optional[float] = None) -> List[Any]:
+        """
+        Screenshots of many elements, cropped from one capture
+
+        Args:
+            elements: UiObject, xpath element or (left, top, right, bottom) in screen coordinates
+            format: one of ["pillow", "opencv", "gray", "frame"], opencv and gray crops are slices of one decoded screen
+            max_age: reuse the last capture of screenshot() when it is at most max_age seconds old
+            scale: see screenshot
+
+        Returns:
+            one image per element, in order
+
+        Raises:
+            UiObjectNotFoundError
+
+        Example:
+            d.element_screenshots(d.xpath("//android.widget.ImageView").all())
+            d.element_screenshots([d(text="OK"), d(text="Cancel")], format="opencv", max_age=1)
+        """
+        boxes = self._element_bounds(elements)
+        scale = self.settings['screenshot_scale'] if scale is None else scale
+        frame = self._last_frame
+        fresh = frame is not None and frame.display_id is None and frame.scale == scale and time.time() - frame.timestamp <= max_age
+        if not fresh:
+            frame = self.screenshot(format="frame", scale=scale)
+        crops = []
+        for box in boxes:
+            crop = frame.crop(tuple(round(v * frame.scale) for v in box))
+            crops.append(crop if format == "frame" else crop.convert(format))
+        return crops
+
+    def _element_bounds(self, elements) -> List[Tuple[int, int, int, int]]:
+        """ bounds of UiObjects are queried in one batch round trip """
+        elements = list(elements)
+        infos = {}
+        with self.jsonrpc_batch() as batch:
+            for i, el in enumerate(elements):
+                if isinstance(el, UiObject):
+                    infos[i] = batch.objInfo(el.selector)
+        boxes = []
+        for i, el in enumerate(elements):
+            if i in infos:
+                info = infos[i].result()
+                bounds = info.get('visibleBounds') or info.get("bounds")
+                boxes.append((bounds['left'], bounds['top'], bounds['right'], bounds['bottom']))
+            elif isinstance(el, xpath.XMLElement):
+                boxes.append(el.bounds)
+            else:
+                boxes.append(tuple(el))
+        return boxes
+
+    def screenshot_stream(self, fps: Optional[float] = None, scale: Optional[float] = None, maxsize: int = 1,
+                          quality: Optional[int] = None, pipeline: int = 2) -> ScreenshotStream:
+        """
+        Capture screenshots continuously in background threads
+
+        Args:
+            fps: max captures per second, default as fast as possible
+            scale, quality: see screenshot
+            maxsize: newest frames kept, 1 means the consumer always gets the freshest one
+            pipeline: captures in flight at the same time
+
+        Returns:
+            ScreenshotStream, an iterator of ScreenFrame, close it when done
+
+        Example:
+            with d.screenshot_stream(fps=5, scale=0.5) as stream:
+                for frame in stream:
+                    if found(frame.opencv):
+                        break
+        """
+        capture = functools.partial(self._screenshot_frame, scale, quality, coalesce=False)
+        return ScreenshotStream(capture, fps=fps, maxsize=maxsize, pipeline=pipeline).start()
+
+    def _use_raw_screenshot(self, scale: float, display_id: Optional[int]) -> bool:
+        backend = self.settings['screenshot_backend']
+        if backend == "raw":
+            return True
+        return backend == "auto" and scale == 1 and display_id is None and self._raw_screenshot_supported and self._usb_attached
+
+    @cached_property
+    def _usb_attached(self) -> bool:
+        """ adb link is USB, where an uncompressed framebuffer is cheaper than JPEG encode and decode """
+        if self._transport.offline:
+            return False
+        try:
+            return self._dev.get_devpath().startswith("usb:")
+        except adbutils.AdbError:
+            return False
+
     def dump_hierarchy(self, compressed=False, pretty=False, max_depth: Optional[int] = None, root_in_active: Optional[bool] = None) -> str:
         """
         Dump window hierarchy
@@ -113,11 +264,15 @@ class _Device(_BaseClient):
 
         Returns:
             xml content
+
+        A dump younger than settings['hierarchy_max_age'] is reused unless
+        an action ran since, see invalidate_hierarchy
         """
         try:
             if max_depth is None:
                 max_depth = self.settings['max_depth']
-            content = self._do_dump_hierarchy(compressed, max_depth, root_in_active)
+            load = functools.partial(self._do_dump_hierarchy, compressed, max_depth, root_in_active)
+            content = self._hierarchy_cache.get((compressed, max_depth, root_in_active), load, self.settings['hierarchy_max_age'])
         except HierarchyEmptyError: # pragma: no cover
             logger.warning("dump empty, return empty xml")
             content = '<?xml version=\'1.0\' encoding=\'UTF-8\' standalone=\'yes\' ?>\r\n<hierarchy rotation="0" />'
@@ -128,8 +283,60 @@ class _Device(_BaseClient):
             content = content.decode("utf-8")
         return content
 
-    @retry(HierarchyEmptyError, tries=3, delay=1)
-    def _do_dump_hierarchy(self, compressed=False, max_depth=None, root_in_active: Optional[bool] = None) -> str:
+    @cached_property
+    def _hierarchy_cache(self) -> HierarchyCache:
+        return HierarchyCache()
+
+    def invalidate_hierarchy(self):
+        """ drop the cached hierarchy, for screen changes made outside of this client """
+        self._hierarchy_cache.invalidate()
+
+    def hierarchy_cache_stats(self) -> Dict[str, int]:
+        """ hits, misses and invalidations of the hierarchy cache """
+        return self._hierarchy_cache.snapshot()
+
+    @contextlib.contextmanager
+    def _changing_screen(self) -> Iterator[None]:
+        """ drop the cached hierarchy before and after, a dump started during it may miss the change """
+        self.invalidate_hierarchy()
+        try:
+            yield
+        finally:
+            self.invalidate_hierarchy()
+
+    def jsonrpc_call(self, method: str, params: Any = None, timeout: float = 10) -> Any:
+        # calls not in readonly_methods may change the screen
+        if method in self.readonly_methods:
+            return super().jsonrpc_call(method, params, timeout)
+        with self._changing_screen():
+            return super().jsonrpc_call(method, params, timeout)
+
+    def _jsonrpc_batch_call(self, calls: List[Tuple[str, Any]], timeout: float = 10) -> List[Any]:
+        if all(method in self.readonly_methods for method, _ in calls):
+            return super()._jsonrpc_batch_call(calls, timeout)
+        with self._changing_screen():
+            return super()._jsonrpc_batch_call(calls, timeout)
+
+    def shell(self, cmdargs: Union[str, List[str]], timeout=60) -> ShellResponse:
+        # other shell commands may start apps, input events or change settings
+        if is_readonly_shell(cmdargs):
+            return super().shell(cmdargs, timeout)
+        with self._changing_screen():
+            return super().shell(cmdargs, timeout)
+
+    def _do_dump_hierarchy(self, compressed=False, max_depth=None, root_in_active: Optional[bool] = None, tries: int = 3) -> str:
+        """ retry an empty dump every second, as long as the deadline leaves time for it """
+        while True:
+            tries -= 1
+            try:
+                return self._dump_hierarchy_once(compressed, max_depth, root_in_active)
+            except HierarchyEmptyError:
+                left = _deadline.remaining()
+                if tries <= 0 or (left is not None and left < 1):
+                    raise
+                time.sleep(1)
+
+    def _dump_hierarchy_once(self, compressed=False, max_depth=None, root_in_active: Optional[bool] = None) -> str:
         if max_depth is None:
             max_depth = 50
         if root_in_active is None:
@@ -487,7 +694,7 @@ class _AppMixIn(AbstractShell):
             Session
         """
         self.app_start(package_name, stop=not attach)
-        return Session(self.adb_device, package_name, port=self._device_server_port)
+        return Session(self.adb_device, package_name, port=self._device_server_port, transport=self.transport)
 
     def _compat_shell_ps(self) -> str:
         """
@@ -535,7 +742,8 @@ class _AppMixIn(AbstractShell):
         Args:
             data: can be file path or url or file object
         """
-        self.adb_device.install(data)
+        with self._changing_screen():
+            self.adb_device.install(data)
 
     def wait_activity(self, activity, timeout=10) -> bool:
         """ wait activity
@@ -654,7 +862,8 @@ class _AppMixIn(AbstractShell):
 
     def app_stop(self, package_name: str):
         """ Stop one application """
-        self.adb_device.app_stop(package_name)
+        with self._changing_screen():
+            self.adb_device.app_stop(package_name)
 
     def app_stop_all(self, excludes=[]):
         """ Stop all third party applications
@@ -673,7 +882,8 @@ class _AppMixIn(AbstractShell):
 
     def app_clear(self, package_name: str):
         """ Stop and clear app data: pm clear """
-        self.adb_device.app_clear(package_name)
+        with self._changing_screen():
+            self.adb_device.app_clear(package_name)
 
     def app_uninstall(self, package_name: str) -> bool:
         """ Uninstall an app 
@@ -911,8 +1121,8 @@ class Session(Device):
     """Session keeps watch the app status
     each jsonrpc call will check if the package is still running
     """
-    def __init__(self, dev: adbutils.AdbDevice, package_name: str, port: int):
-        super().__init__(dev, port=port)
+    def __init__(self, dev: adbutils.AdbDevice, package_name: str, port: int, transport: Union[str, Transport, None] = None):
+        super().__init__(dev, port=port, transport=transport)
         self._package_name = package_name
         self._pid = self.app_wait(self._package_name)
     
@@ -927,6 +1137,11 @@ class Session(Device):
         if not self.running():
             raise SessionBrokenError(f"app:{self._package_name} pid:{self._pid} is quit")
         return super().jsonrpc_call(method, params, timeout)
+
+    def _jsonrpc_batch_call(self, calls: List[Tuple[str, Any]], timeout: float = 10) -> List[Any]:
+        if not self.running():
+            raise SessionBrokenError(f"app:{self._package_name} pid:{self._pid} is quit")
+        return super()._jsonrpc_batch_call(calls, timeout)
     
     def restart(self):
         """ restart app """
@@ -945,11 +1160,16 @@ class Session(Device):
         self.close()
 
 
-def connect(serial: Union[str, adbutils.AdbDevice] = None, *, port: int = DEFAULT_SERVER_PORT) -> Device:
+def connect(serial: Union[str, adbutils.AdbDevice] = None, *, port: int = DEFAULT_SERVER_PORT, transport: Union[str, Transport, None] = None) -> Device:
     """
     Args:
         serial (str): Android device serialno or adb device instance
         port (int): uiautomator2 server port on device
+        transport: how to reach the server, one of
+            "adb": new adb stream per connection (default)
+            "forward": adb forward to a local tcp port once, then plain tcp
+            "tcp": plain tcp to the device ip, for devices reachable over network
+            or a Transport instance, e.g. core.RecordingTransport, core.ReplayTransport
 
     Returns:
         Device
@@ -960,17 +1180,19 @@ def connect(serial: Union[str, adbutils.AdbDevice] = None, *, port: int = DEFAUL
     Example:
         connect("10.0.0.1:5555")
         connect("cff1123ea")  # adb device serial number
+        connect("cff1123ea", transport="forward")
     """
     if not serial:
         serial = os.getenv("ANDROID_SERIAL")
-    return connect_usb(serial, port=port)
+    return connect_usb(serial, port=port, transport=transport)
 
 
-def connect_usb(serial: Union[str, adbutils.AdbDevice, None] = None, *, port: int = DEFAULT_SERVER_PORT) -> Device:
+def connect_usb(serial: Union[str, adbutils.AdbDevice, None] = None, *, port: int = DEFAULT_SERVER_PORT, transport: Union[str, Transport, None] = None) -> Device:
     """
     Args:
         serial (str): android device serial or adb device instance
         port (int): uiautomator2 server port on device
+        transport: see connect
 
     Returns:
         Device
@@ -978,6 +1200,48 @@ def connect_usb(serial: Union[str, adbutils.AdbDevice, None] = None, *, port: in
     Raises:
         ConnectError
     """
-    if not serial:
+    offline = isinstance(transport, Transport) and transport.offline
+    if not serial and not offline:
         serial = adbutils.adb.device()
-    return Device(serial, port=port)
+    return Device(serial, port=port, transport=transport)
+
+
+class ConnectResult(NamedTuple):
+    """ timings: seconds of each startup phase (see Device.startup_timings) and total """
+    device: Optional[Device]
+    error: Optional[Exception]
+    timings: Dict[str, float]
+
+
+def connect_many(serials: Iterable[Union[str, adbutils.AdbDevice]], *, max_workers: int = 16, port: int = DEFAULT_SERVER_PORT, transport: Union[str, Transport, None] = None) -> Dict[str, ConnectResult]:
+    """
+    Connect devices concurrently, so the total time is about the slowest device
+    instead of the sum of all of them
+
+    Args:
+        serials: device serials or adb device instances
+        max_workers: devices started at the same time
+
+    Returns:
+        serial -> ConnectResult(device, error, timings), in the order of serials
+
+    Example:
+        results = connect_many(["cff1123ea", "10.0.0.1:5555"])
+        for serial, r in results.items():
+            print(serial, r.error or r.timings)
+    """
+    def _connect(serial) -> ConnectResult:
+        start = time.perf_counter()
+        try:
+            d = connect_usb(serial, port=port, transport=transport)
+        except Exception as e:
+            logger.debug("connect %s error: %s", serial, e)
+            return ConnectResult(None, e, {"total": time.perf_counter() - start})
+        return ConnectResult(d, None, {**d.startup_timings, "total": time.perf_counter() - start})
+
+    serials = list(serials)
+    keys = [s.serial if isinstance(s, adbutils.AdbDevice) else s for s in serials]
+    if not serials:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(serials)), thread_name_prefix="u2-connect") as executor:
+        return dict(zip(keys, executor.map(_connect, serials)))
@@ -9,6 +9,7 @@ import logging
 import pathlib
 import shutil
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 import adbutils
 
@@ -40,11 +41,18 @@ def cmd_init(args):
         logger.debug("install apk to %s", d.serial)
         d._setup_jar()
     else:
-        for dev in adbutils.adb.iter_device():
-            d = u2.connect(dev, port=args.port)
-            logger.debug("install apk to %s", d.serial)
-            d._setup_jar()
-            d._setup_ime()
+        # connect already pushes u2.jar
+        results = u2.connect_many(adbutils.adb.iter_device(), port=args.port)
+        devices = []
+        for serial, r in results.items():
+            if r.error:
+                logger.error("init %s failed: %s", serial, r.error)
+                continue
+            logger.debug("init %s, timings: %s", serial, {k: round(v, 3) for k, v in r.timings.items()})
+            devices.append(r.device)
+        if devices:
+            with ThreadPoolExecutor(max_workers=len(devices)) as executor:
+                list(executor.map(lambda d: d._setup_ime(), devices))
 
 
 def cmd_purge(args):
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""JSON codec for jsonrpc payloads and results
+
+The fastest installed library of orjson, msgspec and ujson is used,
+stdlib json is the fallback. Override with set_codec(name) or env
+UIAUTOMATOR2_JSON_CODEC.
+"""
+
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+Buffer = Union[bytes, bytearray, memoryview, str]
+
+
+class JSONCodec(NamedTuple):
+    name: str
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[Buffer], Any]
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj).encode("utf-8")
+
+
+def _stdlib_loads(data: Buffer) -> Any:
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+def _ascii_dumps(fast_dumps: Callable[[Any], bytes]) -> Callable[[Any], bytes]:
+    """ Fast libraries emit raw UTF-8, but the server expects ascii
+    escaped text like stdlib json.dumps, fallback for those rare payloads """
+    def dumps(obj: Any) -> bytes:
+        try:
+            data = fast_dumps(obj)
+        except TypeError:
+            return _stdlib_dumps(obj)
+        if data.isascii():
+            return data
+        return _stdlib_dumps(obj)
+    return dumps
+
+
+def _load_orjson() -> JSONCodec:
+    import orjson
+    return JSONCodec("orjson", _ascii_dumps(orjson.dumps), orjson.loads)
+
+
+def _load_msgspec() -> JSONCodec:
+    import msgspec
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+    return JSONCodec("msgspec", _ascii_dumps(encoder.encode), decoder.decode)
+
+
+def _load_ujson() -> JSONCodec:
+    import ujson
+
+    def loads(data: Buffer) -> Any:
+        if isinstance(data, (bytearray, memoryview)):
+            data = bytes(data)
+        return ujson.loads(data)
+    return JSONCodec("ujson", _ascii_dumps(lambda obj: ujson.dumps(obj).encode("utf-8")), loads)
+
+
+def _load_stdlib() -> JSONCodec:
+    return JSONCodec("json", _stdlib_dumps, _stdlib_loads)
+
+
+# ordered by speed
+_LOADERS: Dict[str, Callable[[], JSONCodec]] = {
+    "orjson": _load_orjson,
+    "msgspec": _load_msgspec,
+    "ujson": _load_ujson,
+    "json": _load_stdlib,
+}
+
+
+def available_codecs() -> List[JSONCodec]:
+    codecs = []
+    for loader in _LOADERS.values():
+        try:
+            codecs.append(loader())
+        except ImportError:
+            pass
+    return codecs
+
+
+def get_codec(name: Optional[str] = None) -> JSONCodec:
+    """
+    Args:
+        name: one of orjson, msgspec, ujson, json. None means the fastest installed
+
+    Raises:
+        ValueError, ImportError
+    """
+    if name:
+        if name not in _LOADERS:
+            raise ValueError(f"codec must be one of {list(_LOADERS)}, got {name!r}")
+        return _LOADERS[name]()
+    return available_codecs()[0]
+
+
+_codec = get_codec(os.getenv("UIAUTOMATOR2_JSON_CODEC"))
+logger.debug("json codec: %s", _codec.name)
+
+
+def set_codec(name: Optional[str] = None) -> JSONCodec:
+    global _codec
+    _codec = get_codec(name)
+    return _codec
+
+
+def current_codec() -> JSONCodec:
+    return _codec
+
+
+def dumps(obj: Any) -> bytes:
+    return _codec.dumps(obj)
+
+
+def loads(data: Buffer) -> Any:
+    return _codec.loads(data)
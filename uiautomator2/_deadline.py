@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Time budget of a composite operation, shared by every call inside it
+
+Calls of a thread inside deadline never outlive it: http timeouts, retries,
+poll sleeps, element waits and server restarts are cut to the remaining budget
+
+    with d.deadline(5):
+        d(text="OK").click()
+        d.xpath("//*[@text='Done']").wait()
+"""
+
+import contextlib
+import threading
+import time
+from typing import Iterator, Optional
+
+from uiautomator2.exceptions import DeadlineExceededError
+
+# seconds kept for the round trip of a call which waits on server side,
+# so the server gives up before the http request does
+RPC_RESERVE = .5
+
+_local = threading.local()
+
+
+def current_deadline() -> Optional[float]:
+    """ time.monotonic() of the innermost deadline, None when there is none """
+    return getattr(_local, "deadline", None)
+
+
+def remaining() -> Optional[float]:
+    """ seconds left, None when there is no deadline """
+    deadline = current_deadline()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def check(what: str = "operation"):
+    """
+    Raises:
+        DeadlineExceededError
+    """
+    if expired():
+        raise DeadlineExceededError(f"{what} exceeded deadline")
+
+
+def bound(timeout: float, reserve: float = 0.0) -> float:
+    """Cut timeout to the remaining budget minus reserve
+
+    Raises:
+        DeadlineExceededError: no budget left
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceededError("deadline exceeded")
+    return max(0.0, min(timeout, left - reserve))
+
+
+def sleep(seconds: float):
+    """ like time.sleep, but raise DeadlineExceededError instead of sleeping past deadline """
+    left = remaining()
+    if left is not None and left < seconds:
+        time.sleep(max(0.0, left))
+        raise DeadlineExceededError("deadline exceeded while sleeping")
+    time.sleep(seconds)
+
+
+@contextlib.contextmanager
+def deadline(seconds: float) -> Iterator[None]:
+    """ calls made by current thread inside must finish within seconds, nested deadlines never extend an outer one """
+    if seconds < 0:
+        raise ValueError(f"seconds must be >= 0, got {seconds}")
+    old = current_deadline()
+    new = time.monotonic() + seconds
+    _local.deadline = new if old is None else min(old, new)
+    try:
+        yield
+    finally:
+        _local.deadline = old
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""One captured screen, kept as received and decoded on demand"""
+
+import copy
+import io
+import os
+import threading
+import time
+from typing import Any, Optional, Tuple, Union
+
+from PIL import Image
+
+from uiautomator2._screencap import RawScreen
+from uiautomator2.utils import image_convert, image_decode
+
+# file extensions which can hold the original bytes of an encoding as is
+_EXTENSIONS = {"jpeg": (".jpg", ".jpeg"), "png": (".png",)}
+
+
+def _sniff(data: bytes) -> Optional[str]:
+    if data.startswith(b"\xff\xd8"):
+        return "jpeg"
+    if data.startswith(b"\x89PNG"):
+        return "png"
+    return None
+
+
+class ScreenFrame:
+    """Screenshot with its original bytes and capture metadata
+
+    Decodes happen on first access of pil, opencv or gray and are cached,
+    so callers needing different formats share one decode.
+
+    Attributes:
+        data: encoded bytes as received, None for raw and cropped frames
+        encoding: "jpeg", "png", "raw" or None (built from a decoded image)
+        timestamp: time.time() when captured
+        display_id: display the screen was captured from, None for default
+        scale: image size relative to the screen, screen coordinates * scale = pixel coordinates
+
+    Example:
+        frame = d.screenshot(format="frame")
+        frame.save("screen.jpg") # writes the received JPEG, no re-encode
+        button = frame.crop((0, 100, 200, 180)).opencv # slice of the decoded screen
+    """
+    def __init__(self,
+                 data: Optional[bytes] = None,
+                 *,
+                 raw: Optional[RawScreen] = None,
+                 image: Optional[Image.Image] = None,
+                 timestamp: Optional[float] = None,
+                 display_id: Optional[int] = None,
+                 scale: float = 1.0):
+        if data is None and raw is None and image is None:
+            raise ValueError("one of data, raw and image is required")
+        self.data = data
+        self.raw = raw
+        self.encoding = _sniff(data) if data is not None else "raw" if raw is not None else None
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.display_id = display_id
+        self.scale = scale
+        self._pil = image
+        self._opencv = None
+        self._gray = None
+        # set on a crop, which decodes from its parent
+        self._parent: Optional["ScreenFrame"] = None
+        self._box: Tuple[int, int, int, int] = (0, 0, 0, 0)
+        self._mutex = threading.Lock()
+
+    def __repr__(self) -> str:
+        width, height = self.size
+        return f"<ScreenFrame {width}x{height} encoding={self.encoding}>"
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """ (width, height), read from the image header when not decoded yet """
+        if self._parent is not None:
+            left, top, right, bottom = self._box
+            return right - left, bottom - top
+        if self.raw is not None:
+            return self.raw.width, self.raw.height
+        if self._pil is not None:
+            return self._pil.size
+        return Image.open(io.BytesIO(self.data)).size
+
+    def _cached(self, name: str, decode) -> Any:
+        value = getattr(self, name)
+        if value is None:
+            # decode outside the lock is wasted at worst, so concurrent callers never block on each other long
+            value = decode()
+            with self._mutex:
+                if getattr(self, name) is None:
+                    setattr(self, name, value)
+                value = getattr(self, name)
+        return value
+
+    @property
+    def pil(self) -> Image.Image:
+        return self._cached("_pil", self._decode_pil)
+
+    def _decode_pil(self) -> Image.Image:
+        if self._parent is not None:
+            return self._parent.pil.crop(self._box)
+        if self.raw is not None:
+            return self.raw.to_pil()
+        image = Image.open(io.BytesIO(self.data))
+        image.load()
+        return image
+
+    @property
+    def opencv(self):
+        """ BGR np.ndarray """
+        return self._cached("_opencv", self._decode_opencv)
+
+    def _decode_opencv(self):
+        if self._parent is not None:
+            left, top, right, bottom = self._box
+            return self._parent.opencv[top:bottom, left:right]
+        if self.raw is not None:
+            return self.raw.to_opencv()
+        if self.data is not None and self._pil is None:
+            return image_decode(self.data, "opencv")
+        return image_convert(self.pil, "opencv")
+
+    @property
+    def gray(self):
+        """ grayscale np.ndarray """
+        return self._cached("_gray", self._decode_gray)
+
+    def _decode_gray(self):
+        if self._parent is not None:
+            left, top, right, bottom = self._box
+            return self._parent.gray[top:bottom, left:right]
+        import cv2
+        import numpy as np
+        if self.data is not None and self._opencv is None:
+            return cv2.imdecode(np.frombuffer(self.data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        return cv2.cvtColor(self.opencv, cv2.COLOR_BGR2GRAY)
+
+    def convert(self, format: str):
+        """ format: pillow, opencv, gray or raw(RGBA view of a raw frame) """
+        if format == "pillow":
+            return self.pil
+        if format == "opencv":
+            return self.opencv
+        if format == "gray":
+            return self.gray
+        if format == "raw" and self.raw is not None:
+            return self.raw.to_ndarray()
+        raise ValueError("Unsupported format:", format)
+
+    def crop(self, box: Tuple[int, int, int, int]) -> "ScreenFrame":
+        """Part of the screen, box is (left, top, right, bottom)
+
+        The crop is taken from decodes of this frame, slices of its ndarrays
+        share their memory.
+        """
+        width, height = self.size
+        left, top, right, bottom = (int(v) for v in box)
+        left, top = max(0, left), max(0, top)
+        right, bottom = min(width, right), min(height, bottom)
+        if left >= right or top >= bottom:
+            raise ValueError("empty crop box", box)
+        frame = copy.copy(self)
+        frame.data = frame.raw = frame.encoding = None
+        frame._pil = frame._opencv = frame._gray = None
+        frame._parent = self
+        frame._box = (left, top, right, bottom)
+        frame._mutex = threading.Lock()
+        return frame
+
+    def save(self, fp: Union[str, os.PathLike, io.IOBase], format: Optional[str] = None):
+        """ write original bytes when the file extension matches the encoding, otherwise encode with PIL """
+        if self.data is not None and isinstance(fp, (str, os.PathLike)) and format is None:
+            if os.path.splitext(os.fspath(fp))[1].lower() in _EXTENSIONS.get(self.encoding, ()):
+                with open(fp, "wb") as f:
+                    f.write(self.data)
+                return
+        self.pil.save(fp, format=format)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Cache of the last window hierarchy dump, dropped by any action which may change the screen"""
+
+import collections
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Tuple, Union
+
+# shell commands which only read device state, they keep the cached hierarchy
+READONLY_SHELL_COMMANDS = (
+    ("ps",), ("pidof",), ("getprop",), ("dumpsys",), ("cat",), ("ls",),
+    ("pm", "list"), ("pm", "path"), ("settings", "get"), ("wm", "size"), ("wm", "density"),
+)
+
+
+def is_readonly_shell(cmdargs: Union[str, List[str]]) -> bool:
+    if isinstance(cmdargs, str):
+        # compound commands, redirects and substitutions may do anything
+        if any(c in cmdargs for c in ";&|<>`$\n"):
+            return False
+        words = tuple(cmdargs.split())
+    else:
+        words = tuple(str(arg) for arg in cmdargs)
+    return any(words[:len(prefix)] == prefix for prefix in READONLY_SHELL_COMMANDS)
+
+
+class HierarchyCache:
+    """Queries right after each other share one dump
+
+    A dump is reused while it is younger than max_age and no action ran
+    since it started. A dump which overlapped an action is not kept.
+    """
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._generation = 0 # increased by every invalidate
+        self._entries: Dict[Hashable, Tuple[float, str]] = {} # key -> (time.monotonic() of dump start, content)
+        self._counts: Dict[str, int] = collections.Counter()
+
+    def get(self, key: Hashable, load: Callable[[], str], max_age: float) -> str:
+        """ cached content of key, or load() when missing or older than max_age seconds """
+        if max_age <= 0:
+            return load()
+        with self._mutex:
+            entry = self._entries.get(key)
+            start = time.monotonic()
+            if entry is not None and start - entry[0] <= max_age:
+                self._counts["hits"] += 1
+                return entry[1]
+            self._counts["misses"] += 1
+            generation = self._generation
+        content = load()
+        with self._mutex:
+            if generation == self._generation:
+                self._entries[key] = (start, content)
+        return content
+
+    def invalidate(self):
+        with self._mutex:
+            self._generation += 1
+            if self._entries:
+                self._entries.clear()
+                self._counts["invalidations"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """ hits, misses, invalidations(cached dumps dropped) """
+        with self._mutex:
+            return {key: self._counts[key] for key in ("hits", "misses", "invalidations")}
+
+    def reset_stats(self):
+        with self._mutex:
+            self._counts.clear()
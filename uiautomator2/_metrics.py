@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Always-on counters and latency histograms of jsonrpc calls"""
+
+import bisect
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# connect: open connection, only when no kept-alive connection is reused
+# send: write request, wait: until response headers arrive, read: read body
+PHASES = ("connect", "send", "wait", "read")
+
+# upper bounds in seconds, the last bucket is +Inf
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"count": self.count, "sum": self.sum, "buckets": list(self.counts)}
+
+
+class MethodStats:
+    __slots__ = ("calls", "errors", "coalesced", "bytes_in", "bytes_out", "latency", "phases")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.coalesced = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.latency = Histogram()
+        self.phases = {phase: Histogram() for phase in PHASES}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "coalesced": self.coalesced,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "latency": self.latency.snapshot(),
+            "phases": {phase: h.snapshot() for phase, h in self.phases.items()},
+        }
+
+
+class RPCStats:
+    """Per jsonrpc method call count, error count, bytes and latency histograms
+
+    Example:
+        stats = d.rpc_stats()
+        stats.snapshot()["click"]["latency"]["sum"]
+        print(stats.to_prometheus())
+        stats.reset()
+    """
+    def __init__(self, labels: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            labels: extra labels in prometheus export, e.g. serial
+        """
+        self.labels = dict(labels or {})
+        self._methods: Dict[str, MethodStats] = {}
+        self._mutex = threading.Lock()
+
+    def _method_stats(self, method: str) -> MethodStats:
+        stats = self._methods.get(method)
+        if stats is None:
+            stats = self._methods[method] = MethodStats()
+        return stats
+
+    def record(self, method: str, elapsed: float, timings: Optional[Dict[str, float]] = None, bytes_out: int = 0, bytes_in: int = 0, error: bool = False):
+        with self._mutex:
+            stats = self._method_stats(method)
+            stats.calls += 1
+            stats.errors += error
+            stats.bytes_out += bytes_out
+            stats.bytes_in += bytes_in
+            stats.latency.observe(elapsed)
+            for phase, value in (timings or {}).items():
+                stats.phases[phase].observe(value)
+
+    def record_coalesced(self, method: str):
+        """ a call which shared the round trip of an identical one in flight """
+        with self._mutex:
+            self._method_stats(method).coalesced += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._mutex:
+            return {method: stats.snapshot() for method, stats in self._methods.items()}
+
+    def reset(self):
+        with self._mutex:
+            self._methods.clear()
+
+    def _format_labels(self, **labels: str) -> str:
+        items = {**self.labels, **labels}
+        return ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in items.items())
+
+    def to_prometheus(self) -> str:
+        """ export in prometheus text exposition format """
+        snapshot = self.snapshot()
+        lines: List[str] = []
+
+        def counter(name: str, key: str, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for method, stats in snapshot.items():
+                lines.append(f"{name}{{{self._format_labels(method=method)}}} {stats[key]}")
+
+        counter("uiautomator2_rpc_calls_total", "calls", "jsonrpc calls")
+        counter("uiautomator2_rpc_errors_total", "errors", "failed jsonrpc calls")
+        counter("uiautomator2_rpc_coalesced_total", "coalesced", "calls coalesced into an identical call in flight")
+        counter("uiautomator2_rpc_bytes_in_total", "bytes_in", "response bytes")
+        counter("uiautomator2_rpc_bytes_out_total", "bytes_out", "request bytes")
+
+        name = "uiautomator2_rpc_duration_seconds"
+        lines.append(f"# HELP {name} jsonrpc latency, phase total or one of {','.join(PHASES)}")
+        lines.append(f"# TYPE {name} histogram")
+        for method, stats in snapshot.items():
+            histograms: List[Tuple[str, Dict[str, Any]]] = [("total", stats["latency"])] + list(stats["phases"].items())
+            for phase, h in histograms:
+                cumulative = 0
+                for bound, count in zip(BUCKETS + (float("inf"),), h["buckets"]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{{{self._format_labels(method=method, phase=phase, le=le)}}} {cumulative}")
+                lines.append(f"{name}_sum{{{self._format_labels(method=method, phase=phase)}}} {h['sum']}")
+                lines.append(f"{name}_count{{{self._format_labels(method=method, phase=phase)}}} {h['count']}")
+        return "\n".join(lines) + "\n"
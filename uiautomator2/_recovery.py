@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Recovery policy of jsonrpc calls: retry transient errors on a fresh
+connection, restart uiautomator2 server only when needed, and stop
+restart storms with a rate limiter and a circuit breaker"""
+
+import collections
+import http.client
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Optional
+
+import adbutils
+
+from uiautomator2.exceptions import CircuitOpenError, HTTPError, HTTPTimeoutError, UiAutomationNotConnectedError
+
+logger = logging.getLogger(__name__)
+
+# error classes
+TRANSIENT = "transient" # retry on a fresh connection, restart when retries are used up, see maybe_delivered
+RESTART = "restart" # server is gone or broken, restart it
+FATAL = "fatal" # raise to caller as is
+
+
+def classify_error(e: BaseException) -> str:
+    if isinstance(e, UiAutomationNotConnectedError):
+        return RESTART
+    if isinstance(e, (TimeoutError, HTTPTimeoutError)):
+        # maybe a slow call, retry would multiply the wait
+        return FATAL
+    if isinstance(e, HTTPError):
+        # nothing listens on device port
+        if isinstance(e.__cause__, (adbutils.AdbError, ConnectionRefusedError)):
+            return RESTART
+        return TRANSIENT
+    if isinstance(e, (ConnectionError, http.client.HTTPException)):
+        return TRANSIENT
+    return FATAL
+
+
+def maybe_delivered(e: BaseException) -> bool:
+    """ False when the request failed before reaching server, e.g. connection
+    not established, so sending it again can not run it twice """
+    if isinstance(e, HTTPError) and not isinstance(e, HTTPTimeoutError):
+        # raised by connect() of the transport
+        return not isinstance(e.__cause__, (adbutils.AdbError, OSError))
+    return True
+
+
+class RecoveryPolicy:
+    """Shared by all threads and instances of one (serial, port)
+
+    Attributes can be changed at runtime, e.g. d.recovery.retries = 0
+    """
+    def __init__(self,
+                 retries: int = 2,
+                 backoff: float = .05,
+                 max_backoff: float = 1.0,
+                 max_restarts: int = 3,
+                 restart_window: float = 60.0,
+                 breaker_threshold: int = 3,
+                 breaker_cooldown: float = 30.0):
+        """
+        Args:
+            retries: retries of a transient error before restart
+            backoff: base seconds of exponential backoff between retries, with jitter
+            max_restarts: restarts allowed within restart_window seconds, the circuit opens beyond it
+            breaker_threshold: consecutive failed restarts which open the circuit
+            breaker_cooldown: seconds no restart is tried after circuit opened
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+
+        # increased after every restart, so threads failed before it just retry
+        self.generation = 0
+        self._restart_lock = threading.Lock()
+        self._restart_times: Deque[float] = collections.deque()
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+        self._mutex = threading.Lock()
+        self._metrics: Dict[str, float] = collections.Counter()
+        self._last_restart_seconds: Optional[float] = None
+
+    def retry_delay(self, attempt: int) -> float:
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return delay * random.uniform(.5, 1.5)
+
+    def record_retry(self):
+        with self._mutex:
+            self._metrics["retries"] += 1
+
+    @property
+    def circuit_open(self) -> bool:
+        return time.monotonic() < self._open_until
+
+    def _open_circuit(self, reason: str):
+        logger.warning("uiautomator2 restart circuit open for %.0fs: %s", self.breaker_cooldown, reason)
+        self._open_until = time.monotonic() + self.breaker_cooldown
+        self._metrics["circuit_opens"] += 1
+
+    def restart(self, generation: int, do_restart: Callable[[], Any], error: BaseException):
+        """Restart server unless another thread already did after generation
+
+        Raises:
+            CircuitOpenError, UiAutomationError
+        """
+        with self._restart_lock:
+            if self.generation != generation:
+                logger.debug("server restarted by another thread, retry")
+                return
+            now = time.monotonic()
+            with self._mutex:
+                if self.circuit_open:
+                    self._metrics["rejected"] += 1
+                    raise CircuitOpenError("uiautomator2 server restart circuit is open", error) from error
+                while self._restart_times and self._restart_times[0] < now - self.restart_window:
+                    self._restart_times.popleft()
+                if len(self._restart_times) >= self.max_restarts:
+                    self._open_circuit(f"{len(self._restart_times)} restarts in {self.restart_window}s")
+                    self._restart_times.clear()
+                    self._metrics["rejected"] += 1
+                    raise CircuitOpenError("uiautomator2 server restarts too often", error) from error
+                self._restart_times.append(now)
+
+            logger.debug("restart uiautomator2 server, error: %s", error)
+            start = time.monotonic()
+            try:
+                do_restart()
+            except Exception:
+                with self._mutex:
+                    self._record_restart(time.monotonic() - start, failed=True)
+                    self._consecutive_failures += 1
+                    if self._consecutive_failures >= self.breaker_threshold:
+                        self._open_circuit(f"{self._consecutive_failures} restarts failed")
+                raise
+            finally:
+                self.generation += 1
+            with self._mutex:
+                self._record_restart(time.monotonic() - start, failed=False)
+                self._consecutive_failures = 0
+
+    def _record_restart(self, seconds: float, failed: bool):
+        self._metrics["restarts"] += 1
+        self._metrics["restart_failures"] += failed
+        self._metrics["restart_seconds"] += seconds
+        self._last_restart_seconds = seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        """ restarts, restart_failures, restart_seconds(total cost), last_restart_seconds,
+        retries, rejected(restarts refused), circuit_opens, circuit_open """
+        with self._mutex:
+            data = {key: self._metrics[key] for key in ("restarts", "restart_failures", "restart_seconds", "retries", "rejected", "circuit_opens")}
+            data["last_restart_seconds"] = self._last_restart_seconds
+            data["circuit_open"] = self.circuit_open
+            return data
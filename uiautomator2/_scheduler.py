@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Priority aware admission of jsonrpc calls and shell commands of one device
+
+Calls of a thread are interactive unless wrapped in rpc_priority:
+
+    with rpc_priority(BACKGROUND):
+        d.dump_hierarchy()
+"""
+
+import collections
+import contextlib
+import itertools
+import threading
+import time
+from typing import Any, Deque, Dict, Iterator, Optional
+
+from uiautomator2 import _deadline
+from uiautomator2.exceptions import DeadlineExceededError
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BACKGROUND, BULK) # highest first
+
+# concurrent calls per class, None means unlimited
+DEFAULT_LIMITS: Dict[str, Optional[int]] = {INTERACTIVE: None, BACKGROUND: 1, BULK: 1}
+
+_local = threading.local()
+
+
+def current_priority() -> str:
+    return getattr(_local, "priority", INTERACTIVE)
+
+
+@contextlib.contextmanager
+def rpc_priority(priority: str) -> Iterator[None]:
+    """ calls made by current thread inside are scheduled with priority """
+    if priority not in PRIORITIES:
+        raise ValueError(f"priority must be one of {PRIORITIES}, got {priority!r}")
+    old = current_priority()
+    _local.priority = priority
+    try:
+        yield
+    finally:
+        _local.priority = old
+
+
+class PriorityScheduler:
+    """Every class has a concurrency limit and is served in FIFO order.
+    A call waits while a call of a higher class is running or waiting, but
+    never longer than max_defer seconds, so lower classes are not starved.
+    Interactive calls never wait for lower classes.
+    """
+    def __init__(self, limits: Optional[Dict[str, Optional[int]]] = None, max_defer: float = 2.0):
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.max_defer = max_defer
+        self._cond = threading.Condition()
+        self._running = {p: 0 for p in PRIORITIES}
+        self._waiting: Dict[str, Deque[int]] = {p: collections.deque() for p in PRIORITIES}
+        self._tickets = itertools.count()
+        self._local = threading.local() # slot held by current thread, nested calls reuse it
+        self._stats = {p: {"calls": 0, "deferred": 0, "wait_seconds": 0.0} for p in PRIORITIES}
+
+    def _higher_busy(self, priority: str) -> bool:
+        for p in PRIORITIES:
+            if p == priority:
+                return False
+            if self._running[p] or self._waiting[p]:
+                return True
+        return False
+
+    def _can_run(self, priority: str, ticket: int, deadline: float) -> bool:
+        if self._waiting[priority][0] != ticket:
+            return False
+        limit = self.limits[priority]
+        if limit is not None and self._running[priority] >= limit:
+            return False
+        return time.monotonic() >= deadline or not self._higher_busy(priority)
+
+    @contextlib.contextmanager
+    def slot(self, priority: Optional[str] = None) -> Iterator[None]:
+        """ hold a slot of priority(default current_priority()) while running one call """
+        if getattr(self._local, "held", False):
+            yield
+            return
+        priority = priority or current_priority()
+        start = time.monotonic()
+        deadline = start + self.max_defer
+        with self._cond:
+            ticket = next(self._tickets)
+            queue = self._waiting[priority]
+            queue.append(ticket)
+            budget_end = _deadline.current_deadline()
+            try:
+                while not self._can_run(priority, ticket, deadline):
+                    now = time.monotonic()
+                    wait = max(0.0, deadline - now) or None
+                    if budget_end is not None:
+                        if now >= budget_end:
+                            raise DeadlineExceededError(f"{priority} call exceeded deadline waiting for a slot")
+                        wait = min(wait or budget_end - now, budget_end - now)
+                    self._cond.wait(wait)
+            finally:
+                queue.remove(ticket)
+            self._running[priority] += 1
+            waited = time.monotonic() - start
+            stats = self._stats[priority]
+            stats["calls"] += 1
+            stats["wait_seconds"] += waited
+            stats["deferred"] += waited > 0.001
+            self._cond.notify_all()
+        self._local.held = True
+        try:
+            yield
+        finally:
+            self._local.held = False
+            with self._cond:
+                self._running[priority] -= 1
+                self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """ per class: calls, deferred(calls which waited), wait_seconds, running, waiting """
+        with self._cond:
+            return {p: {**self._stats[p], "running": self._running[p], "waiting": len(self._waiting[p])} for p in PRIORITIES}
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Raw framebuffer screenshot by adb exec-out screencap
+
+No PNG/JPEG encode on device and no decode on host: pixels are received into
+one buffer and exposed as a numpy view of it. About 8MB for a 1080x1920
+screen, so it only pays off on a fast link such as USB.
+"""
+
+import struct
+from typing import NamedTuple, Optional
+
+import adbutils
+from PIL import Image
+
+from uiautomator2 import _deadline
+from uiautomator2.exceptions import AdbShellError
+
+# android.graphics.PixelFormat of 4 bytes per pixel -> channel order
+PIXEL_FORMATS = {1: "RGBA", 2: "RGBX", 5: "BGRA"}
+_HEADER = struct.Struct("<III") # width, height, format
+# android 8+ appends a 4 bytes color space to the header
+_HEADER_EXTRA = 4
+_MAX_PIXELS = 8192 * 8192
+
+
+class RawScreen(NamedTuple):
+    width: int
+    height: int
+    mode: str # one of PIXEL_FORMATS values
+    buffer: memoryview # width * height * 4 bytes
+
+    def to_ndarray(self):
+        """ numpy view of buffer in shape (height, width, 4), no copy """
+        import numpy as np
+        return np.frombuffer(self.buffer, dtype=np.uint8).reshape(self.height, self.width, 4)
+
+    def to_pil(self) -> Image.Image:
+        rawmode = "BGRX" if self.mode == "BGRA" else "RGBX"
+        return Image.frombytes("RGB", (self.width, self.height), self.buffer, "raw", rawmode)
+
+    def to_opencv(self):
+        """ BGR ndarray """
+        import cv2
+        code = cv2.COLOR_BGRA2BGR if self.mode == "BGRA" else cv2.COLOR_RGBA2BGR
+        return cv2.cvtColor(self.to_ndarray(), code)
+
+
+def _recv_into(sock, view: memoryview) -> int:
+    """ fill view until it is full or the stream ends, return bytes received """
+    received = 0
+    while received < len(view):
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            break
+        received += n
+    return received
+
+
+def capture(dev: adbutils.AdbDevice, display_id: Optional[int] = None, timeout: float = 10) -> RawScreen:
+    """
+    Args:
+        display_id: physical display id passed to screencap -d
+
+    Raises:
+        AdbShellError: screencap failed or output is not a supported framebuffer
+    """
+    command = "exec:screencap" if display_id is None else f"exec:screencap -d {display_id}"
+    try:
+        c = dev.open_transport(timeout=_deadline.bound(timeout))
+        c.send_command(command)
+        c.check_okay()
+    except adbutils.AdbError as e:
+        raise AdbShellError(e)
+    try:
+        sock = c.conn
+        header = bytearray(_HEADER.size)
+        if _recv_into(sock, memoryview(header)) < _HEADER.size:
+            raise AdbShellError("screencap output too short", bytes(header))
+        width, height, pixel_format = _HEADER.unpack(header)
+        mode = PIXEL_FORMATS.get(pixel_format)
+        if mode is None or not 0 < width * height <= _MAX_PIXELS:
+            raise AdbShellError(f"unsupported screencap output: {width}x{height} format {pixel_format}", bytes(header))
+        size = width * height * 4
+        buf = memoryview(bytearray(_HEADER_EXTRA + size))
+        received = _recv_into(sock, buf)
+        if received < size:
+            raise AdbShellError(f"screencap output truncated: {received} of {size} bytes")
+        # pixels are the last size bytes, whether the header was extended or not
+        return RawScreen(width, height, mode, buf[received - size:received])
+    finally:
+        c.close()
@@ -6,6 +6,7 @@ from typing import Dict, List, Optional, Tuple
 from PIL import Image
 from retry import retry
 
+from uiautomator2 import _deadline
 from uiautomator2._proto import SCROLL_STEPS
 from uiautomator2.exceptions import HTTPError, UiObjectNotFoundError
 from uiautomator2.utils import Exists, intersect
@@ -305,6 +306,8 @@ class UiObject(object):
         """
         if timeout is None:
             timeout = self.wait_timeout
+        # server side wait ends before the deadline, the result is still received
+        timeout = _deadline.bound(timeout, reserve=_deadline.RPC_RESERVE)
         http_wait = timeout + 10
         if exists:
             try:
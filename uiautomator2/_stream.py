@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Screenshots captured continuously by background threads
+
+Captures are pipelined: several are in flight at once, so the frame rate is
+not limited by the round trip of one capture. Only the newest frames are
+kept, older ones are dropped and counted.
+"""
+
+import collections
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Optional
+
+from uiautomator2._frame import ScreenFrame
+from uiautomator2._scheduler import current_priority, rpc_priority
+
+
+class ScreenshotStream:
+    """Iterator of the freshest ScreenFrame
+
+    Example:
+        with d.screenshot_stream(fps=10, scale=0.5) as stream:
+            for frame in stream:
+                process(frame.opencv)
+        print(stream.stats())
+    """
+    def __init__(self, capture: Callable[[], ScreenFrame], fps: Optional[float] = None, maxsize: int = 1,
+                 pipeline: int = 2, priority: Optional[str] = None):
+        """
+        Args:
+            capture: takes one screenshot
+            fps: max captures per second, None means as fast as possible
+            maxsize: frames kept for the consumer, older ones are dropped
+            pipeline: captures in flight at the same time
+            priority: scheduler class of the captures, default is the one of the creating thread
+        """
+        if maxsize < 1 or pipeline < 1:
+            raise ValueError("maxsize and pipeline must be >= 1")
+        if fps is not None and fps <= 0:
+            raise ValueError("fps must be > 0", fps)
+        self._capture = capture
+        self._interval = 1 / fps if fps else 0.0
+        self._pipeline = pipeline
+        self._priority = priority or current_priority()
+        self._frames: Deque[ScreenFrame] = collections.deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        self._next_start = 0.0 # time.monotonic() the next capture may start
+        self._ticket = 0 # order of capture starts, a frame older than the newest one is dropped
+        self._newest_ticket = -1
+        self._latest: Optional[ScreenFrame] = None
+        self._error: Optional[BaseException] = None
+        self._counts: Dict[str, int] = collections.Counter()
+
+    def start(self) -> "ScreenshotStream":
+        for i in range(self._pipeline):
+            th = threading.Thread(target=self._produce, name=f"screenshot-stream-{i}", daemon=True)
+            th.start()
+            self._threads.append(th)
+        return self
+
+    def close(self):
+        """ stop capturing, frames already captured can still be read """
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        for th in self._threads:
+            if th is not threading.current_thread():
+                th.join()
+
+    @property
+    def closed(self) -> bool:
+        return self._stop.is_set()
+
+    def __enter__(self) -> "ScreenshotStream":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _reserve(self) -> Optional[int]:
+        """ wait for the fps slot of the next capture, return its ticket or None when stopped """
+        with self._cond:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self._interval
+            ticket = self._ticket
+            self._ticket += 1
+        if start > now and self._stop.wait(start - now):
+            return None
+        return None if self._stop.is_set() else ticket
+
+    def _produce(self):
+        with rpc_priority(self._priority):
+            while True:
+                ticket = self._reserve()
+                if ticket is None:
+                    return
+                try:
+                    frame = self._capture()
+                except BaseException as e:
+                    with self._cond:
+                        self._error = self._error or e
+                        self._stop.set()
+                        self._cond.notify_all()
+                    return
+                self._put(ticket, frame)
+
+    def _put(self, ticket: int, frame: ScreenFrame):
+        with self._cond:
+            self._counts["captured"] += 1
+            if ticket < self._newest_ticket:
+                # a capture started later finished first
+                self._counts["dropped"] += 1
+                return
+            self._newest_ticket = ticket
+            if len(self._frames) == self._frames.maxlen:
+                self._counts["dropped"] += 1
+            self._frames.append(frame)
+            self._latest = frame
+            self._cond.notify_all()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[ScreenFrame]:
+        """Oldest kept frame, the freshest when maxsize is 1, waits for one
+        unless timeout seconds pass first
+
+        Returns:
+            None on timeout or when the stream is closed and drained
+
+        Raises:
+            the error of a failed capture, which also closed the stream
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._frames:
+                if self._error is not None:
+                    raise self._error
+                if self._stop.is_set():
+                    return None
+                left = None if deadline is None else deadline - time.monotonic()
+                if left is not None and left <= 0:
+                    return None
+                self._cond.wait(left)
+            self._counts["delivered"] += 1
+            return self._frames.popleft()
+
+    def latest(self) -> Optional[ScreenFrame]:
+        """ newest frame captured so far, even when it was read before, never waits """
+        return self._latest
+
+    def __iter__(self) -> "ScreenshotStream":
+        return self
+
+    def __next__(self) -> ScreenFrame:
+        frame = self.get()
+        if frame is None:
+            raise StopIteration
+        return frame
+
+    def stats(self) -> Dict[str, Any]:
+        """ captured, delivered and dropped frame counts, queued frames """
+        with self._cond:
+            data = {key: self._counts[key] for key in ("captured", "delivered", "dropped")}
+            data["queued"] = len(self._frames)
+            return data
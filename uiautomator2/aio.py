@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""asyncio client of uiautomator2 server
+
+Every in-flight call is a coroutine instead of an OS thread, so one process
+can drive many devices. Server lifecycle (push jar, launch, restart) still goes
+through the blocking BasicUiautomatorServer, which runs in the default executor.
+
+Example:
+    from uiautomator2 import aio
+
+    async def main():
+        d = await aio.connect("Q5S5T19611004599")
+        await d(text="Settings").click()
+        await d.xpath("//*[@text='Display']").click()
+"""
+
+import asyncio
+import base64
+import collections
+import functools
+import logging
+import time
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+import adbutils
+
+import uiautomator2
+from uiautomator2 import _codec
+from uiautomator2._proto import HTTP_TIMEOUT, SCROLL_STEPS
+from uiautomator2._recovery import FATAL, TRANSIENT, classify_error, maybe_delivered
+from uiautomator2._selector import Selector
+from uiautomator2.abstract import ShellResponse
+from uiautomator2.core import DEFAULT_POOL_IDLE_TIMEOUT, DEFAULT_POOL_MAXSIZE, DEFAULT_SERVER_PORT, Transport, \
+    _jsonrpc_result
+from uiautomator2.exceptions import AdbShellError, HierarchyEmptyError, HTTPError, HTTPTimeoutError, \
+    UiAutomationNotConnectedError, UiObjectNotFoundError, XPathElementNotFoundError
+from uiautomator2.utils import image_convert, image_decode, list2cmdline
+from uiautomator2.xpath import PageSource, XPathSelector
+
+logger = logging.getLogger(__name__)
+
+_StreamPair = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+async def _adb_open(dev: adbutils.AdbDevice, service: str) -> _StreamPair:
+    """Open an adb stream to device service, e.g. tcp:9008 or shell:ls
+
+    Raises:
+        adbutils.AdbError
+    """
+    client = dev._client
+    reader, writer = await asyncio.open_connection(client.host, client.port)
+    try:
+        for cmd in (f"host:transport:{dev.serial}", service):
+            data = cmd.encode("utf-8")
+            writer.write("{:04x}".format(len(data)).encode() + data)
+            status = await reader.readexactly(4)
+            if status == b"FAIL":
+                length = int(await reader.readexactly(4), 16)
+                message = await reader.readexactly(length)
+                raise adbutils.AdbError(message.decode("utf-8", errors="replace"))
+            if status != b"OKAY":
+                raise adbutils.AdbError(f"Unknown data: {status!r}")
+    except BaseException:
+        writer.close()
+        raise
+    return reader, writer
+
+
+async def _read_http_response(reader: asyncio.StreamReader) -> Tuple[int, str, bytes, bool]:
+    """
+    Returns:
+        (status, reason, content, will_close)
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("remote end closed connection without response")
+    version, status, *reason = status_line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+
+    will_close = headers.get("connection", "").lower() == "close" or version == "HTTP/1.0"
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        content = bytearray()
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                await reader.readline()
+                break
+            content.extend(await reader.readexactly(size))
+            await reader.readline()
+    elif "content-length" in headers:
+        content = await reader.readexactly(int(headers["content-length"]))
+    else:
+        content = await reader.read()
+        will_close = True
+    return int(status), (reason or [""])[0], bytes(content), will_close
+
+
+class AsyncHTTPConnectionPool:
+    """asyncio version of core.HTTPConnectionPool"""
+    def __init__(self, dev: adbutils.AdbDevice, port: int, maxsize: int = DEFAULT_POOL_MAXSIZE, idle_timeout: float = DEFAULT_POOL_IDLE_TIMEOUT, transport: Optional[Transport] = None):
+        """
+        Args:
+            transport: connect to transport.address() when it is plain TCP, otherwise use adb stream
+        """
+        self._dev = dev
+        self._port = port
+        self._transport = transport
+        self._address: Optional[Tuple[str, int]] = None
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self._idle: Deque[Tuple[float, _StreamPair]] = collections.deque()
+
+    async def _open_connection(self) -> _StreamPair:
+        if self._transport is not None and self._address is None:
+            # adb forward may be created here, which is blocking
+            loop = asyncio.get_running_loop()
+            self._address = await loop.run_in_executor(None, self._transport.address)
+        try:
+            if self._address:
+                return await asyncio.open_connection(*self._address)
+            return await _adb_open(self._dev, f"tcp:{self._port}")
+        except (adbutils.AdbError, OSError) as e:
+            raise HTTPError(f"Unable to connect to uiautomator2 server: {e}") from e
+
+    async def _get(self) -> Tuple[_StreamPair, bool]:
+        deadline = time.monotonic() - self.idle_timeout
+        while self._idle and self._idle[0][0] < deadline:
+            self._idle.popleft()[1][1].close()
+        while self._idle:
+            reader, writer = conn = self._idle.pop()[1]
+            # closed by server while idle
+            if not (reader.at_eof() or writer.is_closing()):
+                return conn, True
+            writer.close()
+        return await self._open_connection(), False
+
+    def _put(self, conn: _StreamPair):
+        if len(self._idle) < self.maxsize:
+            self._idle.append((time.monotonic(), conn))
+        else:
+            conn[1].close()
+
+    def clear(self):
+        while self._idle:
+            self._idle.pop()[1][1].close()
+
+    def __len__(self) -> int:
+        return len(self._idle)
+
+    async def _send(self, conn: _StreamPair, request: bytes):
+        writer = conn[1]
+        writer.write(request)
+        await writer.drain()
+
+    async def request(self, method: str, path: str, body: Optional[bytes] = None, timeout: float = 10.0) -> Tuple[int, str, bytes]:
+        """
+        Returns:
+            (status, reason, content)
+
+        Raises:
+            HTTPError, HTTPTimeoutError
+        """
+        lines = [f"{method} {path} HTTP/1.1", f"Host: 127.0.0.1:{self._port}", "User-Agent: uiautomator2", "Accept-Encoding: "]
+        if body is not None:
+            lines += ["Content-Type: application/json", f"Content-Length: {len(body)}"]
+        request = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (body or b"")
+        try:
+            return await asyncio.wait_for(self._request(request), timeout)
+        except asyncio.TimeoutError as e:
+            raise HTTPTimeoutError(f"HTTP request timeout: {method} {path}") from e
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            # not chained as cause, which marks a failed connect, see maybe_delivered
+            raise HTTPError(f"HTTP request failed: {e!r}")
+
+    async def _request(self, request: bytes) -> Tuple[int, str, bytes]:
+        conn, reused = await self._get()
+        try:
+            try:
+                await self._send(conn, request)
+            except ConnectionError as e:
+                conn[1].close()
+                if not reused:
+                    raise
+                # server did not get the request, so it is safe to send it again
+                logger.debug("pooled connection is stale, reconnect: %s", e)
+                conn = await self._open_connection()
+                await self._send(conn, request)
+            # server may have run the request from here on, errors are raised
+            status, reason, content, will_close = await _read_http_response(conn[0])
+        except BaseException:
+            conn[1].close()
+            raise
+        if will_close:
+            conn[1].close()
+        else:
+            self._put(conn)
+        return status, reason, content
+
+
+class _AsyncJSONRpc:
+    def __init__(self, d: "AsyncDevice"):
+        self._d = d
+
+    def __getattr__(self, method: str) -> Callable[..., Any]:
+        async def _call(*args, **kwargs):
+            http_timeout = kwargs.pop('http_timeout', HTTP_TIMEOUT)
+            params = args if args else kwargs
+            return await self._d.jsonrpc_call(method, params, http_timeout)
+        return _call
+
+
+class AsyncDevice:
+    """asyncio facade of uiautomator2.Device"""
+
+    def __init__(self, device: "uiautomator2.Device"):
+        self._device = device
+        self._pool = AsyncHTTPConnectionPool(device.adb_device, device._device_server_port, transport=device.transport)
+        self._restart_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def sync(self) -> "uiautomator2.Device":
+        """ the blocking Device this facade is built on """
+        return self._device
+
+    @property
+    def settings(self):
+        return self._device.settings
+
+    @property
+    def jsonrpc(self) -> _AsyncJSONRpc:
+        return _AsyncJSONRpc(self)
+
+    async def _run_sync(self, fn: Callable, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+    async def _jsonrpc_call(self, method: str, params: Any, timeout: float) -> Any:
+        payload = {"jsonrpc": "2.0", "id": 1, "method": method, "params": params}
+        logger.debug("async jsonrpc %s %s", method, params)
+        status, reason, content = await self._pool.request("POST", "/jsonrpc/0", _codec.dumps(payload), timeout=timeout)
+        if status != 200:
+            raise HTTPError(f"HTTP request failed: {status} {reason}")
+        return _jsonrpc_result(_codec.loads(content), params)
+
+    async def _restart_uiautomator(self, generation: int, error: BaseException):
+        """ restart through the RecoveryPolicy of the sync device, once for all coroutines failed before it """
+        if self._restart_lock is None:
+            self._restart_lock = asyncio.Lock()
+        async with self._restart_lock:
+            self._pool.clear()
+            await self._run_sync(self._device.recovery.restart, generation, self._device._restart_uiautomator, error)
+            self._pool.clear()
+
+    async def jsonrpc_call(self, method: str, params: Any = None, timeout: float = 10) -> Any:
+        """Send jsonrpc call to uiautomator2 server, with the recovery policy
+        of the sync client, see BasicUiautomatorServer.jsonrpc_call"""
+        policy = self._device.recovery
+        attempt = 0
+        restarted = False
+        while True:
+            generation = policy.generation
+            try:
+                return await self._jsonrpc_call(method, params, timeout)
+            except Exception as e:
+                kind = classify_error(e)
+                if kind == FATAL or restarted:
+                    raise
+                if kind == TRANSIENT and method not in self._device.readonly_methods and maybe_delivered(e):
+                    # server may have run it, e.g. a click, do not repeat it
+                    raise
+                if kind == TRANSIENT and attempt < policy.retries:
+                    attempt += 1
+                    policy.record_retry()
+                    logger.debug("async jsonrpc %s transient error: %s, retry %d", method, e, attempt)
+                    self._pool.clear()
+                    await asyncio.sleep(policy.retry_delay(attempt))
+                    continue
+                logger.debug("uiautomator2 is not ok, error: %s", e)
+                await self._restart_uiautomator(generation, e)
+                restarted = True
+
+    async def shell(self, cmdargs: Union[str, List[str]], timeout: float = 60) -> ShellResponse:
+        """
+        Run shell command on device
+
+        Raises:
+            AdbShellError
+        """
+        MAGIC = b"X4EXIT:"
+        cmdline = list2cmdline(cmdargs)
+        logger.debug("async shell: %s", cmdline)
+
+        async def _run() -> bytes:
+            reader, writer = await _adb_open(self._device.adb_device, f"shell:{cmdline}; echo {MAGIC.decode()}$?")
+            try:
+                return await reader.read()
+            finally:
+                writer.close()
+        try:
+            output = await asyncio.wait_for(_run(), timeout)
+        except (adbutils.AdbError, asyncio.TimeoutError, ConnectionError) as e:
+            raise AdbShellError(e)
+        rindex = output.rfind(MAGIC)
+        if rindex == -1:
+            raise AdbShellError("shell output invalid", cmdline, output)
+        exit_code = int(output[rindex + len(MAGIC):])
+        return ShellResponse(output[:rindex].decode("utf-8", errors="replace"), exit_code)
+
+    async def window_size(self) -> Tuple[int, int]:
+        return await self._run_sync(self._device.window_size)
+
+    async def _rel2abs(self, x, y) -> Tuple[int, int]:
+        if x < 1 or y < 1:
+            w, h = await self.window_size()
+            if x < 1:
+                x = int(w * x)
+            if y < 1:
+                y = int(h * y)
+        return x, y
+
+    async def screenshot(self, format: str = "pillow", scale: Optional[float] = None, quality: Optional[int] = None):
+        """
+        Args:
+            scale, quality: see Device.screenshot
+
+        Returns:
+            PIL.Image.Image or np.ndarray (OpenCV format)
+        """
+        settings = self._device.settings
+        scale = settings['screenshot_scale'] if scale is None else scale
+        quality = settings['screenshot_quality'] if quality is None else quality
+        base64_data = await self.jsonrpc.takeScreenshot(scale, quality)
+        if base64_data:
+            return image_decode(base64.b64decode(base64_data), format)
+        else:
+            pil_img = await self._run_sync(self._device.adb_device.screenshot, display_id=0)
+        return image_convert(pil_img, format)
+
+    async def dump_hierarchy(self, compressed: bool = False, max_depth: Optional[int] = None) -> str:
+        if max_depth is None:
+            max_depth = self.settings['max_depth']
+        for _ in range(3):
+            content = await self.jsonrpc.dumpWindowHierarchy(compressed, max_depth)
+            if content and '<hierarchy rotation="0" />' not in content:
+                return content
+            await asyncio.sleep(1)
+        raise HierarchyEmptyError("dump hierarchy is empty")
+
+    async def click(self, x: Union[float, int], y: Union[float, int]):
+        x, y = await self._rel2abs(x, y)
+        await self.jsonrpc.click(x, y)
+
+    async def long_click(self, x: Union[float, int], y: Union[float, int], duration: float = .5):
+        x, y = await self._rel2abs(x, y)
+        await self.jsonrpc.click(x, y, int(duration * 1000))
+
+    async def swipe(self, fx, fy, tx, ty, duration: Optional[float] = None, steps: Optional[int] = None):
+        """ same as Device.swipe """
+        if duration and not steps:
+            steps = int(duration * 200)
+        steps = max(2, steps or SCROLL_STEPS)
+        fx, fy = await self._rel2abs(fx, fy)
+        tx, ty = await self._rel2abs(tx, ty)
+        return await self.jsonrpc.swipe(fx, fy, tx, ty, steps)
+
+    def xpath(self, xpath: str) -> "AsyncXPathSelector":
+        return AsyncXPathSelector(self, xpath)
+
+    def __call__(self, **kwargs) -> "AsyncUiObject":
+        return AsyncUiObject(self, Selector(**kwargs))
+
+
+class AsyncXPathSelector:
+    def __init__(self, d: AsyncDevice, xpath: str):
+        self._d = d
+        self._selector = XPathSelector.create(xpath)
+
+    async def all(self) -> List[Tuple[int, int]]:
+        """ return center points of all matched elements """
+        source = PageSource.parse(await self._d.dump_hierarchy())
+        return [el.center() for el in self._selector.all(source)]
+
+    async def exists(self) -> bool:
+        return len(await self.all()) > 0
+
+    async def wait(self, timeout: Optional[float] = None) -> Optional[Tuple[int, int]]:
+        """ wait until element found, return center point or None """
+        deadline = time.time() + (timeout or self._d.settings['wait_timeout'])
+        while True:
+            points = await self.all()
+            if points:
+                return points[0]
+            if time.time() > deadline:
+                return None
+            await asyncio.sleep(0.2)
+
+    async def click(self, timeout: Optional[float] = None):
+        """
+        Raises:
+            XPathElementNotFoundError
+        """
+        point = await self.wait(timeout)
+        if point is None:
+            raise XPathElementNotFoundError(self._selector)
+        await self._d.click(*point)
+
+
+class AsyncUiObject:
+    def __init__(self, d: AsyncDevice, selector: Selector):
+        self._d = d
+        self.selector = selector
+
+    async def exists(self) -> bool:
+        return await self._d.jsonrpc.exist(self.selector)
+
+    async def info(self) -> Dict[str, Any]:
+        return await self._d.jsonrpc.objInfo(self.selector)
+
+    async def wait(self, exists: bool = True, timeout: Optional[float] = None) -> bool:
+        if timeout is None:
+            timeout = self._d.settings['wait_timeout']
+        method = "waitForExists" if exists else "waitUntilGone"
+        return await self._d.jsonrpc_call(method, (self.selector, int(timeout * 1000)), timeout + 10)
+
+    async def click(self, timeout: Optional[float] = None, offset: Optional[Tuple[float, float]] = None):
+        """
+        Raises:
+            UiObjectNotFoundError
+        """
+        if not await self.wait(timeout=timeout):
+            raise UiObjectNotFoundError({'code': -32002, 'data': str(self.selector), 'method': 'wait'})
+        info = await self.info()
+        bounds = info.get('visibleBounds') or info.get("bounds")
+        xoff, yoff = offset or (0.5, 0.5)
+        x = bounds['left'] + (bounds['right'] - bounds['left']) * xoff
+        y = bounds['top'] + (bounds['bottom'] - bounds['top']) * yoff
+        await self._d.click(x, y)
+
+
+async def connect(serial: Union[str, adbutils.AdbDevice, None] = None, *, port: int = DEFAULT_SERVER_PORT, transport: Union[str, Transport, None] = None) -> AsyncDevice:
+    """
+    Same as uiautomator2.connect, but returns AsyncDevice
+    """
+    loop = asyncio.get_running_loop()
+    d = await loop.run_in_executor(None, functools.partial(uiautomator2.connect, serial, port=port, transport=transport))
+    return AsyncDevice(d)
@@ -8,9 +8,10 @@ from typing import Any, Dict, List, Optional, Tuple, Union
 
 import adbutils
 
-from uiautomator2._proto import HTTP_TIMEOUT, SCROLL_STEPS, Direction
+from uiautomator2 import _deadline
+from uiautomator2._proto import SCROLL_STEPS, Direction
 from uiautomator2.abstract import ShellResponse
-from uiautomator2.core import DEFAULT_SERVER_PORT, BasicUiautomatorServer, check_port
+from uiautomator2.core import DEFAULT_SERVER_PORT, BasicUiautomatorServer, JSONRpcStub, Transport, check_port
 from uiautomator2.exceptions import *
 from uiautomator2.settings import Settings
 from uiautomator2.utils import deprecated, image_convert, list2cmdline
@@ -23,21 +24,28 @@ class _BaseClient(BasicUiautomatorServer):
     提供最基础的控制类，这个类暂时先不公开吧
     """
 
-    def __init__(self, serial: Optional[Union[str, adbutils.AdbDevice]] = None, *, port: int = DEFAULT_SERVER_PORT):
+    def __init__(self, serial: Optional[Union[str, adbutils.AdbDevice]] = None, *, port: int = DEFAULT_SERVER_PORT, transport: Union[str, Transport, None] = None):
         """
         Args:
             serial: device serialno
             port: uiautomator2 server port on device
+            transport: "adb" (default), "forward", "tcp" or Transport instance
         """
         check_port(port)
+        start = time.perf_counter()
         if isinstance(serial, adbutils.AdbDevice):
             self.__serial = serial.serial
             self._dev = serial
+        elif isinstance(transport, Transport) and transport.offline:
+            # nothing to wait for, e.g. ReplayTransport
+            self.__serial = serial or getattr(transport, "serial", None) or "offline"
+            self._dev = adbutils.AdbDevice(adbutils.adb, self.__serial)
         else:
             self.__serial = serial
             self._dev = self._wait_for_device()
+        self._startup_timings = {"wait_device": time.perf_counter() - start}
         self._debug = False
-        BasicUiautomatorServer.__init__(self, dev=self._dev, device_server_port=port)
+        BasicUiautomatorServer.__init__(self, dev=self._dev, device_server_port=port, transport=transport)
     
     @property
     def _serial(self) -> str:
@@ -106,12 +114,16 @@ class _BaseClient(BasicUiautomatorServer):
         Raises:
             AdbShellError
         """
+        def _adb_shell() -> ShellResponse:
+            ret = self._dev.shell2(cmdargs, timeout=timeout)
+            return ShellResponse(ret.output, ret.returncode)
+
         try:
             if self.debug:
                 print("shell:", list2cmdline(cmdargs))
             logger.debug("shell: %s", list2cmdline(cmdargs))
-            ret = self._dev.shell2(cmdargs, timeout=timeout)
-            return ShellResponse(ret.output, ret.returncode)
+            with self._scheduler.slot():
+                return self._transport.shell(cmdargs, _adb_shell)
         except adbutils.AdbError as e:
             raise AdbShellError(e)
 
@@ -143,23 +155,20 @@ class _BaseClient(BasicUiautomatorServer):
         except adbutils.AdbError:
             return None
 
-    @property
-    def jsonrpc(self):
-        class JSONRpcWrapper():
-            def __init__(self, server: BasicUiautomatorServer):
-                self.server = server
-                self.method = None
-
-            def __getattr__(self, method):
-                self.method = method  # jsonrpc function name
-                return self
-
-            def __call__(self, *args, **kwargs):
-                http_timeout = kwargs.pop('http_timeout', HTTP_TIMEOUT)
-                params = args if args else kwargs
-                return self.server.jsonrpc_call(self.method, params, http_timeout)
-
-        return JSONRpcWrapper(self)
+    @cached_property
+    def jsonrpc(self) -> JSONRpcStub:
+        """ d.jsonrpc.click(x, y) calls jsonrpc method click, see JSONRpcStub """
+        return JSONRpcStub(self)
+
+    def deadline(self, seconds: float):
+        """Bound every call made by current thread inside to seconds in total,
+        DeadlineExceededError is raised when the budget is used up
+
+        Example:
+            with d.deadline(5):
+                d(text="OK").click()
+        """
+        return _deadline.deadline(seconds)
 
     def reset_uiautomator(self):
         """
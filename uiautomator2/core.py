@@ -4,31 +4,52 @@
 """Created on Thu Apr 25 2024 14:50:05 by codeskyblue
 """
 
+import abc
 import atexit
+import codecs
+import collections
+import concurrent.futures
+import copy
 import datetime
+import functools
 import hashlib
+import http.client
 import json
 import logging
 import os
+import re
+import select
 import threading
 import time
+from concurrent.futures import Future
 from http.client import HTTPConnection
 from pathlib import Path
-from typing import Any, ClassVar, Dict, Optional, Tuple, Union
+from typing import Any, Callable, ClassVar, Deque, Dict, FrozenSet, Iterator, List, Optional, Tuple, Union
 
 import adbutils
 import requests
 
-from uiautomator2.abstract import AbstractUiautomatorServer
-from uiautomator2.exceptions import AccessibilityServiceAlreadyRegisteredError, APKSignatureError, HTTPError, \
-    HTTPTimeoutError, LaunchUiAutomationError, RPCInvalidError, RPCStackOverflowError, RPCUnknownError, \
-    UiAutomationNotConnectedError, UiObjectNotFoundError
-from uiautomator2.utils import with_package_resource
+from uiautomator2 import _codec, _deadline, exceptions
+from uiautomator2._metrics import RPCStats
+from uiautomator2._proto import HTTP_TIMEOUT
+from uiautomator2._recovery import FATAL, TRANSIENT, RecoveryPolicy, classify_error, maybe_delivered
+from uiautomator2._scheduler import PRIORITIES, PriorityScheduler, current_priority, rpc_priority
+from uiautomator2.abstract import AbstractUiautomatorServer, ShellResponse
+from uiautomator2.exceptions import AccessibilityServiceAlreadyRegisteredError, APKSignatureError, ConnectError, \
+    DeadlineExceededError, HTTPError, HTTPTimeoutError, LaunchUiAutomationError, RPCError, RPCInvalidError, \
+    RPCStackOverflowError, RPCUnknownError, UiAutomationNotConnectedError, UiObjectNotFoundError
+from uiautomator2.utils import list2cmdline, with_package_resource
 from uiautomator2.version import __apk_version__
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_SERVER_PORT = 9008
+DEFAULT_POOL_MAXSIZE = 4
+# below the keep-alive timeout of server(NanoHTTPD closes idle connections after 5s)
+DEFAULT_POOL_IDLE_TIMEOUT = 3.0
+DEFAULT_HEALTH_TTL = 10.0
+# seconds a verified u2.jar on device is trusted without md5sum, as long as device did not reboot
+JAR_VERIFY_TTL = 600.0
 
 
 def check_port(port: int) -> None:
@@ -37,18 +58,28 @@ def check_port(port: int) -> None:
 
 
 class MockAdbProcess:
+    """Shell command running on device, output is collected by a background
+    thread and waiters are notified as soon as new output arrives or it exits"""
     def __init__(self, conn: adbutils.AdbConnection) -> None:
         self._conn = conn
         self._event = threading.Event()
+        self._cond = threading.Condition()
         self._output = bytearray()
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        self._text_parts: List[str] = []
         def wait_finished():
             try:
                 while chunk := self._conn.conn.recv(1024):
                     logger.debug("MockAdbProcess: %s", chunk)
-                    self._output.extend(chunk)
+                    with self._cond:
+                        self._output.extend(chunk)
+                        self._text_parts.append(self._decoder.decode(chunk))
+                        self._cond.notify_all()
             except:
                 pass
-            self._event.set()
+            with self._cond:
+                self._event.set()
+                self._cond.notify_all()
         
         t = threading.Thread(target=wait_finished)
         t.daemon = True
@@ -60,6 +91,24 @@ class MockAdbProcess:
         """ subprocess do not have this property """
         return self._output
 
+    @property
+    def text(self) -> str:
+        """ output decoded incrementally, so every byte is decoded only once """
+        with self._cond:
+            if len(self._text_parts) > 1:
+                self._text_parts[:] = ["".join(self._text_parts)]
+            return self._text_parts[0] if self._text_parts else ""
+
+    def wait_output(self, since: int, timeout: float) -> int:
+        """ wait until output is longer than since bytes or process quit
+
+        Returns:
+            output length
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: len(self._output) > since or self._event.is_set(), timeout)
+            return len(self._output)
+
     def wait(self) -> bool:
         return self._event.wait(timeout=3)
 
@@ -73,6 +122,19 @@ class MockAdbProcess:
         self.wait()
 
 
+def _poll_intervals(initial: float = .05, maximum: float = .5, factor: float = 1.5) -> Iterator[float]:
+    """ sleep intervals which start short and grow to maximum """
+    interval = initial
+    while True:
+        yield interval
+        interval = min(interval * factor, maximum)
+
+
+def _found_since(text: str, marker: str, since: int) -> bool:
+    """ marker ends after text[:since], so one split between two chunks is found, but only once """
+    return marker in text[max(0, since - len(marker) + 1):]
+
+
 def launch_uiautomator(dev: adbutils.AdbDevice, port: int) -> MockAdbProcess:
     """Launch uiautomator2 server on device"""
     command = f"CLASSPATH=/data/local/tmp/u2.jar app_process / com.wetest.uia2.Main -p {port}"
@@ -83,13 +145,30 @@ def launch_uiautomator(dev: adbutils.AdbDevice, port: int) -> MockAdbProcess:
 
 
 class HTTPResponse:
-    def __init__(self, content: bytes) -> None:
+    def __init__(self, content: Union[bytes, bytearray], status: int = 200, reason: str = "OK", copies: int = 0, timings: Optional[Dict[str, float]] = None, bytes_sent: int = 0) -> None:
+        """
+        Args:
+            content: body, bytearray is kept as is, without a copy to bytes
+            copies: how many times body was copied while read
+            timings: seconds spent in each phase, keys are connect(only for new connection), send, wait, read
+            bytes_sent: request body size
+        """
         self.content = content
-    
-    def json(self):
-        return json.loads(self.content)
+        self.status = status
+        self.reason = reason
+        self.copies = copies
+        self.timings = timings or {}
+        self.bytes_sent = bytes_sent
 
     @property
+    def nbytes(self) -> int:
+        return len(self.content)
+
+    def json(self):
+        # codecs parse bytearray directly, so no bytes or str copy of the body is made
+        return _codec.loads(self.content)
+
+    @functools.cached_property
     def text(self):
         return self.content.decode("utf-8", errors="ignore")
 
@@ -111,10 +190,521 @@ class AdbHTTPConnection(HTTPConnection):
 
     def __exit__(self, exc_type, exc_value, traceback):
         self.close()
-        
 
-def _http_request(dev: adbutils.AdbDevice, device_port: int, method: str, path: str, data: Optional[Dict[str, Any]] = None, timeout=10.0, print_request: bool = False) -> HTTPResponse:
-    """Send http request to uiautomator2 server"""
+
+class TCPHTTPConnection(HTTPConnection):
+    """ HTTPConnection which raises HTTPError when server is unreachable """
+    def connect(self):
+        try:
+            super().connect()
+        except OSError as e:
+            raise HTTPError(f"Unable to connect to uiautomator2 server {self.host}:{self.port}: {e}") from e
+
+
+class Transport(abc.ABC):
+    """How HTTP connections reach uiautomator2 server on device"""
+    name: ClassVar[str]
+    # no device behind, server is neither launched nor stopped
+    offline: ClassVar[bool] = False
+    # jsonrpc and shell hooks must see every call, so batch requests are not used
+    intercepts_calls: ClassVar[bool] = False
+
+    @abc.abstractmethod
+    def new_connection(self) -> HTTPConnection:
+        """ create a not yet connected HTTPConnection """
+
+    def address(self) -> Optional[Tuple[str, int]]:
+        """ (host, port) when server is reachable by plain TCP, None if only through adb """
+        return None
+
+    def bind(self, dev: adbutils.AdbDevice, port: int) -> "Transport":
+        """ called by create_transport with the device it is used for """
+        return self
+
+    def jsonrpc(self, method: str, params: Any, call: Callable[[], Any]) -> Any:
+        """ run one jsonrpc call, call() sends it to server """
+        return call()
+
+    def shell(self, cmdargs: Union[str, List[str]], call: Callable[[], ShellResponse]) -> ShellResponse:
+        """ run one shell command, call() runs it on device """
+        return call()
+
+
+class AdbStreamTransport(Transport):
+    """ open a new adb stream to device port for every connection """
+    name = "adb"
+
+    def __init__(self, dev: adbutils.AdbDevice, port: int):
+        self._dev = dev
+        self._port = port
+
+    def new_connection(self) -> HTTPConnection:
+        return AdbHTTPConnection(self._dev, self._port)
+
+
+class AdbForwardTransport(Transport):
+    """ create `adb forward tcp:<local> tcp:<port>` once, then connect to the local port """
+    name = "forward"
+
+    def __init__(self, dev: adbutils.AdbDevice, port: int):
+        self._dev = dev
+        self._port = port
+        self._local_port: Optional[int] = None
+        self._mutex = threading.Lock()
+
+    def address(self) -> Tuple[str, int]:
+        with self._mutex:
+            if self._local_port is None:
+                try:
+                    self._local_port = self._dev.forward_port(self._port)
+                except adbutils.AdbError as e:
+                    raise HTTPError(f"Unable to forward port {self._port}: {e}") from e
+                logger.debug("forward tcp:%d -> device tcp:%d", self._local_port, self._port)
+            return "127.0.0.1", self._local_port
+
+    def new_connection(self) -> HTTPConnection:
+        return TCPHTTPConnection(*self.address())
+
+
+class DirectTCPTransport(Transport):
+    """ connect to server directly, for devices reachable over network """
+    name = "tcp"
+
+    def __init__(self, host: str, port: int = DEFAULT_SERVER_PORT):
+        self._host = host
+        self._port = port
+
+    @classmethod
+    def from_device(cls, dev: adbutils.AdbDevice, port: int) -> "DirectTCPTransport":
+        """ use ip of `adb connect <ip>:<port>` serial, fallback to wlan ip """
+        host = None
+        if dev.serial and re.match(r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}:\d+$", dev.serial):
+            host = dev.serial.split(":")[0]
+        else:
+            try:
+                host = dev.wlan_ip()
+            except adbutils.AdbError as e:
+                raise ConnectError(f"Unable to get device ip: {e}") from e
+        return cls(host, port)
+
+    def address(self) -> Tuple[str, int]:
+        return self._host, self._port
+
+    def new_connection(self) -> HTTPConnection:
+        return TCPHTTPConnection(self._host, self._port)
+
+
+TRANSPORTS: Dict[str, Callable[[adbutils.AdbDevice, int], Transport]] = {
+    AdbStreamTransport.name: AdbStreamTransport,
+    AdbForwardTransport.name: AdbForwardTransport,
+    DirectTCPTransport.name: DirectTCPTransport.from_device,
+}
+
+
+def create_transport(dev: adbutils.AdbDevice, port: int, transport: Union[str, Transport, None] = None) -> Transport:
+    """
+    Args:
+        transport: Transport instance or one of "adb" (default), "forward", "tcp"
+    """
+    if isinstance(transport, Transport):
+        return transport.bind(dev, port)
+    name = transport or AdbStreamTransport.name
+    if name not in TRANSPORTS:
+        raise ValueError(f"transport must be one of {list(TRANSPORTS)}, got {transport!r}")
+    return TRANSPORTS[name](dev, port)
+
+
+def _error_record(e: Exception) -> Dict[str, Any]:
+    return {"type": type(e).__name__, "args": [a if isinstance(a, (str, int, float, bool, type(None))) else str(a) for a in e.args]}
+
+
+def _error_from_record(record: Dict[str, Any]) -> Exception:
+    cls = getattr(exceptions, record["type"], None)
+    if not (isinstance(cls, type) and issubclass(cls, exceptions.BaseException)):
+        cls = RPCUnknownError
+    return cls(*record["args"])
+
+
+class RecordingTransport(Transport):
+    """Record every jsonrpc call and shell command with its result and elapsed
+    seconds, as JSON lines appended to path. Traffic goes through inner transport.
+
+    Example:
+        d = u2.connect(serial, transport=RecordingTransport("session.jsonl"))
+    """
+    name = "record"
+    intercepts_calls = True
+
+    def __init__(self, path: Union[str, Path], inner: Union[str, Transport, None] = None):
+        """
+        Args:
+            inner: transport which reaches the device, see create_transport
+        """
+        self.path = Path(path)
+        self._inner = inner
+        self._fp = None
+        self._mutex = threading.Lock()
+
+    def bind(self, dev: adbutils.AdbDevice, port: int) -> "RecordingTransport":
+        self._inner = create_transport(dev, port, self._inner)
+        with self._mutex:
+            if self._fp is None:
+                self._fp = self.path.open("ab")
+                if self._fp.tell() == 0:
+                    self._write({"type": "meta", "version": 1, "serial": dev.serial, "port": port})
+        return self
+
+    def new_connection(self) -> HTTPConnection:
+        return self._inner.new_connection()
+
+    def address(self) -> Optional[Tuple[str, int]]:
+        return self._inner.address()
+
+    def _write(self, record: Dict[str, Any]):
+        self._fp.write(_codec.dumps(record) + b"\n")
+        self._fp.flush()
+
+    def _record(self, record: Dict[str, Any], call: Callable[[], Any], to_json: Callable[[Any], Dict[str, Any]]) -> Any:
+        start = time.perf_counter()
+        try:
+            result = call()
+        except Exception as e:
+            record.update(error=_error_record(e), elapsed=time.perf_counter() - start)
+            with self._mutex:
+                self._write(record)
+            raise
+        record.update(to_json(result), elapsed=time.perf_counter() - start)
+        with self._mutex:
+            self._write(record)
+        return result
+
+    def jsonrpc(self, method: str, params: Any, call: Callable[[], Any]) -> Any:
+        record = {"type": "jsonrpc", "method": method, "params": params}
+        return self._record(record, call, lambda result: {"result": result})
+
+    def shell(self, cmdargs: Union[str, List[str]], call: Callable[[], ShellResponse]) -> ShellResponse:
+        record = {"type": "shell", "cmd": list2cmdline(cmdargs)}
+        return self._record(record, call, lambda r: {"output": r.output, "exit_code": r.exit_code})
+
+    def close(self):
+        with self._mutex:
+            if self._fp is not None:
+                self._fp.close()
+                self._fp = None
+
+
+class ReplayTransport(Transport):
+    """Serve jsonrpc calls and shell commands from a RecordingTransport file,
+    without device. Identical requests get their recorded responses in order,
+    the last one is repeated when they run out.
+
+    Calls made through adb directly (e.g. app_current, push) are not recorded and not available.
+
+    Example:
+        d = u2.connect(transport=ReplayTransport("session.jsonl"))
+        d.xpath("Settings").click()
+    """
+    name = "replay"
+    offline = True
+    intercepts_calls = True
+
+    def __init__(self, path: Union[str, Path], keep_latency: bool = False):
+        """
+        Args:
+            keep_latency: sleep the recorded elapsed time of every response
+        """
+        self.path = Path(path)
+        self.keep_latency = keep_latency
+        self.serial: Optional[str] = None
+        self._responses: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = collections.defaultdict(list)
+        self._cursors: Dict[Tuple[str, str, str], int] = collections.Counter()
+        self._mutex = threading.Lock()
+        with self.path.open("rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = _codec.loads(line)
+                if record["type"] == "meta":
+                    self.serial = self.serial or record.get("serial")
+                elif record["type"] == "jsonrpc":
+                    self._responses[self._jsonrpc_key(record["method"], record["params"])].append(record)
+                elif record["type"] == "shell":
+                    self._responses[("shell", record["cmd"], "")].append(record)
+
+    @staticmethod
+    def _jsonrpc_key(method: str, params: Any) -> Tuple[str, str, str]:
+        return ("jsonrpc", method, json.dumps(params, sort_keys=True))
+
+    def new_connection(self) -> HTTPConnection:
+        raise HTTPError("replay transport has no connection to server")
+
+    def _replay(self, key: Tuple[str, str, str]) -> Dict[str, Any]:
+        with self._mutex:
+            records = self._responses.get(key)
+            if not records:
+                raise RPCInvalidError(f"no recorded response for {key[0]} {key[1]} {key[2]}")
+            record = records[min(self._cursors[key], len(records) - 1)]
+            self._cursors[key] += 1
+        if self.keep_latency:
+            time.sleep(record.get("elapsed", 0))
+        if "error" in record:
+            raise _error_from_record(record["error"])
+        return record
+
+    def jsonrpc(self, method: str, params: Any, call: Callable[[], Any]) -> Any:
+        return self._replay(self._jsonrpc_key(method, params))["result"]
+
+    def shell(self, cmdargs: Union[str, List[str]], call: Callable[[], ShellResponse]) -> ShellResponse:
+        record = self._replay(("shell", list2cmdline(cmdargs), ""))
+        return ShellResponse(record["output"], record["exit_code"])
+
+    def rewind(self):
+        """ replay from the first response again """
+        with self._mutex:
+            self._cursors.clear()
+
+
+# errors raised when a kept-alive connection was closed by the peer while idle
+_STALE_CONNECTION_ERRORS = (ConnectionError, http.client.BadStatusLine)
+
+
+def _is_dropped(conn: HTTPConnection) -> bool:
+    """ an idle connection is readable only when server closed it, or sent something unexpected """
+    if conn.sock is None:
+        return True
+    try:
+        readable, _, _ = select.select([conn.sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(readable)
+
+
+class HTTPConnectionPool:
+    """Thread-safe pool of keep-alive connections to uiautomator2 server
+
+    Connections are reused across requests, idle connections older than idle_timeout
+    or closed by server are evicted. A request is sent again on a new connection
+    only when writing it to a reused connection failed, never after it was written.
+    At most maxsize idle connections are kept, extra ones are closed after use.
+    """
+    def __init__(self, transport: Transport, maxsize: int = DEFAULT_POOL_MAXSIZE, idle_timeout: float = DEFAULT_POOL_IDLE_TIMEOUT):
+        self._transport = transport
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self._idle: Deque[Tuple[float, HTTPConnection]] = collections.deque()
+        self._mutex = threading.Lock()
+
+    @property
+    def transport(self) -> Transport:
+        return self._transport
+
+    def _new_connection(self) -> HTTPConnection:
+        return self._transport.new_connection()
+
+    def _get(self) -> Tuple[HTTPConnection, bool]:
+        """ return (connection, reused) """
+        while True:
+            expired = []
+            conn = None
+            with self._mutex:
+                deadline = time.monotonic() - self.idle_timeout
+                while self._idle and self._idle[0][0] < deadline:
+                    expired.append(self._idle.popleft()[1])
+                if self._idle:
+                    conn = self._idle.pop()[1] # most recently used first
+            for c in expired:
+                c.close()
+            if conn is None:
+                return self._new_connection(), False
+            if not _is_dropped(conn):
+                return conn, True
+            logger.debug("pooled connection closed by server, drop it")
+            conn.close()
+
+    def _put(self, conn: HTTPConnection):
+        if conn.sock is None:
+            return
+        with self._mutex:
+            if len(self._idle) < self.maxsize:
+                self._idle.append((time.monotonic(), conn))
+                return
+        conn.close()
+
+    def clear(self):
+        """ close all idle connections """
+        with self._mutex:
+            conns = [c for _, c in self._idle]
+            self._idle.clear()
+        for c in conns:
+            c.close()
+
+    def __len__(self) -> int:
+        return len(self._idle)
+
+    def _send(self, conn: HTTPConnection, method: str, path: str, body: Optional[bytes], headers: Dict[str, str], timeout: float, timings: Dict[str, float]):
+        """ connect if needed and write request """
+        conn.timeout = timeout
+        if conn.sock is None:
+            start = time.perf_counter()
+            conn.connect()
+            timings["connect"] = time.perf_counter() - start
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        start = time.perf_counter()
+        conn.request(method, path, body, headers=headers)
+        timings["send"] = time.perf_counter() - start
+
+    def _urlopen(self, method: str, path: str, body: Optional[bytes], headers: Optional[Dict[str, str]], timeout: float) -> Tuple[HTTPConnection, http.client.HTTPResponse, Dict[str, float]]:
+        """ return (conn, response, timings) """
+        headers = headers or {}
+        timings: Dict[str, float] = {}
+        conn, reused = self._get()
+        try:
+            try:
+                self._send(conn, method, path, body, headers, timeout, timings)
+            except _STALE_CONNECTION_ERRORS as e:
+                conn.close()
+                if not reused:
+                    raise
+                # server did not get the request, so it is safe to send it again
+                logger.debug("pooled connection is stale, reconnect: %s", e)
+                conn = self._new_connection()
+                timings.clear()
+                self._send(conn, method, path, body, headers, timeout, timings)
+            # server may have run the request from here on, errors are raised
+            start = time.perf_counter()
+            _response = conn.getresponse()
+            timings["wait"] = time.perf_counter() - start
+        except BaseException:
+            conn.close()
+            raise
+        return conn, _response, timings
+
+    def _release(self, conn: HTTPConnection, _response: http.client.HTTPResponse):
+        """ return conn to pool if response is fully read, otherwise close it """
+        if _response.isclosed() and not _response.will_close:
+            self._put(conn)
+        else:
+            conn.close()
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None, headers: Optional[Dict[str, str]] = None, timeout: float = 10.0) -> HTTPResponse:
+        """
+        Send request through a pooled connection, the whole body is read
+        """
+        conn, _response, timings = self._urlopen(method, path, body, headers, timeout)
+        start = time.perf_counter()
+        try:
+            content, copies = _read_body(_response)
+        except BaseException:
+            conn.close()
+            raise
+        timings["read"] = time.perf_counter() - start
+        self._release(conn, _response)
+        return HTTPResponse(content, _response.status, _response.reason, copies, timings, len(body or b""))
+
+    def stream(self, method: str, path: str, body: Optional[bytes] = None, headers: Optional[Dict[str, str]] = None, timeout: float = 10.0) -> "StreamingHTTPResponse":
+        """
+        Send request through a pooled connection, body is read on demand
+        """
+        conn, _response, timings = self._urlopen(method, path, body, headers, timeout)
+        response = StreamingHTTPResponse(self, conn, _response)
+        response.timings = timings
+        return response
+
+
+_READ_BUFFER_SIZE = 64 * 1024
+
+
+def _read_body(_response: http.client.HTTPResponse) -> Tuple[bytearray, int]:
+    """Read body into one buffer with readinto, which is preallocated when
+    Content-Length is known, or grows geometrically for chunked responses
+
+    Returns:
+        (content, copies)
+    """
+    length = _response.length
+    if length == 0:
+        _response.read() # mark response closed
+        return bytearray(), 0
+    buf = bytearray(length if length is not None else _READ_BUFFER_SIZE)
+    view = memoryview(buf)
+    pos = 0
+    copies = 1
+    while True:
+        if pos == len(buf):
+            if length is not None:
+                break
+            # resize needs all exported memoryview released
+            view.release()
+            buf.extend(bytes(len(buf)))
+            view = memoryview(buf)
+            copies += 1
+        n = _response.readinto(view[pos:])
+        if not n:
+            break
+        pos += n
+    view.release()
+    del buf[pos:]
+    return buf, copies
+
+
+class StreamingHTTPResponse:
+    """Response whose body is read on demand, for large results.
+    The connection goes back to pool when body is fully read and response closed.
+
+    Example:
+        with pool.stream("POST", "/jsonrpc/0", body) as r:
+            for chunk in r.iter_content():
+                fp.write(chunk)
+    """
+    def __init__(self, pool: HTTPConnectionPool, conn: HTTPConnection, _response: http.client.HTTPResponse):
+        self._pool = pool
+        self._conn: Optional[HTTPConnection] = conn
+        self._response = _response
+        self.status = _response.status
+        self.reason = _response.reason
+        self.length = _response.length
+        self.nbytes = 0
+        self.timings: Dict[str, float] = {}
+
+    def readinto(self, b: Union[bytearray, memoryview]) -> int:
+        n = self._response.readinto(b)
+        self.nbytes += n
+        return n
+
+    def iter_content(self, chunk_size: int = _READ_BUFFER_SIZE) -> Iterator[memoryview]:
+        """ yield memoryview of one reused buffer, which is only valid until next iteration """
+        buf = bytearray(chunk_size)
+        view = memoryview(buf)
+        while n := self.readinto(view):
+            yield view[:n]
+
+    def read(self) -> HTTPResponse:
+        """ read the rest of body """
+        content, copies = _read_body(self._response)
+        self.nbytes += len(content)
+        self.close()
+        return HTTPResponse(content, self.status, self.reason, copies)
+
+    def close(self):
+        if self._conn is not None:
+            self._pool._release(self._conn, self._response)
+            self._conn = None
+
+    def __enter__(self) -> "StreamingHTTPResponse":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _http_request(dev: adbutils.AdbDevice, device_port: int, method: str, path: str, data: Optional[Dict[str, Any]] = None, timeout=10.0, print_request: bool = False, pool: Optional[HTTPConnectionPool] = None, stream: bool = False) -> Union[HTTPResponse, StreamingHTTPResponse]:
+    """Send http request to uiautomator2 server
+    
+    Args:
+        pool: reuse keep-alive connections from pool, a new connection is used when None
+        stream: return StreamingHTTPResponse instead of reading the whole body
+    """
     try:
         logger.debug("http request %s %s %s", method, path, data)
 
@@ -139,26 +729,26 @@ def _http_request(dev: adbutils.AdbDevice, device_port: int, method: str, path:
             'Accept-Encoding': '',
             'Content-Type': 'application/json'
         }
-        with AdbHTTPConnection(dev, port=device_port) as conn:
-            conn.timeout = timeout
-            if not data:
-                conn.request(method, path, headers=headers)
-            else:
-                conn.request(method, path, json.dumps(data), headers=headers)
-            _response = conn.getresponse()
-            content = bytearray()
-            while chunk := _response.read(4096):
-                content.extend(chunk)
-            if _response.status != 200:
-                raise HTTPError(f"HTTP request failed: {_response.status} {_response.reason}")
-            response = HTTPResponse(content)
+        if pool is None:
+            pool = HTTPConnectionPool(AdbStreamTransport(dev, device_port), maxsize=0)
+        body = _codec.dumps(data) if data else None
+        if stream:
+            response = pool.stream(method, path, body, headers, timeout=timeout)
+            if response.status != 200:
+                response.close()
+                raise HTTPError(f"HTTP request failed: {response.status} {response.reason}")
+            return response
+        response = pool.request(method, path, body, headers, timeout=timeout)
+        if response.status != 200:
+            raise HTTPError(f"HTTP request failed: {response.status} {response.reason}")
+        logger.debug("http response %d bytes, %d copies", response.nbytes, response.copies)
 
         if print_request:
             end_time = datetime.datetime.now()
             current_time = end_time.strftime("%H:%M:%S.%f")[:-3]
             print(f"{current_time} Response >>>")
             print(response.text.rstrip())
-            print(f"<<< END timed_used = %.3f\n" % (end_time - start_time).total_seconds())
+            print(f"<<< END timed_used = %.3f bytes = %d copies = %d\n" % ((end_time - start_time).total_seconds(), response.nbytes, response.copies))
         return response
     except requests.Timeout as e:
         raise HTTPTimeoutError(f"HTTP request timeout: {e}") from e
@@ -166,29 +756,21 @@ def _http_request(dev: adbutils.AdbDevice, device_port: int, method: str, path:
         raise HTTPError(f"HTTP request failed: {e}") from e
 
 
-def _jsonrpc_call(dev: adbutils.AdbDevice, device_port: int, method: str, params: Any, timeout: float, print_request: bool) -> Any:
-    """Send jsonrpc call to uiautomator2 server
-    
+def _jsonrpc_result(data: Any, params: Any) -> Any:
+    """Extract result from a jsonrpc response object
+
     Raises:
-        UiAutomationError
+        UiAutomationError, RPCError
     """
-    payload = {
-        "jsonrpc": "2.0",
-        "id": 1,
-        "method": method,
-        "params": params
-    }
-    r = _http_request(dev, device_port, "POST", "/jsonrpc/0", payload, timeout=timeout, print_request=print_request)
-    data = r.json()
     if not isinstance(data, dict):
         raise RPCInvalidError("Unknown RPC error: not a dict")
     
-    if isinstance(data, dict) and "error" in data:
+    if "error" in data:
         logger.debug("jsonrpc error: %s", data)
         code = data['error'].get('code')
         message = data['error'].get('message', '')
         stacktrace = data['error'].get('data')
-        if "UiAutomation not connected" in r.text:
+        if "UiAutomation not connected" in str(data['error']):
             raise UiAutomationNotConnectedError("UiAutomation not connected")
         if "android.os.DeadObjectException" in message:
             # https://developer.android.com/reference/android/os/DeadObjectException
@@ -206,6 +788,316 @@ def _jsonrpc_call(dev: adbutils.AdbDevice, device_port: int, method: str, params
     return data["result"]
 
 
+def _jsonrpc_call(dev: adbutils.AdbDevice, device_port: int, method: str, params: Any, timeout: float, print_request: bool, pool: Optional[HTTPConnectionPool] = None, stats: Optional[RPCStats] = None) -> Any:
+    """Send jsonrpc call to uiautomator2 server
+    
+    Args:
+        stats: record latency, bytes and error of this call
+
+    Raises:
+        UiAutomationError
+    """
+    payload = {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": method,
+        "params": params
+    }
+    start = time.perf_counter()
+    r: Optional[HTTPResponse] = None
+    try:
+        r = _http_request(dev, device_port, "POST", "/jsonrpc/0", payload, timeout=timeout, print_request=print_request, pool=pool)
+        result = _jsonrpc_result(r.json(), params)
+    except Exception:
+        if stats is not None:
+            _record_stats(stats, method, start, r, error=True)
+        raise
+    if stats is not None:
+        _record_stats(stats, method, start, r)
+    return result
+
+
+def _record_stats(stats: RPCStats, method: str, start: float, r: Optional[HTTPResponse], error: bool = False):
+    elapsed = time.perf_counter() - start
+    if r is None:
+        stats.record(method, elapsed, error=error)
+    else:
+        stats.record(method, elapsed, r.timings, r.bytes_sent, r.nbytes, error=error)
+
+
+def _jsonrpc_batch_call(dev: adbutils.AdbDevice, device_port: int, calls: List[Tuple[str, Any]], timeout: float, print_request: bool, pool: Optional[HTTPConnectionPool] = None, stats: Optional[RPCStats] = None) -> Optional[List[Union[Any, Exception]]]:
+    """Send many jsonrpc calls as one JSON-RPC 2.0 batch array, recorded in stats as method "batch"
+
+    Returns:
+        result or exception of each call in order,
+        None if server does not understand batch request
+
+    Raises:
+        HTTPError
+    """
+    payload = [{
+        "jsonrpc": "2.0",
+        "id": i + 1,
+        "method": method,
+        "params": params,
+    } for i, (method, params) in enumerate(calls)]
+    start = time.perf_counter()
+    r: Optional[HTTPResponse] = None
+    try:
+        r = _http_request(dev, device_port, "POST", "/jsonrpc/0", payload, timeout=timeout, print_request=print_request, pool=pool)
+        data = r.json()
+    except Exception:
+        if stats is not None:
+            _record_stats(stats, "batch", start, r, error=True)
+        raise
+    if stats is not None:
+        _record_stats(stats, "batch", start, r)
+    if not isinstance(data, list):
+        logger.debug("jsonrpc batch not supported: %s", r.text[:200])
+        return None
+    responses = {item.get("id"): item for item in data if isinstance(item, dict)}
+    results = []
+    for i, (_, params) in enumerate(calls):
+        try:
+            if i + 1 not in responses:
+                raise RPCInvalidError("Unknown RPC error: missing batch response", i + 1)
+            results.append(_jsonrpc_result(responses[i + 1], params))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+class SingleFlight:
+    """Calls with the same key in flight at the same time run only once,
+    the others wait for it and get the same result or exception"""
+    def __init__(self):
+        self._calls: Dict[Any, Future] = {}
+        self._mutex = threading.Lock()
+
+    def do(self, key: Any, fn: Callable[[], Any], stats: Optional[RPCStats] = None) -> Any:
+        """
+        Args:
+            stats: count calls which joined another one, key[0] is used as method
+        """
+        with self._mutex:
+            fut = self._calls.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._calls[key] = Future()
+        if not leader:
+            if stats is not None:
+                stats.record_coalesced(key[0])
+            try:
+                result = fut.result(_deadline.remaining())
+            except concurrent.futures.TimeoutError:
+                raise DeadlineExceededError(f"{key[0]} exceeded deadline") from None
+            # every caller owns its result, strings are immutable and shared as is
+            return result if isinstance(result, (str, bytes, int, float, bool, type(None))) else copy.deepcopy(result)
+        try:
+            result = fn()
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            with self._mutex:
+                del self._calls[key]
+
+
+class JSONRpcBatch:
+    """Queue jsonrpc calls and send them together in one round trip
+
+    Every queued call returns a Future, which holds the result or the
+    mapped exception (UiObjectNotFoundError etc.) after flush.
+
+    Example:
+        with d.jsonrpc_batch() as batch:
+            f1 = batch.exist(selector)
+            f2 = batch.call("deviceInfo")
+        print(f1.result(), f2.result())
+    """
+    def __init__(self, server: "BasicUiautomatorServer", timeout: float = 10):
+        self._server = server
+        self._timeout = timeout
+        self._calls: List[Tuple[str, Any, Future]] = []
+
+    def call(self, method: str, *args, **kwargs) -> Future:
+        fut = Future()
+        fut.set_running_or_notify_cancel()
+        params = args if args else kwargs
+        self._calls.append((method, params, fut))
+        return fut
+
+    def __getattr__(self, method: str):
+        if method.startswith("_"):
+            raise AttributeError(method)
+        return functools.partial(self.call, method)
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def flush(self) -> List[Union[Any, Exception]]:
+        """ send queued calls, return result or exception of each call in order """
+        calls, self._calls = self._calls, []
+        if not calls:
+            return []
+        try:
+            results = self._server._jsonrpc_batch_call([(m, p) for m, p, _ in calls], self._timeout)
+        except Exception as e:
+            results = [e] * len(calls)
+        for (_, _, fut), result in zip(calls, results):
+            if isinstance(result, Exception):
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
+        return results
+
+    def __enter__(self) -> "JSONRpcBatch":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            for _, _, fut in self._calls:
+                fut.set_exception(RPCError("batch aborted"))
+            self._calls = []
+
+
+class JSONRpcMethod:
+    """Callable of one jsonrpc method with fixed options, immutable so it is
+    cached and shared by all threads
+
+    Keyword http_timeout of a call overrides the timeout option.
+    """
+    __slots__ = ("_server", "_method", "_timeout", "_priority", "_batch")
+
+    def __init__(self, server: "BasicUiautomatorServer", method: str, timeout: float = HTTP_TIMEOUT,
+                 priority: Optional[str] = None, batch: Optional[JSONRpcBatch] = None):
+        set_slot = object.__setattr__
+        set_slot(self, "_server", server)
+        set_slot(self, "_method", method)
+        set_slot(self, "_timeout", timeout)
+        set_slot(self, "_priority", priority)
+        set_slot(self, "_batch", batch)
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    @property
+    def method(self) -> str:
+        return self._method
+
+    def __call__(self, *args, **kwargs) -> Any:
+        timeout = kwargs.pop("http_timeout", self._timeout)
+        if self._batch is not None:
+            return self._batch.call(self._method, *args, **kwargs)
+        params = args if args else kwargs
+        if self._priority is None:
+            return self._server.jsonrpc_call(self._method, params, timeout)
+        with rpc_priority(self._priority):
+            return self._server.jsonrpc_call(self._method, params, timeout)
+
+    def __repr__(self) -> str:
+        return f"<JSONRpcMethod {self._method}>"
+
+
+class JSONRpcStub:
+    """Attribute access returns the cached JSONRpcMethod of that name
+
+    Example:
+        d.jsonrpc.click(100, 200)
+        d.jsonrpc.dumpWindowHierarchy(False, 50, http_timeout=30)
+        d.jsonrpc.options(timeout=30, priority=BACKGROUND).dumpWindowHierarchy(False, 50)
+        with d.jsonrpc_batch() as batch:
+            fut = d.jsonrpc.options(batch=batch).exist(selector)
+    """
+    def __init__(self, server: "BasicUiautomatorServer", timeout: float = HTTP_TIMEOUT,
+                 priority: Optional[str] = None, batch: Optional[JSONRpcBatch] = None):
+        if priority is not None and priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {PRIORITIES}, got {priority!r}")
+        set_attr = object.__setattr__
+        set_attr(self, "_server", server)
+        set_attr(self, "_timeout", timeout)
+        set_attr(self, "_priority", priority)
+        set_attr(self, "_batch", batch)
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __getattr__(self, method: str) -> JSONRpcMethod:
+        # only called on first access, later ones find the method in __dict__
+        if method.startswith("_"):
+            raise AttributeError(method)
+        # threads racing here create equal callables, either one is kept
+        return self.__dict__.setdefault(method, JSONRpcMethod(self._server, method, self._timeout, self._priority, self._batch))
+
+    def options(self, timeout: Optional[float] = None, priority: Optional[str] = None,
+                batch: Optional[JSONRpcBatch] = None) -> "JSONRpcStub":
+        """ stub whose calls use these options, unset ones are inherited """
+        return JSONRpcStub(self._server,
+                           self._timeout if timeout is None else timeout,
+                           self._priority if priority is None else priority,
+                           self._batch if batch is None else batch)
+
+
+@functools.lru_cache(maxsize=None)
+def _bundled_jar_md5() -> str:
+    """ md5 of assets/u2.jar, computed once per process """
+    md5 = hashlib.md5()
+    with with_package_resource("assets/u2.jar") as jar_path:
+        with open(jar_path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                md5.update(chunk)
+    return md5.hexdigest()
+
+
+class ServerHealth:
+    """Liveness of uiautomator2 server learned from every jsonrpc call,
+    so that /ping is only needed when the state is unknown
+
+    Attributes:
+        last_ok: time.monotonic() of the last response from server
+        last_failure: time.monotonic() of the last failed request
+        last_error: the error of the last failed request
+    """
+    def __init__(self, ttl: float = DEFAULT_HEALTH_TTL):
+        """
+        Args:
+            ttl: seconds a response counts as proof of life
+        """
+        self.ttl = ttl
+        self.last_ok: Optional[float] = None
+        self.last_failure: Optional[float] = None
+        self.last_error: Optional[Exception] = None
+
+    def mark_ok(self):
+        self.last_ok = time.monotonic()
+
+    def mark_failed(self, error: Optional[Exception] = None):
+        self.last_failure = time.monotonic()
+        self.last_error = error
+
+    def reset(self):
+        """ forget last response, e.g. after server is stopped """
+        self.last_ok = None
+
+    def is_fresh(self) -> bool:
+        """ server responded within ttl and did not fail after that """
+        if self.last_ok is None:
+            return False
+        if self.last_failure is not None and self.last_failure >= self.last_ok:
+            return False
+        return time.monotonic() - self.last_ok < self.ttl
+
+    def __repr__(self) -> str:
+        now = time.monotonic()
+        ago = lambda t: None if t is None else round(now - t, 3)
+        return f"<ServerHealth fresh={self.is_fresh()} last_ok={ago(self.last_ok)}s ago last_failure={ago(self.last_failure)}s ago error={self.last_error!r}>"
+
+
 class BasicUiautomatorServer(AbstractUiautomatorServer):
     """ Simple uiautomator2 server client
     this is runs without atx-agent
@@ -215,20 +1107,55 @@ class BasicUiautomatorServer(AbstractUiautomatorServer):
     # start/stop without blocking instances for other devices.
     _locks: ClassVar[Dict[Tuple[str, int], threading.Lock]] = {}
     _locks_guard: ClassVar[threading.Lock] = threading.Lock()
+    # serial -> (boot_id, time.monotonic()) of the last u2.jar verification
+    _jar_verified: ClassVar[Dict[str, Tuple[str, float]]] = {}
+    _recovery_policies: ClassVar[Dict[Tuple[str, int], RecoveryPolicy]] = {}
+    _singleflights: ClassVar[Dict[Tuple[str, int], "SingleFlight"]] = {}
+    _schedulers: ClassVar[Dict[Tuple[str, int], PriorityScheduler]] = {}
+    # side-effect-free methods, they are sent again after any transient error,
+    # other methods only when the request never reached server
+    readonly_methods: FrozenSet[str] = frozenset([
+        "dumpWindowHierarchy", "deviceInfo", "takeScreenshot", "getLastToast", "exist", "count",
+        "objInfo", "objInfoOfAllInstances", "getText", "waitForExists", "waitUntilGone",
+        "waitForWindowUpdate", "getClipboard", "getLastTraversedText", "windowSize",
+    ])
+    # methods whose identical concurrent calls are coalesced,
+    # assign another set to an instance to change it, an empty set disables it
+    coalesce_methods: FrozenSet[str] = readonly_methods
+    # skip u2.jar verification when it was verified within JAR_VERIFY_TTL and server is answering
+    skip_jar_verify: ClassVar[bool] = os.getenv("UIAUTOMATOR2_SKIP_JAR_VERIFY", "") in ("1", "true")
 
-    def __init__(self, dev: adbutils.AdbDevice, device_server_port: int = DEFAULT_SERVER_PORT) -> None:
+    def __init__(self, dev: adbutils.AdbDevice, device_server_port: int = DEFAULT_SERVER_PORT, transport: Union[str, Transport, None] = None) -> None:
+        """
+        Args:
+            transport: how to reach the server, see create_transport
+        """
         check_port(device_server_port)
         key = (dev.serial, device_server_port)
         with BasicUiautomatorServer._locks_guard:
             if key not in BasicUiautomatorServer._locks:
                 BasicUiautomatorServer._locks[key] = threading.Lock()
+                BasicUiautomatorServer._recovery_policies[key] = RecoveryPolicy()
+                BasicUiautomatorServer._singleflights[key] = SingleFlight()
+                BasicUiautomatorServer._schedulers[key] = PriorityScheduler()
             self._lock = BasicUiautomatorServer._locks[key]
+            self._recovery = BasicUiautomatorServer._recovery_policies[key]
+            self._singleflight = BasicUiautomatorServer._singleflights[key]
+            self._scheduler = BasicUiautomatorServer._schedulers[key]
         self._dev = dev
         self._process = None
         self._debug = False
         self._device_server_port = device_server_port
-        self.start_uiautomator()
-        atexit.register(self.stop_uiautomator, wait=False)
+        self._transport = create_transport(dev, device_server_port, transport)
+        self._pool = HTTPConnectionPool(self._transport)
+        self._batch_supported = not self._transport.intercepts_calls
+        self._stats = RPCStats({"serial": dev.serial, "port": str(device_server_port)})
+        self._health = ServerHealth()
+        self._cold_start_time: Optional[float] = None
+        self._startup_timings: Dict[str, float] = getattr(self, "_startup_timings", {})
+        if not self._transport.offline:
+            self.start_uiautomator()
+            atexit.register(self.stop_uiautomator, wait=False)
     
     @property
     def debug(self) -> bool:
@@ -238,6 +1165,43 @@ class BasicUiautomatorServer(AbstractUiautomatorServer):
     def debug(self, value: bool):
         self._debug = bool(value)
 
+    @property
+    def transport(self) -> Transport:
+        return self._transport
+
+    @property
+    def http_pool(self) -> HTTPConnectionPool:
+        """ keep-alive connections to uiautomator2 server, maxsize and idle_timeout are adjustable """
+        return self._pool
+
+    @property
+    def health(self) -> ServerHealth:
+        """ liveness of uiautomator2 server, updated by every jsonrpc call and ping """
+        return self._health
+
+    @property
+    def cold_start_time(self) -> Optional[float]:
+        """ seconds from server launch to the first pong, None if server was already running """
+        return self._cold_start_time
+
+    @property
+    def startup_timings(self) -> Dict[str, float]:
+        """ seconds spent in each phase of the last start_uiautomator,
+        keys are wait_device, setup_jar, check_alive, launch, ready """
+        return self._startup_timings
+
+    def rpc_stats(self) -> RPCStats:
+        """Per method jsonrpc call count, errors, bytes and latency histograms,
+        latency is also split into connect, send, wait and read phases
+
+        Example:
+            stats = d.rpc_stats()
+            print(stats.snapshot()["dumpWindowHierarchy"]["latency"])
+            print(stats.to_prometheus())
+            stats.reset()
+        """
+        return self._stats
+
     def start_uiautomator(self):
         """
         Start uiautomator2 server
@@ -245,30 +1209,85 @@ class BasicUiautomatorServer(AbstractUiautomatorServer):
         Raises:
             LaunchUiautomatorError: uiautomator2 server not ready
         """
+        if self._transport.offline:
+            return
+        timings = self._startup_timings
         with self._lock:
+            start = time.perf_counter()
             self._setup_jar()
-            if self._process:
-                if self._process.pool() is not None:
-                    self._process = None
-            if not self._check_alive():
+            timings["setup_jar"] = time.perf_counter() - start
+            if self._process and self._process.pool() is not None:
+                # the launched server quit, a recent response does not prove it is alive
+                self._process = None
+                self._health.reset()
+            start = time.perf_counter()
+            alive = self._is_alive()
+            timings["check_alive"] = time.perf_counter() - start
+            timings.pop("launch", None)
+            timings.pop("ready", None)
+            if not alive:
+                start = time.perf_counter()
                 self._process = launch_uiautomator(self._dev, self._device_server_port)
+                timings["launch"] = time.perf_counter() - start
+                start = time.perf_counter()
                 self._wait_ready()
+                timings["ready"] = time.perf_counter() - start
 
     def _setup_jar(self):
+        """ push u2.jar unless it is verified since device boot within JAR_VERIFY_TTL """
+        serial = self._dev.serial
+        verified = BasicUiautomatorServer._jar_verified.get(serial)
+        if verified and time.monotonic() - verified[1] > JAR_VERIFY_TTL:
+            verified = None
+        if verified and self.skip_jar_verify and self._is_alive():
+            logger.debug("skip u2.jar verification, server is answering")
+            return
+        boot_id = None
+        if verified:
+            boot_id = self._boot_id()
+            if boot_id and verified[0] == boot_id:
+                logger.debug("file u2.jar verified since boot %s", boot_id)
+                return
         with with_package_resource("assets/u2.jar") as jar_path:
             target_path = "/data/local/tmp/u2.jar"
-            if self._check_device_file_hash(jar_path, target_path):
+            if boot_id is None:
+                # nothing cached yet, boot_id is only stored, read it along with the md5sum
+                boot_id, hash_ok = self._boot_id_and_hash(target_path, _bundled_jar_md5())
+            else:
+                hash_ok = self._check_device_file_hash(jar_path, target_path, _bundled_jar_md5())
+            if hash_ok:
                 logger.debug("file u2.jar already pushed")
             else:
                 logger.debug("push %s -> %s", jar_path, target_path)
                 self._dev.sync.push(jar_path, target_path, check=True)
-    
-    def _check_device_file_hash(self, local_file: Union[str, Path], remote_file: str) -> bool:
-        """ check if remote file hash is correct """
-        md5 = hashlib.md5()
-        with open(local_file, "rb") as f:
-            md5.update(f.read())
-        local_md5 = md5.hexdigest()
+        BasicUiautomatorServer._jar_verified[serial] = (boot_id, time.monotonic())
+
+    def _boot_id(self) -> str:
+        """ changes on every device boot, empty when unknown """
+        try:
+            return self._dev.shell(["cat", "/proc/sys/kernel/random/boot_id"], timeout=5).strip()
+        except adbutils.AdbError:
+            return ""
+
+    def _boot_id_and_hash(self, remote_file: str, local_md5: str) -> Tuple[str, bool]:
+        """ _boot_id and _check_device_file_hash in one adb shell round trip """
+        output = self._dev.shell(f"(cat /proc/sys/kernel/random/boot_id || echo) 2>/dev/null; toybox md5sum {remote_file}")
+        boot_id, _, output = output.partition("\n")
+        if "toybox" in output and "not found" in output:
+            output = self._dev.shell(["md5", remote_file])
+        return boot_id.strip(), local_md5 in output
+
+    def _check_device_file_hash(self, local_file: Union[str, Path], remote_file: str, local_md5: Optional[str] = None) -> bool:
+        """ check if remote file hash is correct
+
+        Args:
+            local_md5: md5 of local_file if already known
+        """
+        if local_md5 is None:
+            md5 = hashlib.md5()
+            with open(local_file, "rb") as f:
+                md5.update(f.read())
+            local_md5 = md5.hexdigest()
         logger.debug("file %s md5: %s", os.path.basename(local_file), local_md5)
         output = self._dev.shell(["toybox", "md5sum", remote_file])
         if "toybox" in output and "not found" in output:
@@ -279,8 +1298,14 @@ class BasicUiautomatorServer(AbstractUiautomatorServer):
         """Wait until uiautomator2 server is ready"""
         self._wait_app_process_ready(launch_timeout)
     
+    # printed by server on launch, a /ping is likely to succeed soon after it
+    _STARTING_MARKER = "Starting Server"
+
     def _wait_app_process_ready(self, timeout: float):
         """
+        Wake up on new launch output, process quit or the next probe of a
+        fast adaptive backoff, whichever comes first
+
         ERROR1:
             [server] INFO: [UiAutomator2Server] Starting Server
             java.lang.IllegalStateException: UiAutomationService android.accessibilityservice.IAccessibilityServiceClient$Stub$Proxy@5deffd5already registered!
@@ -291,46 +1316,198 @@ class BasicUiautomatorServer(AbstractUiautomatorServer):
             SLF4J: Defaulting to no-operation (NOP) logger implementation
             SLF4J: See http://www.slf4j.org/codes.html#StaticLoggerBinder for further details.
         """
-        deadline = time.time() + timeout
-        output_buffer = ''
-        while time.time() < deadline:
-            output = self._process.output.decode("utf-8", errors="ignore")
-            output_buffer += output
-            if "already registered" in output:
-                raise AccessibilityServiceAlreadyRegisteredError(output)
-            if self._process.pool() is not None:
-                raise LaunchUiAutomationError("server quit unexpectly", output_buffer)
-            if self._check_alive():
-                return
-            time.sleep(.5)
-        raise LaunchUiAutomationError("server not ready", output_buffer)
+        process = self._process
+        start = time.monotonic()
+        deadline = start + _deadline.bound(timeout)
+        intervals = _poll_intervals(initial=.02)
+        scanned = 0 # chars of process.text already searched for markers
+        length = 0
+        next_probe = start
+        while True:
+            text = process.text
+            since, scanned = scanned, len(text)
+            if _found_since(text, "already registered", since):
+                raise AccessibilityServiceAlreadyRegisteredError(text)
+            if _found_since(text, self._STARTING_MARKER, since):
+                logger.debug("uiautomator2 server starting, probe fast")
+                intervals = _poll_intervals(initial=.02)
+                next_probe = time.monotonic()
+            if process.pool() is not None:
+                raise LaunchUiAutomationError("server quit unexpectly", text)
+            now = time.monotonic()
+            if now >= next_probe:
+                if self._check_alive():
+                    self._cold_start_time = time.monotonic() - start
+                    logger.debug("uiautomator2 server ready in %.3fs", self._cold_start_time)
+                    return
+                now = time.monotonic()
+                next_probe = now + next(intervals)
+            if now >= deadline:
+                _deadline.check("uiautomator2 server launch")
+                raise LaunchUiAutomationError("server not ready", text)
+            length = process.wait_output(length, min(next_probe, deadline) - now)
+
+    def _is_alive(self) -> bool:
+        """ like _check_alive, but trust a recent response when the launched process is still running """
+        process_exited = self._process is not None and self._process.pool() is not None
+        if not process_exited and self._health.is_fresh():
+            return True
+        return self._check_alive()
 
     def _check_alive(self) -> bool:
+        """ send /ping, the result is recorded in health """
         try:
-            response = _http_request(self._dev, self._device_server_port, "GET", "/ping")
-            return response.content == b"pong"
-        except (HTTPError, ConnectionError):
+            response = _http_request(self._dev, self._device_server_port, "GET", "/ping", pool=self._pool)
+        except (HTTPError, ConnectionError) as e:
+            self._health.mark_failed(e)
             return False
+        if response.content == b"pong":
+            self._health.mark_ok()
+            return True
+        self._health.mark_failed(HTTPError(f"unexpected ping response: {response.content[:100]!r}"))
+        return False
     
     def stop_uiautomator(self, wait=True):
+        if self._transport.offline:
+            return
         with self._lock:
             if self._process:
                 self._process.kill()
                 self._process = None
+            self._pool.clear()
+            self._health.reset()
         # wait server quit
         if wait:
-            deadline = time.time() + 10
-            while time.time() < deadline:
+            deadline = time.monotonic() + _deadline.bound(10)
+            intervals = _poll_intervals()
+            while time.monotonic() < deadline:
                 if not self._check_alive():
                     return
-                time.sleep(.5)
+                time.sleep(max(0.0, min(next(intervals), deadline - time.monotonic())))
 
-    def jsonrpc_call(self, method: str, params: Any = None, timeout: float = 10) -> Any:
-        """Send jsonrpc call to uiautomator2 server"""
+    def _jsonrpc_call(self, method: str, params: Any, timeout: float) -> Any:
+        """ one jsonrpc call, the outcome is recorded in health """
         try:
-            return _jsonrpc_call(self._dev, self._device_server_port, method, params, timeout, self._debug)
-        except (HTTPError, UiAutomationNotConnectedError) as e:
-            logger.debug("uiautomator2 is not ok, error: %s", e)
-            self.stop_uiautomator()
-            self.start_uiautomator()
-            return _jsonrpc_call(self._dev, self._device_server_port, method, params, timeout, self._debug)
+            call = functools.partial(_jsonrpc_call, self._dev, self._device_server_port, method, params, timeout, self._debug, self._pool, self._stats)
+            result = self._transport.jsonrpc(method, params, call)
+        except (HTTPError, UiAutomationNotConnectedError, OSError, http.client.HTTPException) as e:
+            self._health.mark_failed(e)
+            raise
+        except RPCError:
+            # server answered, with an error
+            self._health.mark_ok()
+            raise
+        self._health.mark_ok()
+        return result
+
+    def jsonrpc_call(self, method: str, params: Any = None, timeout: float = 10) -> Any:
+        """Send jsonrpc call to uiautomator2 server
+
+        Identical concurrent calls of methods in coalesce_methods and the same priority class share one round trip.
+        The call waits for a slot of its priority class, see rpc_priority and scheduler.
+        Transient errors are retried on a fresh connection with jittered backoff,
+        server is restarted at most once per call when retries do not help, see RecoveryPolicy.
+        Methods not in readonly_methods are only sent again when the failed
+        request never reached server
+
+        Calls inside d.deadline(seconds) are bounded by the remaining budget,
+        including retries and restarts, and are never coalesced
+
+        Raises:
+            CircuitOpenError: restarts are suspended after too many of them failed
+            DeadlineExceededError: budget of the enclosing deadline is used up
+        """
+        # a call under a deadline runs alone, its deadline error must not reach other callers
+        if method in self.coalesce_methods and _deadline.current_deadline() is None:
+            # per priority class, so a call never waits for a lower class leader still queued
+            key = (method, json.dumps(params, sort_keys=True), current_priority())
+            return self._singleflight.do(key, functools.partial(self._jsonrpc_call_recover, method, params, timeout), self._stats)
+        return self._jsonrpc_call_recover(method, params, timeout)
+
+    def _jsonrpc_call_recover(self, method: str, params: Any, timeout: float) -> Any:
+        with self._scheduler.slot():
+            return self._jsonrpc_call_retry(method, params, timeout)
+
+    def _jsonrpc_call_retry(self, method: str, params: Any, timeout: float) -> Any:
+        policy = self._recovery
+        attempt = 0
+        restarted = False
+        while True:
+            generation = policy.generation
+            try:
+                return self._jsonrpc_call(method, params, _deadline.bound(timeout))
+            except Exception as e:
+                # an error reply of the server is kept, a cut off request is reported as deadline
+                if _deadline.expired() and not isinstance(e, (RPCError, DeadlineExceededError)):
+                    raise DeadlineExceededError(f"jsonrpc {method} exceeded deadline") from e
+                kind = classify_error(e)
+                if kind == FATAL or restarted:
+                    raise
+                if kind == TRANSIENT and method not in self.readonly_methods and maybe_delivered(e):
+                    # server may have run it, e.g. a click, do not repeat it
+                    raise
+                if kind == TRANSIENT and attempt < policy.retries:
+                    attempt += 1
+                    policy.record_retry()
+                    logger.debug("jsonrpc %s transient error: %s, retry %d", method, e, attempt)
+                    self._pool.clear()
+                    _deadline.sleep(policy.retry_delay(attempt))
+                    continue
+                logger.debug("uiautomator2 is not ok, error: %s", e)
+                _deadline.check("uiautomator2 server restart")
+                policy.restart(generation, self._restart_uiautomator, e)
+                restarted = True
+
+    def _restart_uiautomator(self):
+        self.stop_uiautomator()
+        self.start_uiautomator()
+
+    @property
+    def scheduler(self) -> PriorityScheduler:
+        """ priority classes of jsonrpc calls and shell commands of this device,
+        limits and max_defer are adjustable, snapshot() returns wait times """
+        return self._scheduler
+
+    @property
+    def recovery(self) -> RecoveryPolicy:
+        """ retry and restart policy shared by all clients of this device and port,
+        snapshot() returns restart counts and cost """
+        return self._recovery
+
+    def jsonrpc_batch(self, timeout: float = 10) -> JSONRpcBatch:
+        """Queue jsonrpc calls and flush them in one round trip, see JSONRpcBatch"""
+        return JSONRpcBatch(self, timeout)
+
+    def _jsonrpc_batch_call(self, calls: List[Tuple[str, Any]], timeout: float = 10) -> List[Union[Any, Exception]]:
+        """Send calls as one batch request, fallback to sequential calls on
+        one keep-alive connection when server does not support batch request,
+        or after a transport error when every call is read-only
+
+        Raises:
+            HTTPError: transport error of a batch which may have run on server
+        """
+        if self._batch_supported:
+            try:
+                results = _jsonrpc_batch_call(self._dev, self._device_server_port, calls, timeout, self._debug, self._pool, self._stats)
+            except (HTTPError, OSError, http.client.HTTPException) as e:
+                # a transport error tells nothing about batch support
+                logger.debug("jsonrpc batch failed, error: %s", e)
+                self._health.mark_failed(e)
+                if maybe_delivered(e) and not all(method in self.readonly_methods for method, _ in calls):
+                    # server may have run some of the calls, do not send them again
+                    raise
+                results = []
+            else:
+                self._health.mark_ok()
+                if results is None:
+                    # server answered, but does not understand a batch array
+                    self._batch_supported = False
+            if results:
+                return results
+        results = []
+        for method, params in calls:
+            try:
+                results.append(self.jsonrpc_call(method, params, timeout))
+            except Exception as e:
+                results.append(e)
+        return results
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Pure Python stand-in of the uiautomator2 server on device, for device-free
+tests and benchmarks of the connection, parsing and concurrency paths
+
+Example:
+    with EmulatorServer(hierarchy="page.xml", latency="usb") as emu:
+        d = u2.connect(transport=emu.transport())
+        d.xpath("Settings").click()
+        print(emu.calls["click"])
+"""
+
+import base64
+import collections
+import dataclasses
+import functools
+import io
+import json
+import logging
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from lxml import etree
+from PIL import Image
+
+from uiautomator2.abstract import ShellResponse
+from uiautomator2.core import DirectTCPTransport
+from uiautomator2.exceptions import AdbShellError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class LatencyProfile:
+    """ base + uniform(0, jitter) + per_kb * response KB + methods[method] seconds per request """
+    base: float = 0.0
+    jitter: float = 0.0
+    per_kb: float = 0.0
+    methods: Dict[str, float] = dataclasses.field(default_factory=dict)
+
+    def delay(self, method: str, nbytes: int) -> float:
+        jitter = random.uniform(0, self.jitter) if self.jitter else 0.0
+        return self.base + jitter + self.per_kb * nbytes / 1024 + self.methods.get(method, 0.0)
+
+
+# rough numbers of real devices
+LATENCY_PROFILES: Dict[str, LatencyProfile] = {
+    "instant": LatencyProfile(),
+    "usb": LatencyProfile(base=.003, jitter=.002, per_kb=.00002, methods={"dumpWindowHierarchy": .08, "takeScreenshot": .1}),
+    "wifi": LatencyProfile(base=.015, jitter=.015, per_kb=.0002, methods={"dumpWindowHierarchy": .08, "takeScreenshot": .1}),
+}
+
+
+def synthetic_hierarchy(nodes: int = 100, display: Tuple[int, int] = (1080, 1920), package: str = "com.example.emulator") -> str:
+    """ hierarchy of a list page with nodes TextView rows, text and resource-id are item<N> """
+    width, height = display
+    row = max(1, height // max(nodes, 1))
+    lines = [
+        "<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>",
+        '<hierarchy rotation="0">',
+        f'<node index="0" text="" resource-id="android:id/content" class="android.widget.FrameLayout" package="{package}" '
+        f'content-desc="" checkable="false" checked="false" clickable="false" enabled="true" focusable="false" focused="false" '
+        f'scrollable="true" long-clickable="false" password="false" selected="false" visible-to-user="true" bounds="[0,0][{width},{height}]">',
+    ]
+    for i in range(nodes):
+        top = i * row
+        lines.append(
+            f'<node index="{i}" text="item{i}" resource-id="{package}:id/item{i}" class="android.widget.TextView" package="{package}" '
+            f'content-desc="desc{i}" checkable="false" checked="false" clickable="true" enabled="true" focusable="true" focused="false" '
+            f'scrollable="false" long-clickable="false" password="false" selected="false" visible-to-user="true" '
+            f'bounds="[0,{top}][{width},{top + row}]" />')
+    lines += ["</node>", "</hierarchy>"]
+    return "\n".join(lines)
+
+
+def synthetic_screenshot(display: Tuple[int, int] = (1080, 1920), quality: int = 80) -> bytes:
+    """ JPEG with a gradient, so its size is close to a real screenshot """
+    width, height = display
+    gradient = Image.linear_gradient("L").resize((width, height))
+    image = Image.merge("RGB", (gradient, gradient.transpose(Image.Transpose.ROTATE_90).resize((width, height)), gradient))
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+
+@functools.lru_cache(maxsize=16)
+def _scaled_jpeg(data: bytes, scale: float, quality: int) -> bytes:
+    """ re-encode like takeScreenshot(scale, quality) of the real server """
+    image = Image.open(io.BytesIO(data))
+    if scale != 1:
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))))
+    buf = io.BytesIO()
+    image.convert("RGB").save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+_BOUNDS_RE = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+
+# Selector key -> (hierarchy attribute, compare)
+_SELECTOR_MATCHERS: Dict[str, Tuple[str, Callable[[str, Any], bool]]] = {
+    "text": ("text", lambda a, v: a == v),
+    "textContains": ("text", lambda a, v: v in a),
+    "textMatches": ("text", lambda a, v: re.fullmatch(v, a) is not None),
+    "textStartsWith": ("text", lambda a, v: a.startswith(v)),
+    "className": ("class", lambda a, v: a == v),
+    "classNameMatches": ("class", lambda a, v: re.fullmatch(v, a) is not None),
+    "description": ("content-desc", lambda a, v: a == v),
+    "descriptionContains": ("content-desc", lambda a, v: v in a),
+    "descriptionMatches": ("content-desc", lambda a, v: re.fullmatch(v, a) is not None),
+    "descriptionStartsWith": ("content-desc", lambda a, v: a.startswith(v)),
+    "packageName": ("package", lambda a, v: a == v),
+    "packageNameMatches": ("package", lambda a, v: re.fullmatch(v, a) is not None),
+    "resourceId": ("resource-id", lambda a, v: a == v),
+    "resourceIdMatches": ("resource-id", lambda a, v: re.fullmatch(v, a) is not None),
+    "index": ("index", lambda a, v: a == str(v)),
+}
+for _key in ("checkable", "checked", "clickable", "enabled", "focusable", "focused", "scrollable", "selected"):
+    _SELECTOR_MATCHERS[_key] = (_key, lambda a, v: a == str(bool(v)).lower())
+_SELECTOR_MATCHERS["longClickable"] = ("long-clickable", lambda a, v: a == str(bool(v)).lower())
+
+UI_OBJECT_NOT_FOUND = -32002
+METHOD_NOT_FOUND = -32601
+
+
+class EmulatorServer:
+    """HTTP server speaking the uiautomator2 jsonrpc protocol, on a local port in a daemon thread
+
+    Supported: /ping, /jsonrpc/0 (single and batch) with dumpWindowHierarchy, takeScreenshot,
+    deviceInfo, windowSize, waitForExists, waitUntilGone, exist, count, objInfo, objInfoOfAllInstances,
+    getLastToast and input actions (click, swipe, pressKey, ...) which just return True
+    """
+    INPUT_METHODS = frozenset([
+        "click", "longClick", "swipe", "swipePoints", "drag", "dragTo", "pressKey", "pressKeyCode",
+        "injectInputEvent", "clearTextField", "setText", "wakeUp", "sleep", "makeToast", "clearLastToast",
+    ])
+
+    def __init__(self,
+                 hierarchy: Union[str, Path, None] = None,
+                 screenshot: Union[bytes, Path, None] = None,
+                 nodes: int = 100,
+                 display: Tuple[int, int] = (1080, 1920),
+                 latency: Union[str, LatencyProfile] = "instant",
+                 host: str = "127.0.0.1",
+                 port: int = 0):
+        """
+        Args:
+            hierarchy: xml text or path of xml fixture, default synthetic_hierarchy(nodes, display)
+            screenshot: JPEG bytes or path of image fixture, default synthetic_screenshot(display)
+            nodes: node count of synthetic hierarchy, controls dumpWindowHierarchy payload size
+            latency: LatencyProfile or one of LATENCY_PROFILES
+            port: 0 means a free port
+        """
+        if isinstance(hierarchy, Path) or (isinstance(hierarchy, str) and not hierarchy.lstrip().startswith("<")):
+            hierarchy = Path(hierarchy).read_text(encoding="utf-8")
+        if isinstance(screenshot, Path):
+            screenshot = screenshot.read_bytes()
+        self.display = display
+        self.latency = LATENCY_PROFILES[latency] if isinstance(latency, str) else latency
+        self.calls: Dict[str, int] = collections.Counter()
+        self._mutex = threading.Lock()
+        self.set_hierarchy(hierarchy or synthetic_hierarchy(nodes, display))
+        self.screenshot = screenshot or synthetic_screenshot(display)
+
+        handler = type("_Handler", (_EmulatorHandler,), {"emulator": self})
+        self._httpd = ThreadingHTTPServer((host, port), handler)
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    def set_hierarchy(self, xml: str):
+        """ change the current page """
+        root = etree.fromstring(xml.encode("utf-8"))
+        nodes = [dict(el.attrib) for el in root.iter("node")]
+        with self._mutex:
+            self.hierarchy = xml
+            self._nodes = nodes
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._httpd.server_address[:2]
+
+    def transport(self, serial: str = "emulator") -> "EmulatorTransport":
+        return EmulatorTransport(*self.address, serial=serial)
+
+    def start(self) -> "EmulatorServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, args=(.05,), name="u2-emulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "EmulatorServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    # jsonrpc methods
+
+    def _find(self, selector: Dict[str, Any]) -> List[Dict[str, str]]:
+        matchers = [(attr, compare, selector[key]) for key, (attr, compare) in _SELECTOR_MATCHERS.items() if key in selector]
+        with self._mutex:
+            nodes = self._nodes
+        return [node for node in nodes if all(compare(node.get(attr, ""), value) for attr, compare, value in matchers)]
+
+    def _find_one(self, selector: Dict[str, Any]) -> Optional[Dict[str, str]]:
+        found = self._find(selector)
+        instance = selector.get("instance", 0)
+        return found[instance] if instance < len(found) else None
+
+    @staticmethod
+    def _obj_info(node: Dict[str, str]) -> Dict[str, Any]:
+        m = _BOUNDS_RE.match(node.get("bounds", ""))
+        lx, ly, rx, ry = map(int, m.groups()) if m else (0, 0, 0, 0)
+        bounds = {"left": lx, "top": ly, "right": rx, "bottom": ry}
+        flag = lambda name: node.get(name) == "true"
+        return {
+            "bounds": bounds,
+            "visibleBounds": bounds,
+            "childCount": 0,
+            "className": node.get("class"),
+            "contentDescription": node.get("content-desc"),
+            "packageName": node.get("package"),
+            "resourceName": node.get("resource-id"),
+            "text": node.get("text"),
+            "checkable": flag("checkable"),
+            "checked": flag("checked"),
+            "clickable": flag("clickable"),
+            "enabled": flag("enabled"),
+            "focusable": flag("focusable"),
+            "focused": flag("focused"),
+            "longClickable": flag("long-clickable"),
+            "scrollable": flag("scrollable"),
+            "selected": flag("selected"),
+        }
+
+    def call(self, method: str, params: Any) -> Any:
+        """ result of a jsonrpc method
+
+        Raises:
+            _RPCFault
+        """
+        params = params if isinstance(params, list) else [params] if params is not None else []
+        with self._mutex:
+            self.calls[method] += 1
+        if method in self.INPUT_METHODS:
+            return True
+        if method == "dumpWindowHierarchy":
+            return self.hierarchy
+        if method == "takeScreenshot":
+            scale = params[0] if params else 1
+            quality = params[1] if len(params) > 1 else 80
+            data = self.screenshot if (scale, quality) == (1, 80) else _scaled_jpeg(self.screenshot, scale, quality)
+            return base64.b64encode(data).decode()
+        if method == "deviceInfo":
+            width, height = self.display
+            with self._mutex:
+                package = self._nodes[0].get("package") if self._nodes else None
+            return {
+                "currentPackageName": package, "displayWidth": width, "displayHeight": height,
+                "displayRotation": 0, "displaySizeDpX": width * 160 // 480, "displaySizeDpY": height * 160 // 480,
+                "productName": "emulator", "screenOn": True, "sdkInt": 30, "naturalOrientation": True,
+            }
+        if method == "windowSize":
+            return list(self.display)
+        if method == "getLastToast":
+            return None
+        if method in ("exist", "waitForExists"):
+            return self._find_one(params[0]) is not None
+        if method == "waitUntilGone":
+            return self._find_one(params[0]) is None
+        if method == "count":
+            return len(self._find(params[0]))
+        if method == "objInfo":
+            node = self._find_one(params[0])
+            if node is None:
+                raise _RPCFault(UI_OBJECT_NOT_FOUND, "androidx.test.uiautomator.UiObjectNotFoundException: " + json.dumps(params[0]))
+            return self._obj_info(node)
+        if method == "objInfoOfAllInstances":
+            return [self._obj_info(node) for node in self._find(params[0])]
+        raise _RPCFault(METHOD_NOT_FOUND, f"Method not found: {method}")
+
+    def handle(self, request: Any) -> Any:
+        """ jsonrpc response object of a request object """
+        try:
+            result = self.call(request["method"], request.get("params"))
+        except _RPCFault as e:
+            return {"jsonrpc": "2.0", "id": request.get("id"), "error": {"code": e.code, "message": e.message, "data": ""}}
+        return {"jsonrpc": "2.0", "id": request.get("id"), "result": result}
+
+
+class _RPCFault(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(code, message)
+        self.code = code
+        self.message = message
+
+
+class _EmulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are sent separately, without TCP_NODELAY the delayed ACK adds 40ms
+    disable_nagle_algorithm = True
+    emulator: EmulatorServer
+
+    def log_message(self, format, *args):
+        logger.debug("emulator: " + format, *args)
+
+    def _reply(self, body: bytes, method: str = "", content_type: str = "application/json"):
+        delay = self.emulator.latency.delay(method, len(body))
+        if delay > 0:
+            time.sleep(delay)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/ping":
+            self._reply(b"pong", content_type="text/plain")
+            return
+        self.send_error(404)
+
+    def do_POST(self):
+        if self.path != "/jsonrpc/0":
+            self.send_error(404)
+            return
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if isinstance(payload, list):
+            response = [self.emulator.handle(request) for request in payload]
+            method = ",".join(request.get("method", "") for request in payload)
+        else:
+            response = self.emulator.handle(payload)
+            method = payload.get("method", "")
+        self._reply(json.dumps(response).encode(), method)
+
+
+class EmulatorTransport(DirectTCPTransport):
+    """ plain TCP to EmulatorServer, the server lifecycle and adb are skipped """
+    name = "emulator"
+    offline = True
+
+    def __init__(self, host: str, port: int, serial: str = "emulator"):
+        super().__init__(host, port)
+        self.serial = serial
+
+    def shell(self, cmdargs: Union[str, List[str]], call: Callable[[], ShellResponse]) -> ShellResponse:
+        raise AdbShellError(f"emulator has no shell: {cmdargs}")
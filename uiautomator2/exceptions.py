@@ -11,6 +11,7 @@
 #   |     +- UiObjectNotFoundError
 #   |     +- AppNotFoundError
 #   |     +- SessionBrokenError  
+#   +- DeadlineExceededError
 #   +- DeviceError
 #      +- InputIMEError
 #      +- HTTPError
@@ -23,6 +24,7 @@
 #         +- InjectPermissionError
 #         +- LaunchUiAutomationError
 #         +- AccessibilityServiceAlreadyRegisteredError
+#         +- CircuitOpenError
 
 
 class BaseException(Exception):
@@ -44,6 +46,10 @@ class InjectPermissionError(UiAutomationError):... #开发者选项中: 模拟
 class APKSignatureError(UiAutomationError):...
 class LaunchUiAutomationError(UiAutomationError):...
 class AccessibilityServiceAlreadyRegisteredError(UiAutomationError):...
+class CircuitOpenError(UiAutomationError):... # server restarts are suspended after too many failures
+
+
+class DeadlineExceededError(BaseException):... # time budget of d.deadline() used up
 
 
 ## RPCError
@@ -13,6 +13,8 @@ import threading
 import time
 from collections import namedtuple
 
+from uiautomator2._scheduler import BACKGROUND, rpc_priority
+
 _MEM_PATTERN = re.compile(r'TOTAL[:\s]+(\d+)')
 # acct_tag_hex is a socket tag
 # cnt_set==0 are for background data
@@ -231,19 +233,20 @@ class Perf(object):
             fcsv = csv.writer(f)
             fcsv.writerow(headers)
             update_time = time.time()
-            while not self._event.isSet():
-                perfdata = self.collect()
-                if self.debug:
-                    print("DEBUG:", perfdata)
-                if not perfdata:
-                    print("perf package is not alive:", self.package_name)
-                    time.sleep(1)
-                    continue
-                fcsv.writerow([perfdata[k] for k in headers])
-                wait_seconds = max(0,
-                                   self.interval - (time.time() - update_time))
-                time.sleep(wait_seconds)
-                update_time = time.time()
+            with rpc_priority(BACKGROUND):
+                while not self._event.isSet():
+                    perfdata = self.collect()
+                    if self.debug:
+                        print("DEBUG:", perfdata)
+                    if not perfdata:
+                        print("perf package is not alive:", self.package_name)
+                        time.sleep(1)
+                        continue
+                    fcsv.writerow([perfdata[k] for k in headers])
+                    wait_seconds = max(0,
+                                       self.interval - (time.time() - update_time))
+                    time.sleep(wait_seconds)
+                    update_time = time.time()
             f.close()
         finally:
             self._condition.acquire()
@@ -10,7 +10,7 @@ import os
 import re
 import time
 import typing
-from typing import Union
+from typing import Optional, Union
 
 import cv2
 import findit
@@ -21,8 +21,9 @@ from PIL import Image, ImageDraw
 from skimage.metrics import structural_similarity
 
 import uiautomator2
+from uiautomator2._frame import ScreenFrame
 
-ImageType = typing.Union[np.ndarray, Image.Image]
+ImageType = typing.Union[np.ndarray, Image.Image, ScreenFrame]
 
 compare_ssim = structural_similarity
 logger = logging.getLogger(__name__)
@@ -132,17 +133,21 @@ def ispil(im):
     return isinstance(im, Image.Image)
 
 
-def conv2cv(im: Union[np.ndarray, Image.Image]) -> np.ndarray:
+def conv2cv(im: Union[np.ndarray, Image.Image, ScreenFrame]) -> np.ndarray:
     if iscv2(im):
         return im
+    if isinstance(im, ScreenFrame):
+        return im.opencv
     if ispil(im):
         return pil2cv(im)
     raise TypeError("Unknown image type:", type(im))
 
 
-def conv2pil(im: Union[np.ndarray, Image.Image]) -> Image.Image:
+def conv2pil(im: Union[np.ndarray, Image.Image, ScreenFrame]) -> Image.Image:
     if ispil(im):
         return im
+    elif isinstance(im, ScreenFrame):
+        return im.pil
     elif iscv2(im):
         return cv2pil(im)
     else:
@@ -238,10 +243,11 @@ class ImageX(object):
         screenshot = self._d.screenshot()
         return screenshot.convert("RGB").getpixel((x, y))
 
-    def match(self, imdata: Union[np.ndarray, str, Image.Image]):
+    def match(self, imdata: Union[np.ndarray, str, Image.Image], target: Optional[ImageType] = None):
         """
         Args:
             imdata: file, url, pillow or opencv image object
+            target: screen to search in, default a new screenshot
         
         Returns:
             templateMatch result
@@ -253,7 +259,7 @@ class ImageX(object):
         fi.load_template("template", pic_object=cvimage)
         th, tw = cvimage.shape[:2] # template width, height
 
-        target = self._d.screenshot(format='opencv')
+        target = self._d.screenshot(format='opencv') if target is None else conv2cv(target)
         assert isinstance(target, np.ndarray), "screenshot is not opencv format"
         raw_result = fi.find("target", target_pic_object=target)
         # from pprint import pprint
@@ -268,15 +274,20 @@ class ImageX(object):
 
     def __wait(self, imdata, timeout=30.0, threshold=0.8):
         deadline = time.time() + timeout
-        while time.time() < deadline:
-            m = self.match(imdata)
-            sim = m['similarity']
-            logger.debug("similarity %.2f [~%.2f], left time: %.1fs", sim,
-                              threshold, deadline - time.time())
-            if sim < threshold:
-                continue
-            time.sleep(.1)
-            return m
+        # the next screen is captured while the current one is matched
+        with self._d.screenshot_stream(pipeline=1) as stream:
+            while time.time() < deadline:
+                frame = stream.get(timeout=max(0, deadline - time.time()))
+                if frame is None:
+                    break
+                m = self.match(imdata, target=frame)
+                sim = m['similarity']
+                logger.debug("similarity %.2f [~%.2f], left time: %.1fs", sim,
+                                  threshold, deadline - time.time())
+                if sim < threshold:
+                    continue
+                time.sleep(.1)
+                return m
         logger.debug("image not found")
 
     def wait(self, imdata, timeout=30.0, threshold=0.9):
@@ -19,6 +19,10 @@ class Settings(object):
             "operation_delay_methods": ["click", "swipe"],
             "fallback_to_blank_screenshot": False,
             "max_depth": 50,
+            "screenshot_scale": 1.0,
+            "screenshot_quality": 80,
+            "screenshot_backend": "auto",
+            "hierarchy_max_age": 0.2,
         }
 
         self._deprecated_props = {
@@ -40,6 +44,9 @@ class Settings(object):
         
         self._set_methods = {
             "operation_delay": self.__set_operation_delay, 
+            "screenshot_scale": self.__set_screenshot_scale,
+            "screenshot_quality": self.__set_screenshot_quality,
+            "screenshot_backend": self.__set_screenshot_backend,
         }
 
         # self._get_methods = {
@@ -59,6 +66,21 @@ class Settings(object):
 
         self._defaults["operation_delay"] = (_pre, post)
 
+    def __set_screenshot_scale(self, value: float):
+        """ 截图缩放比例, 越小传输和解码越快 """
+        assert isinstance(value, (int, float)) and 0 < value <= 1, "screenshot_scale must be in (0, 1]"
+        self._defaults["screenshot_scale"] = float(value)
+
+    def __set_screenshot_quality(self, value: int):
+        """ 截图JPEG质量 """
+        assert isinstance(value, int) and 1 <= value <= 100, "screenshot_quality must be int in [1, 100]"
+        self._defaults["screenshot_quality"] = value
+
+    def __set_screenshot_backend(self, value: str):
+        """ auto: USB连接时使用raw, jsonrpc: 服务端JPEG, raw: adb screencap原始数据 """
+        assert value in ("auto", "jsonrpc", "raw"), "screenshot_backend must be one of auto, jsonrpc, raw"
+        self._defaults["screenshot_backend"] = value
+
     def get(self, key: str) -> Any:
         return self._defaults.get(key)
         
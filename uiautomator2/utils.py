@@ -4,6 +4,7 @@
 import contextlib
 import functools
 import inspect
+import io
 import pathlib
 import shlex
 import sys
@@ -292,3 +293,25 @@ def image_convert(im: Image.Image, format: str):
             raise
     raise ValueError("Unsupported format:", format)
 
+
+def image_decode(data: bytes, format: str = "pillow"):
+    """Decode JPEG/PNG bytes straight to the requested format
+
+    Returns:
+        PIL.Image.Image or np.ndarray (OpenCV BGR format)
+    """
+    if format == "pillow":
+        return Image.open(io.BytesIO(data))
+    if format == "opencv":
+        try:
+            import cv2
+            import numpy as np
+        except ImportError:
+            warnings.warn("missing lib: cv2 or numpy")
+            raise
+        im = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if im is None:
+            raise ValueError("unable to decode image")
+        return im
+    raise ValueError("Unsupported format:", format)
+
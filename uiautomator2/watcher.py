@@ -10,6 +10,7 @@ from collections import OrderedDict
 from typing import List, Optional
 
 import uiautomator2
+from uiautomator2._scheduler import BACKGROUND, rpc_priority
 from uiautomator2.utils import inject_call
 from uiautomator2.xpath import PageSource, XPathEntry, XPathSelector
 
@@ -110,10 +111,11 @@ class WatchContext:
 
     def _run_forever(self, interval: float):
         try:
-            while not self.__stop.is_set():
-                with self.__lock:
-                    self._run()
-                time.sleep(interval)
+            with rpc_priority(BACKGROUND):
+                while not self.__stop.is_set():
+                    with self.__lock:
+                        self._run()
+                    time.sleep(interval)
         finally:
             self.__stopped.set()
 
@@ -211,9 +213,10 @@ class Watcher():
     def _watch_forever(self, interval: float):
         try:
             wait_timeout = interval
-            while not self._watch_stopped.wait(timeout=wait_timeout):
-                triggered = self.run()
-                wait_timeout = min(0.5, interval) if triggered else interval
+            with rpc_priority(BACKGROUND):
+                while not self._watch_stopped.wait(timeout=wait_timeout):
+                    triggered = self.run()
+                    wait_timeout = min(0.5, interval) if triggered else interval
         finally:
             self._watch_stop_event.set()
 
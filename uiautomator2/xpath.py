@@ -7,6 +7,7 @@ import abc
 import copy
 import enum
 import functools
+import io
 import logging
 import re
 import time
@@ -15,6 +16,7 @@ from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 from lxml import etree
 from PIL import Image
 
+from uiautomator2 import _deadline
 from uiautomator2._proto import Direction
 from uiautomator2.abstract import AbstractXPathBasedDevice
 from uiautomator2.exceptions import XPathElementNotFoundError
@@ -140,24 +142,52 @@ class XPath(str):
         return source.find_elements(self)
     
 
+# utf-8 of U+200B-U+200F: Zero-Width Space, ZWNJ, ZWJ, Left-to-Right Mark, Right-to-Left Mark
+_ZERO_WIDTH_CHARS = re.compile(rb'\xe2\x80[\x8b-\x8f]')
+_BOM = "\ufeff".encode("utf-8")
+
+
+def strip_invisible_chars(data: bytes) -> bytes:
+    """ remove zero width chars, LRM, RLM and BOM from utf-8 data """
+    data = _ZERO_WIDTH_CHARS.sub(b"", data)
+    if _BOM in data:
+        data = data.replace(_BOM, b"")
+    return data
+
+
+@functools.lru_cache(maxsize=1024)
+def _node_tag(class_name: str) -> str:
+    return safe_xmlstr(class_name) or "node"
+
+
+def build_tree(data: bytes) -> etree._Element:
+    """ parse hierarchy xml, every <node class="a.b.C"> becomes <a.b.C> in the same pass """
+    elem = None
+    for _, elem in etree.iterparse(io.BytesIO(data), tag="node"):
+        elem.tag = _node_tag(elem.attrib.pop("class", ""))
+    if elem is None: # no node at all
+        return etree.fromstring(data)
+    return elem.getroottree().getroot()
+
+
 class PageSource:
-    def __init__(self, xml_content: str):
+    def __init__(self, xml_content: Union[str, bytes]):
         # Remove Left-to-Right Mark, BLM, Zero-Width Space, BOM etc Invisible chars
-        clean_xml_content = re.sub(r'[\u200B-\u200F\uFEFF]', '', xml_content)
-        self._xml_content = clean_xml_content
-    
+        self._xml_data = strip_invisible_chars(str2bytes(xml_content))
+
+    @property
+    def _xml_content(self) -> str:
+        return self._xml_data.decode("utf-8")
+
     @staticmethod
-    def parse(data: Union[str, "PageSource"]) -> "PageSource":
-        if isinstance(data, str):
+    def parse(data: Union[str, bytes, "PageSource"]) -> "PageSource":
+        if isinstance(data, (str, bytes)):
             return PageSource(data)
         return data
-    
+
     @functools.cached_property
     def root(self) -> etree._Element:
-        _root = etree.fromstring(str2bytes(self._xml_content))
-        for node in _root.xpath("//node"):
-            node.tag = safe_xmlstr(node.attrib.pop("class", "")) or "node"
-        return _root
+        return build_tree(self._xml_data)
 
     def find_elements(self, xpath: str) -> List["XMLElement"]:
         matches = self.root.xpath(xpath, namespaces={"re": "http://exslt.org/regular-expressions"})
@@ -474,14 +504,15 @@ class DeviceXPathSelector(XPathSelector):
         self._parent._d.send_keys(text)
 
     def wait(self, timeout=None) -> bool:
-        """ wait until element found """
-        deadline = time.time() + (timeout or self._global_timeout)
+        """ wait until element found, no longer than the remaining time of d.deadline() """
+        deadline = time.monotonic() + _deadline.bound(timeout or self._global_timeout)
         while True:
             if self.exists:
                 return True
-            if time.time() > deadline:
+            left = deadline - time.monotonic()
+            if left <= 0:
                 return False
-            time.sleep(0.2)
+            time.sleep(min(0.2, left))
 
     def match(self) -> Optional["DeviceXMLElement"]:
         """
@@ -499,12 +530,14 @@ class DeviceXPathSelector(XPathSelector):
         Returns:
             True if gone else False
         """
-        deadline = time.time() + (timeout or self._global_timeout)
-        while time.time() < deadline:
+        deadline = time.monotonic() + _deadline.bound(timeout or self._global_timeout)
+        while True:
             if not self.exists:
                 return True
-            time.sleep(0.2)
-        return False
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return False
+            time.sleep(min(0.2, left))
 
     def click_nowait(self):
         x, y = self.all()[0].center()
@@ -539,6 +572,10 @@ class DeviceXPathSelector(XPathSelector):
         """take element screenshot"""
         el = self.get()
         return el.screenshot()
+
+    def screenshots(self, format: str = "pillow", max_age: float = 0.0) -> list:
+        """screenshots of all matched elements, cropped from one capture, see Device.element_screenshots"""
+        return self._parent._d.element_screenshots(self.all(), format=format, max_age=max_age)
     
     def __getattr__(self, key: str):
         """